@@ -97,3 +97,88 @@ REST_FRAMEWORK = {
 # ML Models directory
 ML_MODELS_DIR = BASE_DIR / 'trained_models'
 ML_DATASETS_DIR = BASE_DIR / 'ml_api' / 'datasets' / 'data'
+
+# Maximum number of rows accepted by batch prediction endpoints
+ML_BATCH_MAX_ROWS = 10000
+
+# Largest batch evaluated by the compiled tree engine; it walks every tree to full depth,
+# so bigger batches are faster through sklearn's per-tree traversal
+ML_COMPILED_MAX_ROWS = 64
+
+# Maximum number of fitted ARIMA models kept in memory for inventory forecasts
+ML_ARIMA_CACHE_SIZE = 64
+
+# Incremental ARIMA updates: observations appended before a full refit, and
+# one-step error (as a multiple of the fitted MAE) that forces an early refit
+ML_ARIMA_MAX_APPENDED = 30
+ML_ARIMA_DRIFT_THRESHOLD = 1.5
+
+# Cached prediction outputs (repeated what-if payloads) and how long each one stays valid, in seconds
+ML_PREDICTION_CACHE_SIZE = 1024
+ML_PREDICTION_CACHE_TTL = 300
+
+# Micro-batching of concurrent single-row predictions (cost, duration, turnover):
+# a request waits up to MAX_WAIT_MS for others, or until MAX_SIZE rows are queued
+ML_MICRO_BATCHING = False
+ML_MICRO_BATCH_MAX_WAIT_MS = 2
+ML_MICRO_BATCH_MAX_SIZE = 32
+
+# Accepted forecast horizon, in days, of the inventory forecast endpoints
+ML_FORECAST_MIN_DAYS = 7
+ML_FORECAST_MAX_DAYS = 90
+
+# Maximum number of materials listed in one batch inventory forecast request
+ML_FORECAST_BATCH_MAX_MATERIALS = 500
+
+# Worker processes used to fit ARIMA models for batch inventory forecasts
+ML_FORECAST_MAX_WORKERS = os.cpu_count() or 1
+
+# Seconds clients are told to wait (Retry-After) while a model is still loading or training
+ML_BOOTSTRAP_RETRY_AFTER = 10
+
+# Niceness of the background retrain process, so training yields the CPU to requests
+ML_RETRAIN_NICENESS = 10
+
+# Worker processes used to train the independent models in parallel (1 trains them in-process)
+ML_TRAINING_MAX_WORKERS = os.cpu_count() or 1
+
+# Duration model engine: 'gradient_boosting' (exact splits, fine for small data) or
+# 'hist_gradient_boosting' (binned, multithreaded, early stopping; for large histories)
+ML_DURATION_ENGINE = 'gradient_boosting'
+
+# Customer segmentation engine: 'kmeans' (full batch, in memory) or 'minibatch_kmeans'
+# (partial_fit over chunks of ML_SEGMENTATION_CHUNK_ROWS customers read from disk; the
+# per-customer assignments are saved with the model and new customers assigned on their own)
+ML_SEGMENTATION_ENGINE = 'kmeans'
+ML_SEGMENTATION_CHUNK_ROWS = 10000
+
+# Optional hyperparameter search before training: random candidates (the defaults included)
+# scored with k-fold CV in a process pool. HALVING_FACTOR > 1 keeps the best 1/factor after
+# each fold (successive halving; 1 scores every candidate on every fold). Nothing new starts
+# after BUDGET_SECONDS, and fold scores cached under trained_models/tuning let a cut-short search resume
+ML_TUNING_ENABLED = False
+ML_TUNING_CANDIDATES = 20
+ML_TUNING_FOLDS = 5
+ML_TUNING_HALVING_FACTOR = 3
+ML_TUNING_BUDGET_SECONDS = 3600
+ML_TUNING_MAX_WORKERS = os.cpu_count() or 1
+
+# Incremental retrains (mode 'incremental') warm-start the cost forest and the duration
+# boosting model on appended project rows; they are rebuilt instead after MAX_ROUNDS
+# updates, when new rows exceed MAX_NEW_FRACTION of the trained ones, or when the MAE
+# on the new rows exceeds DRIFT_THRESHOLD times the holdout MAE of the last full rebuild
+ML_INCREMENTAL_MAX_ROUNDS = 7
+ML_INCREMENTAL_MAX_NEW_FRACTION = 0.5
+ML_INCREMENTAL_DRIFT_THRESHOLD = 1.5
+
+# Model version directories kept under trained_models/versions (the active and previous ones are always kept)
+ML_MODEL_VERSIONS_KEEP = 5
+
+# Seconds between checks for a model version published by another worker (0 disables)
+ML_MODEL_RELOAD_INTERVAL = 2
+
+# Seconds a model version stays on disk after it was last active, so workers that have not seen the new CURRENT yet can still load it
+ML_MODEL_PRUNE_GRACE_SECONDS = 300
+
+# Seconds a replaced model version waits for its in-flight requests before it is released anyway
+ML_MODEL_RETIRE_TIMEOUT = 60
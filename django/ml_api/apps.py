@@ -7,7 +7,7 @@ class MlApiConfig(AppConfig):
     verbose_name = 'ML Analytics API'
 
     def ready(self):
-        # Initialize ML models when app is ready
+        # Load (or train) ML models in the background so startup never blocks
         from ml_api.services.ml_trainer import MLTrainer
         trainer = MLTrainer()
-        trainer.initialize_models()
+        trainer.start_bootstrap()
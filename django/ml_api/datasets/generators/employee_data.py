@@ -6,6 +6,8 @@ import numpy as np
 import pandas as pd
 from typing import Optional
 
+from ml_api.services.feature_schema import TURNOVER_SCHEMA
+
 
 class EmployeeDataGenerator:
     """Generates synthetic employee data for Logistic Regression turnover prediction."""
@@ -201,12 +203,8 @@ class EmployeeDataGenerator:
 
     def get_feature_names(self) -> list:
         """Return feature names for ML model."""
-        return [
-            'tenure_months', 'age', 'salary_level', 'department',
-            'performance_score', 'overtime_hours_monthly', 'distance_from_home_km',
-            'num_promotions', 'training_hours_yearly', 'satisfaction_score',
-            'num_projects_assigned'
-        ]
+        # Declared once in the model's feature schema, in training order
+        return list(TURNOVER_SCHEMA.names)
 
     def get_feature_labels(self) -> dict:
         """Return human-readable labels for features."""
@@ -6,6 +6,8 @@ import numpy as np
 import pandas as pd
 from typing import Optional
 
+from ml_api.services.feature_schema import PROJECT_COST_SCHEMA
+
 
 class ProjectDataGenerator:
     """Generates synthetic project data for Random Forest and Gradient Boosting models."""
@@ -167,7 +169,7 @@ class ProjectDataGenerator:
                      basement_add + pool_add)
 
             # Add realistic noise (12% standard deviation)
-            noise = np.random.normal(0, total * 0.12)
+            noise = np.random.normal(0, abs(total) * 0.12)
             costs[i] = max(total + noise, row['area_m2'] * 1000)  # Minimum cost floor
 
         return costs.round(2)
@@ -221,19 +223,17 @@ class ProjectDataGenerator:
                      type_factor * complexity_factor * team_efficiency *
                      exp_factor * quality_factor * delay_factor * season_delay)
 
-            # Add realistic noise (15% standard deviation)
-            noise = np.random.normal(0, total * 0.15)
+            # Add realistic noise (15% standard deviation); very tall
+            # buildings can give a negative total before the 30-day floor
+            noise = np.random.normal(0, abs(total) * 0.15)
             durations[i] = max(total + noise, 30)  # Minimum 30 days
 
         return durations.round(0).astype(int)
 
     def get_feature_names(self) -> list:
         """Return list of feature names for ML models."""
-        return [
-            'project_type_id', 'area_m2', 'num_floors', 'location_zone',
-            'complexity_score', 'material_quality', 'has_basement', 'has_pool',
-            'season_start', 'team_size', 'manager_experience_years'
-        ]
+        # Declared once in the model's feature schema, in training order
+        return list(PROJECT_COST_SCHEMA.names)
 
     def get_feature_labels(self) -> dict:
         """Return human-readable labels for features."""
@@ -0,0 +1,234 @@
+"""
+Benchmark ML - Times the serving and training paths of the ML models.
+
+Suites:
+    trees            Compiled flat-array engine against sklearn per batch size
+                     (the routing behind ML_COMPILED_MAX_ROWS).
+    micro-batching   Throughput and latency of concurrent single-row
+                     predictions, with micro-batching off and at several
+                     max waits.
+    duration-engine  Fit time, R2 and predict latency of the duration model
+                     engines at several history sizes.
+
+Usage:
+    python manage.py benchmark_ml trees --batch-sizes 1 64 128 1000 10000
+    python manage.py benchmark_ml micro-batching --concurrency 1 16 32 --wait-ms 1 5
+    python manage.py benchmark_ml duration-engine --train-rows 500 50000
+
+The trees and duration-engine suites train throwaway models in memory on
+generated projects; micro-batching uses the active model version with the
+prediction cache disabled. Nothing is written to disk.
+"""
+import statistics
+import threading
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from ml_api.datasets.generators.project_data import ProjectDataGenerator
+from ml_api.services.compiled_trees import CompiledTreeEnsemble, sklearn_tree_predictions
+from ml_api.services.feature_schema import PROJECT_COST_SCHEMA, PROJECT_DURATION_SCHEMA, TURNOVER_SCHEMA
+from ml_api.services.micro_batching import MicroBatcher
+from ml_api.services.ml_trainer import MLTrainer
+from ml_api.services.prediction_cache import PredictionCache
+from ml_api.services.training import (
+    DURATION_ENGINES, build_project_cost_model, build_project_duration_model, training_data
+)
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Return the median milliseconds of fn over repeat calls, after one warm-up call."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the ML serving and training paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['trees', 'micro-batching', 'duration-engine'])
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64, 128, 1000, 10000],
+                            help='Rows per call (trees)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Timed calls per measurement (trees, duration-engine)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 32],
+                            help='Concurrent callers (micro-batching)')
+        parser.add_argument('--wait-ms', type=float, nargs='+', default=[1, 5],
+                            help='Micro-batch max waits to compare with batching off (micro-batching)')
+        parser.add_argument('--max-batch', type=int, default=settings.ML_MICRO_BATCH_MAX_SIZE,
+                            help='Micro-batch max size (micro-batching)')
+        parser.add_argument('--seconds', type=float, default=2.0,
+                            help='Duration of each run (micro-batching)')
+        parser.add_argument('--train-rows', type=int, nargs='+', default=[500, 50000],
+                            help='Generated projects to train on (duration-engine)')
+        parser.add_argument('--n-jobs', type=int, default=1,
+                            help='Training threads (duration-engine)')
+
+    def handle(self, *args, **options):
+        suite = options['suite']
+        if suite == 'trees':
+            self.benchmark_trees(options)
+        elif suite == 'micro-batching':
+            self.benchmark_micro_batching(options)
+        else:
+            self.benchmark_duration_engines(options)
+
+    def benchmark_trees(self, options):
+        """Per-call latency of the compiled engine and sklearn for each batch size."""
+        names = ProjectDataGenerator().get_feature_names()
+        data = ProjectDataGenerator(seed=42).generate(500)
+        X_cost, y_cost = training_data('rf_project_cost', data, names)
+        X_duration, y_duration = training_data('gb_project_duration', data, names)
+        forest = build_project_cost_model(names).fit(X_cost.to_numpy(np.float64), y_cost)
+        boosting = build_project_duration_model(names).fit(X_duration.to_numpy(np.float64), y_duration)
+        compiled_forest = CompiledTreeEnsemble.from_sklearn(forest)
+        compiled_boosting = CompiledTreeEnsemble.from_sklearn(boosting)
+
+        rng = np.random.default_rng(0)
+        rows = X_cost.to_numpy(np.float64)
+        self.stdout.write(
+            f"ms per call, {forest.n_estimators}-tree models; "
+            f"batches up to ML_COMPILED_MAX_ROWS={settings.ML_COMPILED_MAX_ROWS} are served compiled"
+        )
+        self.stdout.write(f"{'rows':>7} {'RF compiled':>12} {'RF sklearn':>11} {'GB compiled':>12} {'GB sklearn':>11}")
+        for size in options['batch_sizes']:
+            X = rows[rng.integers(0, len(rows), size)]
+            timings = [
+                time_call(lambda: compiled_forest.tree_predictions(X), options['repeat']),
+                time_call(lambda: sklearn_tree_predictions(forest, X), options['repeat']),
+                time_call(lambda: compiled_boosting.predict(X), options['repeat']),
+                time_call(lambda: boosting.predict(X), options['repeat']),
+            ]
+            self.stdout.write(f"{size:>7} " + ' '.join(
+                f"{timing:>{width}.2f}" for timing, width in zip(timings, (12, 11, 12, 11))
+            ))
+
+    def benchmark_micro_batching(self, options):
+        """Throughput and latency of concurrent single-row predictions."""
+        trainer = MLTrainer()
+        if not trainer.wait_for_bootstrap(timeout=600):
+            raise CommandError('The models did not finish loading')
+
+        datasets = trainer._datasets
+        requests = {
+            'cost': (trainer.predict_project_cost,
+                     datasets.get('projects')[PROJECT_COST_SCHEMA.names].to_dict('records')),
+            'duration': (trainer.predict_project_duration,
+                         datasets.get('projects')[PROJECT_DURATION_SCHEMA.names].to_dict('records')),
+            'turnover': (trainer.predict_employee_turnover,
+                         datasets.get('employees')[TURNOVER_SCHEMA.names].to_dict('records')),
+        }
+        modes = [None] + options['wait_ms']
+
+        saved = MLTrainer._micro_batchers, MLTrainer._prediction_cache
+        # Every request must reach the models, not the cache
+        MLTrainer._prediction_cache = PredictionCache(max_size=0)
+        try:
+            self.stdout.write(
+                f"req/s and p50/p99 ms per request, max batch {options['max_batch']}, "
+                f"{options['seconds']}s per run"
+            )
+            header = ' '.join(f"{'off' if wait is None else f'wait {wait:g}ms':>24}" for wait in modes)
+            self.stdout.write(f"{'model':<9} {'conc':>4} {header}")
+            for label, (predict, payloads) in requests.items():
+                for concurrency in options['concurrency']:
+                    cells = []
+                    for wait in modes:
+                        MLTrainer._micro_batchers = {} if wait is None else {
+                            name: MicroBatcher(
+                                lambda items, name=name: trainer._run_micro_batch(name, items),
+                                max_batch=options['max_batch'],
+                                max_wait=wait / 1000,
+                            )
+                            for name in ('rf_project_cost', 'gb_project_duration', 'lr_turnover')
+                        }
+                        result = self.run_concurrently(predict, payloads, concurrency, options['seconds'])
+                        cells.append(
+                            f"{result['throughput']:>8.0f} {result['p50']:>6.2f}/{result['p99']:.2f}"
+                        )
+                    self.stdout.write(f"{label:<9} {concurrency:>4} " + ' '.join(f"{cell:>24}" for cell in cells))
+        finally:
+            MLTrainer._micro_batchers, MLTrainer._prediction_cache = saved
+
+    def run_concurrently(self, predict: Callable[[Dict], Dict], payloads: List[Dict],
+                         concurrency: int, seconds: float) -> Dict[str, float]:
+        """Call predict from concurrent threads for a while; return req/s, p50 and p99."""
+        latencies: List[List[float]] = [[] for _ in range(concurrency)]
+        started = threading.Barrier(concurrency + 1)
+        stop = threading.Event()
+
+        def worker(index: int):
+            started.wait()
+            i = index
+            while not stop.is_set():
+                start = time.perf_counter()
+                predict(payloads[i % len(payloads)])
+                latencies[index].append((time.perf_counter() - start) * 1000)
+                i += concurrency
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        start = time.perf_counter()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        merged = np.concatenate([np.array(values) for values in latencies])
+        return {
+            'throughput': len(merged) / elapsed,
+            'p50': float(np.percentile(merged, 50)),
+            'p99': float(np.percentile(merged, 99)),
+        }
+
+    def benchmark_duration_engines(self, options):
+        """Fit time, R2 and serving latency of each duration engine per history size."""
+        names = ProjectDataGenerator().get_feature_names()
+        self.stdout.write(
+            f"generated projects, 20% test split, {options['n_jobs']} training thread(s); "
+            f"predict latency follows the serving path"
+        )
+        self.stdout.write(f"{'rows':>8} {'engine':<23} {'fit s':>8} {'R2':>7} {'1 row ms':>9} {'1000 rows ms':>13}")
+        for n_rows in options['train_rows']:
+            data = ProjectDataGenerator(seed=42).generate(n_rows)
+            X, y = training_data('gb_project_duration', data, names)
+            X_train, X_test, y_train, y_test = train_test_split(
+                X.to_numpy(np.float64), y, test_size=0.2, random_state=42
+            )
+            rng = np.random.default_rng(0)
+            batch = X_test[rng.integers(0, len(X_test), 1000)]
+
+            for engine in DURATION_ENGINES:
+                model = build_project_duration_model(names, options['n_jobs'], engine=engine)
+                start = time.perf_counter()
+                model.fit(X_train, y_train)
+                fit_seconds = time.perf_counter() - start
+
+                # Same routing as MLTrainer._evaluate: the histogram model is
+                # never compiled, the exact one only up to ML_COMPILED_MAX_ROWS
+                compiled = (CompiledTreeEnsemble.from_sklearn(model)
+                            if engine == 'gradient_boosting' else None)
+
+                def serve(X_batch):
+                    if compiled is not None and len(X_batch) <= settings.ML_COMPILED_MAX_ROWS:
+                        return compiled.predict(X_batch)
+                    return model.predict(X_batch)
+
+                self.stdout.write(
+                    f"{n_rows:>8} {engine:<23} {fit_seconds:>8.1f} {r2_score(y_test, model.predict(X_test)):>7.4f} "
+                    f"{time_call(lambda: serve(batch[:1]), options['repeat']):>9.2f} "
+                    f"{time_call(lambda: serve(batch), options['repeat']):>13.2f}"
+                )
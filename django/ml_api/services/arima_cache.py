@@ -0,0 +1,117 @@
+"""
+ARIMA Cache Service - Keeps fitted ARIMA results between forecast requests.
+
+A fit depends only on a material's demand history and the model order, so
+results are keyed by (material_id, history fingerprint, order) and reused
+until the history changes or the entry is evicted. When the history only
+grows, the latest fit of the material can be extended instead of refitted.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class ARIMACache:
+    """Bounded, thread-safe LRU cache of fitted ARIMA models."""
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Hashable, Dict[str, Any]]' = OrderedDict()
+        # (material_id, order) -> key of the most recently stored fit
+        self._latest: Dict[Tuple, Hashable] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def fingerprint(series: np.ndarray) -> str:
+        """Return a content hash of a demand series."""
+        data = np.ascontiguousarray(series, dtype=np.float64)
+        return hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+
+    @classmethod
+    def make_key(cls, material_id: int, series: np.ndarray,
+                 order: Tuple[int, int, int]) -> Tuple:
+        """Build the cache key for a material's series and model order."""
+        return (int(material_id), cls.fingerprint(series), tuple(order))
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, marking it most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def latest(self, material_id: int, order: Tuple[int, int, int]) -> Optional[Tuple[Tuple, Dict[str, Any]]]:
+        """Return (key, entry) of the last fit stored for a material, if any."""
+        with self._lock:
+            key = self._latest.get((int(material_id), tuple(order)))
+            if key is None or key not in self._entries:
+                return None
+            return key, self._entries[key]
+
+    def put(self, key: Tuple, entry: Dict[str, Any]):
+        """Store an entry, evicting the least recently used beyond max_size."""
+        material_id, _, order = key
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._latest[(material_id, order)] = key
+            while len(self._entries) > self.max_size:
+                evicted_key, _ = self._entries.popitem(last=False)
+                if self._latest.get((evicted_key[0], evicted_key[2])) == evicted_key:
+                    del self._latest[(evicted_key[0], evicted_key[2])]
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached fit."""
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ARIMARefitPolicy:
+    """Decides when an incrementally updated ARIMA needs full re-estimation."""
+
+    def __init__(self, max_appended: int = 30, drift_threshold: float = 1.5):
+        """
+        Args:
+            max_appended: Observations appended since the last full fit
+                before parameters are re-estimated.
+            drift_threshold: Refit when the mean absolute one-step error on
+                appended observations exceeds this multiple of the MAE
+                measured at the last full fit.
+        """
+        self.max_appended = max_appended
+        self.drift_threshold = drift_threshold
+
+    def needs_refit(self, entry: Dict[str, Any]) -> bool:
+        """Return True if the appended observations warrant a full refit."""
+        appended = entry['appended']
+        if appended == 0:
+            return False
+        if appended >= self.max_appended:
+            return True
+
+        new_residuals = np.asarray(entry['fitted'].resid)[-appended:]
+        drift = np.mean(np.abs(new_residuals)) / max(entry['base_mae'], 1e-9)
+        return drift > self.drift_threshold
@@ -0,0 +1,217 @@
+"""
+Compiled Trees Service - Flat-array inference engine for tree ensembles.
+
+Every tree of a fitted Random Forest or Gradient Boosting model is flattened
+into contiguous NumPy arrays (feature, threshold, children, value) and all
+rows are pushed through all trees together, one tree level per step. The
+arrays can be saved uncompressed and memory-mapped back, so every worker
+process shares one read-only copy of them.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+
+
+def sklearn_tree_predictions(model: RandomForestRegressor, X: np.ndarray) -> np.ndarray:
+    """
+    Evaluate every tree of a fitted forest through sklearn's own traversal.
+
+    Each row stops at its leaf, so large batches are faster this way than
+    through the compiled engine, which takes max_depth steps for every row.
+    The output is identical to CompiledTreeEnsemble.tree_predictions.
+
+    Returns:
+        Array of shape (n_trees, n_rows) with each tree's leaf value.
+    """
+    # Trees compare float32 features, exactly as estimator.predict does
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    tree_predictions = np.empty((len(model.estimators_), X.shape[0]), dtype=np.float64)
+    for i, estimator in enumerate(model.estimators_):
+        tree = estimator.tree_
+        tree_predictions[i] = tree.value[tree.apply(X), 0, 0]
+    return tree_predictions
+
+
+class CompiledTreeEnsemble:
+    """Tree ensemble compiled into flat arrays for batched inference."""
+
+    # Rows evaluated per block; keeps the (trees x rows) working set in cache
+    BLOCK_SIZE = 1024
+
+    # Blocks are independent and NumPy releases the GIL, so they run in threads
+    _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+    # Array attributes stored by to_dict(); everything else is a scalar
+    ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+    def __init__(
+        self, kind: str, feature: np.ndarray, threshold: np.ndarray,
+        children: np.ndarray, value: np.ndarray, roots: np.ndarray,
+        max_depth: int, n_features: int,
+        learning_rate: float = 1.0, baseline: float = 0.0
+    ):
+        """
+        Args:
+            children: Child node ids interleaved as [left, right] per node,
+                so one gather at 2 * node + go_right picks the branch.
+
+        Arrays are used as given (no copy), so memory-mapped arrays stay
+        memory-mapped.
+        """
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.learning_rate = float(learning_rate)
+        self.baseline = float(baseline)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_random_forest(cls, model: RandomForestRegressor) -> 'CompiledTreeEnsemble':
+        """Compile a fitted RandomForestRegressor."""
+        return cls._compile('random_forest', list(model.estimators_), model.n_features_in_)
+
+    @classmethod
+    def from_gradient_boosting(cls, model: GradientBoostingRegressor) -> 'CompiledTreeEnsemble':
+        """Compile a fitted GradientBoostingRegressor (single-output loss)."""
+        if model.init_ == 'zero':
+            baseline = 0.0
+        else:
+            baseline = model.init_.predict(np.zeros((1, model.n_features_in_)))[0]
+        return cls._compile(
+            'gradient_boosting', list(model.estimators_[:, 0]), model.n_features_in_,
+            learning_rate=model.learning_rate, baseline=baseline
+        )
+
+    @classmethod
+    def from_sklearn(cls, model: Any) -> 'CompiledTreeEnsemble':
+        """Compile any supported sklearn tree ensemble."""
+        if isinstance(model, RandomForestRegressor):
+            return cls.from_random_forest(model)
+        if isinstance(model, GradientBoostingRegressor):
+            return cls.from_gradient_boosting(model)
+        raise TypeError(f"Cannot compile model of type {type(model).__name__}")
+
+    @classmethod
+    def _compile(cls, kind: str, estimators: List, n_features: int, **kwargs) -> 'CompiledTreeEnsemble':
+        """Concatenate the nodes of all trees into shared flat arrays."""
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in estimators:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(offset, offset + n_nodes, dtype=np.intp)
+            is_leaf = tree.children_left < 0
+
+            # Leaves point to themselves so extra traversal steps are no-ops
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            left = np.where(is_leaf, node_ids, tree.children_left + offset)
+            right = np.where(is_leaf, node_ids, tree.children_right + offset)
+            children.append(np.column_stack([left, right]).ravel())
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            kind,
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            n_features=n_features,
+            **kwargs
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the arrays and parameters needed to rebuild the ensemble."""
+        state = {name: getattr(self, name) for name in self.ARRAYS}
+        state.update({
+            'kind': self.kind,
+            'max_depth': self.max_depth,
+            'n_features': self.n_features,
+            'learning_rate': self.learning_rate,
+            'baseline': self.baseline,
+        })
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'CompiledTreeEnsemble':
+        """Rebuild an ensemble from to_dict() output, keeping its arrays as-is."""
+        return cls(**state)
+
+    def tree_predictions(self, X: np.ndarray) -> np.ndarray:
+        """
+        Evaluate every tree on every row.
+
+        Returns:
+            Array of shape (n_trees, n_rows) with each tree's leaf value.
+        """
+        X = self._prepare(X)
+        n_rows = X.shape[0]
+        result = np.empty((self.n_trees, n_rows), dtype=np.float64)
+
+        def evaluate_block(start: int):
+            stop = min(start + self.BLOCK_SIZE, n_rows)
+            result[:, start:stop] = self.value.take(self._leaves(X[start:stop]))
+
+        starts = range(0, n_rows, self.BLOCK_SIZE)
+        if len(starts) == 1:
+            evaluate_block(0)
+        else:
+            list(self._executor.map(evaluate_block, starts))
+        return result
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict with the ensemble's own aggregation rule."""
+        tree_predictions = self.tree_predictions(X)
+        if self.kind == 'random_forest':
+            return tree_predictions.mean(axis=0)
+
+        # cumsum adds the stages strictly in order, as sklearn's predict_stages does
+        stages = np.empty((self.n_trees + 1, tree_predictions.shape[1]), dtype=np.float64)
+        stages[0] = self.baseline
+        np.multiply(tree_predictions, self.learning_rate, out=stages[1:])
+        return np.cumsum(stages, axis=0)[-1]
+
+    def _prepare(self, X: np.ndarray) -> np.ndarray:
+        """Round features through float32, matching sklearn tree inputs."""
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"Expected {self.n_features} features, got array of shape {X.shape}"
+            )
+        return np.ascontiguousarray(X, dtype=np.float32).astype(np.float64)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Return the leaf node reached by each (tree, row) pair."""
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = np.tile(np.arange(n_rows, dtype=np.intp) * self.n_features, self.n_trees)
+
+        # One entry per (tree, row) pair, tree-major
+        nodes = np.repeat(self.roots, n_rows)
+        for _ in range(self.max_depth):
+            columns = self.feature.take(nodes)
+            columns += row_offsets
+            go_right = flat_X.take(columns) > self.threshold.take(nodes)
+            nodes *= 2
+            nodes += go_right
+            nodes = self.children.take(nodes)
+        return nodes.reshape(self.n_trees, n_rows)
@@ -0,0 +1,214 @@
+"""
+Dataset Store Service - Keeps parsed CSV datasets in memory.
+
+Each dataset is parsed once (dates as datetime64) and shared by every caller.
+A cheap stat() on each access detects new files; the data is only parsed
+again when the file content actually changed. The inventory history is also
+kept partitioned by material so one material's series is an O(1) slice.
+"""
+import hashlib
+import io
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from ml_api.services.model_store import atomic_write
+
+
+class DatasetStore:
+    """In-memory, change-aware cache of the ML datasets."""
+
+    DATASETS = {
+        'projects': {'file': 'projects.csv', 'parse_dates': []},
+        'customers': {'file': 'customers.csv', 'parse_dates': []},
+        'employees': {'file': 'employees.csv', 'parse_dates': []},
+        'inventory_history': {'file': 'inventory_history.csv', 'parse_dates': ['date']},
+    }
+
+    def __init__(self, datasets_dir: Optional[Path] = None):
+        """
+        Args:
+            datasets_dir: Directory holding the CSV files. Defaults to
+                settings.ML_DATASETS_DIR, resolved on every access.
+        """
+        self._datasets_dir = datasets_dir
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> pd.DataFrame:
+        """
+        Return the parsed dataset.
+
+        The returned DataFrame is shared between callers and must be treated
+        as read-only; use .copy() or .assign() before adding columns.
+        """
+        return self._entry(name)['data']
+
+    def inventory_index(self) -> 'InventoryIndex':
+        """Return the inventory history partitioned by material."""
+        entry = self._entry('inventory_history')
+        index = entry.get('index')
+        if index is None:
+            # Built once per loaded file; a concurrent duplicate build is harmless
+            index = InventoryIndex(entry['data'])
+            entry['index'] = index
+        return index
+
+    def available(self) -> bool:
+        """Return True if every dataset file exists."""
+        return all(self._path(name).exists() for name in self.DATASETS)
+
+    def write(self, name: str, data: pd.DataFrame) -> bool:
+        """
+        Save a dataset as CSV unless the file already holds the same content.
+
+        Returns True if the file changed. An unchanged file is not touched,
+        so nothing derived from it has to be rebuilt. The file is replaced
+        atomically: readers never see a partly written CSV.
+        """
+        path = self._path(name)
+        content = data.to_csv(index=False).encode()
+        if path.exists() and path.read_bytes() == content:
+            return False
+
+        atomic_write(path, lambda tmp_path: tmp_path.write_bytes(content))
+        return True
+
+    def path(self, name: str) -> Path:
+        """Return the file a dataset is stored in."""
+        return self._path(name)
+
+    def file_signature(self, name: str) -> Tuple[int, int]:
+        """
+        Return the size and modification time of a dataset's file.
+
+        One stat(): unlike fingerprint() nothing is read, and it changes
+        whenever the file is rewritten or appended to.
+        """
+        stat = self._path(name).stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def fingerprint(self, name: str) -> str:
+        """Return the content hash of the dataset currently loaded."""
+        return self._entry(name)['fingerprint']
+
+    def invalidate(self, name: Optional[str] = None):
+        """Forget one dataset (or all of them) so the next access reloads."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def _path(self, name: str) -> Path:
+        datasets_dir = self._datasets_dir or settings.ML_DATASETS_DIR
+        return Path(datasets_dir) / self.DATASETS[name]['file']
+
+    def _entry(self, name: str) -> Dict[str, Any]:
+        """Return the cache entry for name, reloading it if the file changed."""
+        path = self._path(name)
+        stat = path.stat()
+        signature = (str(path), stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(name)
+        if entry is not None and entry['signature'] == signature:
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry['signature'] == signature:
+                return entry
+
+            content = path.read_bytes()
+            fingerprint = hashlib.blake2b(content, digest_size=16).hexdigest()
+
+            # Touched or rewritten with identical bytes: keep the parsed data
+            if entry is not None and entry['fingerprint'] == fingerprint:
+                entry['signature'] = signature
+            else:
+                data = pd.read_csv(
+                    io.BytesIO(content), parse_dates=self.DATASETS[name]['parse_dates']
+                )
+                entry = {'data': data, 'fingerprint': fingerprint, 'signature': signature}
+
+            self._entries[name] = entry
+            return entry
+
+
+class InventoryIndex:
+    """
+    Inventory history sorted by (material_id, date) and partitioned by material.
+
+    Each column is a contiguous array and every material owns one contiguous
+    range of it, so fetching a material's history is a slice (a view, not a
+    copy) instead of a scan and sort of the whole table.
+    """
+
+    COLUMNS = [
+        'date', 'material_name', 'daily_demand', 'stock_level',
+        'reorder_point', 'lead_time_days', 'unit_cost',
+    ]
+
+    def __init__(self, data: pd.DataFrame):
+        self.frame = data.sort_values(['material_id', 'date'], kind='stable').reset_index(drop=True)
+        self.columns: Dict[str, np.ndarray] = {
+            column: np.ascontiguousarray(self.frame[column].to_numpy())
+            for column in self.COLUMNS
+        }
+
+        material_ids = self.frame['material_id'].to_numpy()
+        ids, offsets, lengths = np.unique(material_ids, return_index=True, return_counts=True)
+        self.ids = ids
+        self.starts = offsets.astype(np.intp)
+        self.lengths = lengths.astype(np.intp)
+        self.offsets: Dict[int, Tuple[int, int]] = {
+            int(material_id): (int(offset), int(length))
+            for material_id, offset, length in zip(ids, offsets, lengths)
+        }
+
+    def __contains__(self, material_id: int) -> bool:
+        return int(material_id) in self.offsets
+
+    def material_ids(self) -> List[int]:
+        """Return all material ids in ascending order."""
+        return list(self.offsets)
+
+    def slice(self, material_id: int) -> slice:
+        """Return the row range of a material in the sorted history."""
+        offset, length = self.offsets[int(material_id)]
+        return slice(offset, offset + length)
+
+    def series(self, material_id: int, column: str = 'daily_demand') -> np.ndarray:
+        """Return a material's values for one column, oldest first (a view)."""
+        return self.columns[column][self.slice(material_id)]
+
+    def history(self, material_id: int) -> pd.DataFrame:
+        """Return a material's rows of the sorted history as a DataFrame."""
+        return self.frame.iloc[self.slice(material_id)]
+
+    def last(self, column: str) -> np.ndarray:
+        """Return each material's most recent value of a column, in ids order."""
+        return self.columns[column][self.starts + self.lengths - 1]
+
+    def mean(self, column: str) -> np.ndarray:
+        """
+        Return each material's mean of a column, in ids order.
+
+        Sums use NumPy's pairwise summation per material, exactly like
+        Series.mean() on that material's rows (np.add.reduceat sums
+        sequentially and can differ in the last bit).
+        """
+        values = self.columns[column]
+        if len(self.lengths) and (self.lengths == self.lengths[0]).all():
+            # Equal-length histories: one row-wise reduction over a 2-D view
+            sums = values.reshape(len(self.lengths), self.lengths[0]).sum(axis=1)
+        else:
+            sums = np.array([
+                np.add.reduce(values[start:start + length])
+                for start, length in zip(self.starts, self.lengths)
+            ], dtype=np.float64)
+        return sums / self.lengths
@@ -0,0 +1,160 @@
+"""
+Feature Schema Service - Declarative input schemas for the prediction models.
+
+Each model declares its features once, in training column order, with the
+type each value is coerced to and an optional default. The dataset
+generators take their feature names from these schemas, and the views and
+MLTrainer validate payloads with them, so the field lists are no longer
+repeated. A schema turns a payload (or a list of payloads) straight into a
+contiguous float64 array without going through pandas.
+"""
+import math
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+REQUIRED = object()
+
+
+class Feature(NamedTuple):
+    """One model input: its name, the type it is coerced to and its default."""
+    name: str
+    dtype: Callable[[Any], Any] = float
+    default: Any = REQUIRED
+
+
+class SchemaError(ValueError):
+    """A payload does not match the schema; the message is user facing."""
+
+    def __init__(self, message: str, field: Optional[str] = None,
+                 errors: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        self.field = field
+        self.errors = errors or []
+
+
+class FeatureSchema:
+    """Validates payloads and converts them to feature arrays in training order."""
+
+    def __init__(self, features: Sequence[Feature]):
+        self.features = tuple(features)
+        self.names = [feature.name for feature in self.features]
+        # Compiled once: the converter of each field (None: plain float)
+        self._fields: Tuple[Tuple[str, Optional[Callable], Any], ...] = tuple(
+            (feature.name, None if feature.dtype is float else feature.dtype, feature.default)
+            for feature in self.features
+        )
+        self._plain = all(converter is None and default is REQUIRED
+                          for _, converter, default in self._fields)
+
+    def row(self, payload: Mapping[str, Any]) -> List[float]:
+        """
+        Return a payload's feature values as floats, in training order.
+
+        Missing fields take their default; values go through the field's
+        type first (int truncates, bool tests truthiness). The payload is
+        not modified.
+
+        Raises:
+            SchemaError: For a missing required field or an invalid value,
+                including NaN, infinite and out-of-range numbers.
+        """
+        if not isinstance(payload, Mapping):
+            raise SchemaError('Registro invalido')
+
+        values = []
+        for name, converter, default in self._fields:
+            value = payload.get(name, default)
+            if value is REQUIRED:
+                raise SchemaError(f'Campo requerido: {name}', field=name)
+            try:
+                value = float(value if converter is None else converter(value))
+            except (TypeError, ValueError, OverflowError):
+                raise SchemaError(f'Valor invalido: {name}', field=name)
+            if not math.isfinite(value):
+                raise SchemaError(f'Valor invalido: {name}', field=name)
+            values.append(value)
+        return values
+
+    def to_array(self, payload: Mapping[str, Any]) -> np.ndarray:
+        """Return one payload as a (1, n_features) float64 array."""
+        return np.array([self.row(payload)], dtype=np.float64)
+
+    def to_matrix(self, payloads: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """
+        Return many payloads as an (n_rows, n_features) float64 array.
+
+        Schemas of plain required floats convert whole columns at once;
+        only when that fails are rows checked one by one to report them.
+
+        Raises:
+            SchemaError: Listing every invalid row in .errors as
+                {'index', 'error'}.
+        """
+        if self._plain:
+            try:
+                X = np.empty((len(payloads), len(self.names)), dtype=np.float64)
+                for column, name in enumerate(self.names):
+                    X[:, column] = [payload[name] for payload in payloads]
+                # NumPy turns None into NaN where float() would reject it,
+                # and accepts "nan" and "inf"; row() reports those
+                if np.isfinite(X).all():
+                    return X
+            except (KeyError, TypeError, ValueError, OverflowError):
+                pass
+
+        rows = []
+        errors = []
+        for index, payload in enumerate(payloads):
+            try:
+                rows.append(self.row(payload))
+            except SchemaError as e:
+                errors.append({'index': index, 'error': str(e)})
+        if errors:
+            raise SchemaError('Lote invalido', errors=errors)
+        return np.array(rows, dtype=np.float64).reshape(len(payloads), len(self.names))
+
+
+# Project cost: every field is required and used as given
+PROJECT_COST_SCHEMA = FeatureSchema([
+    Feature('project_type_id'),
+    Feature('area_m2'),
+    Feature('num_floors'),
+    Feature('location_zone'),
+    Feature('complexity_score'),
+    Feature('material_quality'),
+    Feature('has_basement'),
+    Feature('has_pool'),
+    Feature('season_start'),
+    Feature('team_size'),
+    Feature('manager_experience_years'),
+])
+
+# Project duration: same features; zone, quality and extras may be omitted
+PROJECT_DURATION_SCHEMA = FeatureSchema([
+    Feature('project_type_id', int),
+    Feature('area_m2', float),
+    Feature('num_floors', int),
+    Feature('location_zone', int, default=2),
+    Feature('complexity_score', float),
+    Feature('material_quality', int, default=2),
+    Feature('has_basement', bool, default=False),
+    Feature('has_pool', bool, default=False),
+    Feature('season_start', int),
+    Feature('team_size', int),
+    Feature('manager_experience_years', float),
+])
+
+TURNOVER_SCHEMA = FeatureSchema([
+    Feature('tenure_months'),
+    Feature('age'),
+    Feature('salary_level'),
+    Feature('department'),
+    Feature('performance_score'),
+    Feature('overtime_hours_monthly'),
+    Feature('distance_from_home_km'),
+    Feature('num_promotions'),
+    Feature('training_hours_yearly'),
+    Feature('satisfaction_score'),
+    Feature('num_projects_assigned'),
+])
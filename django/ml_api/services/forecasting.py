@@ -0,0 +1,61 @@
+"""
+Forecasting Service - ARIMA fitting helpers for inventory demand.
+
+These functions depend only on NumPy and statsmodels, so they can run in
+worker processes without loading Django or the trained models.
+"""
+from typing import Any, Dict, Tuple
+import warnings
+
+import numpy as np
+from statsmodels.tsa.arima.model import ARIMA
+
+warnings.filterwarnings('ignore')
+
+# ARIMA order used for inventory demand forecasts
+ARIMA_ORDER = (2, 1, 2)
+
+
+def _arima_metrics(fitted: Any, demand_series: np.ndarray) -> Tuple[float, float]:
+    """Return (mae, mape) of a fitted ARIMA's in-sample residuals."""
+    residuals = fitted.resid
+    mae = np.mean(np.abs(residuals))
+    # The first residual has no prior observation, skip it for the percentage
+    mape = np.mean(np.abs(residuals[1:] / (demand_series[1:] + 1))) * 100
+    return mae, mape
+
+
+def fit_arima(demand_series: np.ndarray, order: Tuple[int, int, int] = ARIMA_ORDER) -> Dict:
+    """Fit ARIMA on a demand series and compute its residual metrics."""
+    fitted = ARIMA(demand_series, order=order).fit()
+    mae, mape = _arima_metrics(fitted, demand_series)
+
+    return {
+        'fitted': fitted,
+        'mae': mae,
+        'mape': mape,
+        'n_obs': len(demand_series),
+        'appended': 0,
+        'base_mae': mae,
+    }
+
+
+def append_arima(arima: Dict, demand_series: np.ndarray) -> Dict:
+    """
+    Extend a fitted ARIMA with the observations past its end.
+
+    The estimated parameters are kept; the Kalman filter is only run over the
+    extended series, which is far cheaper than a new maximum likelihood fit.
+    """
+    new_observations = demand_series[arima['n_obs']:]
+    fitted = arima['fitted'].append(new_observations, refit=False)
+    mae, mape = _arima_metrics(fitted, demand_series)
+
+    return {
+        'fitted': fitted,
+        'mae': mae,
+        'mape': mape,
+        'n_obs': len(demand_series),
+        'appended': arima['appended'] + len(new_observations),
+        'base_mae': arima['base_mae'],
+    }
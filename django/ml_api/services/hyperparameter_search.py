@@ -0,0 +1,385 @@
+"""
+Hyperparameter Search Service - Tunes the supervised models with cross-validation.
+
+An optional stage before training. Candidates are drawn at random from each
+model's search space (the default parameters are always the first one) and
+scored with k-fold cross-validation, one fold per task, in a process pool.
+With a halving factor above 1 the search is successive halving over folds:
+every candidate is scored on the first fold and only the best 1/factor move
+on to the next, so the survivors end with a full k-fold score distribution
+at a fraction of the cost.
+
+Every fold score is cached on disk under a fingerprint of the training data,
+so an interrupted search resumes where it stopped. Nothing new starts once
+the wall-clock budget is spent, and folds still running are stopped. A
+candidate whose fold raises is dropped from the search; the others go on.
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import queue
+import shutil
+import time
+from itertools import zip_longest
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import KFold, ParameterSampler, StratifiedKFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from threadpoolctl import threadpool_limits
+
+from ml_api.services.model_store import atomic_write
+from ml_api.services.training import TRAINING_TASKS, data_fingerprint, training_data
+
+# Parameters sampled per model (and per engine for the duration model)
+SEARCH_SPACES: Dict[str, Dict[str, Dict[str, List[Any]]]] = {
+    'rf_project_cost': {
+        'random_forest': {
+            'n_estimators': [100, 200, 300],
+            'max_depth': [8, 12, 15, 20, None],
+            'min_samples_split': [2, 5, 10],
+            'min_samples_leaf': [1, 2, 4],
+            'max_features': [1.0, 0.7, 0.5, 'sqrt'],
+        },
+    },
+    'gb_project_duration': {
+        'gradient_boosting': {
+            'n_estimators': [100, 200, 300],
+            'max_depth': [3, 5, 8],
+            'learning_rate': [0.03, 0.05, 0.1, 0.2],
+            'min_samples_leaf': [1, 2, 5, 10],
+            'subsample': [0.7, 0.85, 1.0],
+        },
+        'hist_gradient_boosting': {
+            'learning_rate': [0.03, 0.05, 0.1, 0.2],
+            'max_leaf_nodes': [15, 31, 63],
+            'min_samples_leaf': [10, 20, 50],
+            'l2_regularization': [0.0, 0.1, 1.0],
+        },
+    },
+    'lr_turnover': {
+        'logistic_regression': {
+            'C': [0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0],
+        },
+    },
+}
+
+# Cross-validated metrics per model, named as in the training metrics, with
+# the scikit-learn scorer of each; the first one selects the candidate
+CV_METRICS: Dict[str, Dict[str, str]] = {
+    'rf_project_cost': {'r2_score': 'r2', 'mae': 'neg_mean_absolute_error'},
+    'gb_project_duration': {'r2_score': 'r2', 'mae_days': 'neg_mean_absolute_error'},
+    'lr_turnover': {'auc_roc': 'roc_auc', 'f1_score': 'f1'},
+}
+
+# Datasets of the worker processes, sent once per worker by the initializer
+_worker_datasets: Dict[str, Tuple[pd.DataFrame, List[str]]] = {}
+
+
+def search_space(name: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
+    """Return the parameter space of a model for its training options."""
+    spaces = SEARCH_SPACES[name]
+    engine = (options or {}).get('engine')
+    return spaces[engine] if engine in spaces else next(iter(spaces.values()))
+
+
+def _init_worker(datasets: Dict[str, Tuple[pd.DataFrame, List[str]]]):
+    """Keep the datasets in the worker so each fold task only sends parameters."""
+    _worker_datasets.update(datasets)
+
+
+def score_fold(name: str, params: Dict[str, Any], fold: int, n_folds: int,
+               options: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+    """
+    Fit one candidate on all folds but one and score it on the held-out fold.
+
+    Runs in a worker process on a single core; every worker already holds
+    the datasets. Error metrics are returned as positive values.
+    """
+    data, feature_names = _worker_datasets[name]
+    X, y = training_data(name, data, feature_names)
+    task = TRAINING_TASKS[name]
+    splitter_class = StratifiedKFold if task.get('scaled') else KFold
+    splitter = splitter_class(n_splits=n_folds, shuffle=True, random_state=42)
+    train_index, test_index = list(splitter.split(X, y))[fold]
+
+    model = task['build'](feature_names, 1, params, **(options or {}))
+    if task.get('scaled'):
+        # Fit the scaler on the training folds only
+        model = make_pipeline(StandardScaler(), model)
+    with threadpool_limits(limits=1):
+        model.fit(X.iloc[train_index], y.iloc[train_index])
+        X_test, y_test = X.iloc[test_index], y.iloc[test_index]
+        return {
+            metric: round(abs(float(get_scorer(scorer)(model, X_test, y_test))), 6)
+            for metric, scorer in CV_METRICS[name].items()
+        }
+
+
+class FoldCache:
+    """Fold scores on disk, one small JSON file per (candidate, fold)."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def task_key(params: Dict[str, Any], fold: int, n_folds: int,
+                 options: Optional[Dict[str, Any]]) -> str:
+        """Return the file name of one fold of one candidate."""
+        payload = json.dumps(
+            {'params': params, 'fold': fold, 'n_folds': n_folds, 'options': options or {}},
+            sort_keys=True, default=str
+        )
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def get(self, name: str, fingerprint: str, key: str) -> Optional[Dict[str, float]]:
+        """Return a cached fold score, or None."""
+        path = self.cache_dir / name / fingerprint / f'{key}.json'
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, name: str, fingerprint: str, key: str, scores: Dict[str, float]):
+        """Store a fold score atomically."""
+        directory = self.cache_dir / name / fingerprint
+        directory.mkdir(parents=True, exist_ok=True)
+        atomic_write(directory / f'{key}.json', lambda tmp_path: tmp_path.write_text(json.dumps(scores)))
+
+    def prune(self, name: str, fingerprint: str):
+        """Drop the scores of a model computed on other data."""
+        model_dir = self.cache_dir / name
+        if model_dir.exists():
+            for path in model_dir.iterdir():
+                if path.name != fingerprint:
+                    shutil.rmtree(path, ignore_errors=True)
+
+
+class _ModelSearch:
+    """Candidates and fold scores of one model, advanced one rung at a time."""
+
+    def __init__(self, name: str, data: pd.DataFrame, feature_names: List[str],
+                 options: Optional[Dict[str, Any]], n_candidates: int, n_folds: int,
+                 halving_factor: float, cache: FoldCache):
+        self.name = name
+        self.options = options or {}
+        self.n_folds = n_folds
+        self.halving_factor = halving_factor
+        self.cache = cache
+        self.fingerprint = data_fingerprint(name, data, feature_names)
+        sampled = ParameterSampler(
+            search_space(name, options), n_iter=max(0, n_candidates - 1), random_state=42
+        )
+        # The defaults compete too, so tuning never picks a worse CV score
+        self.candidates: List[Dict[str, Any]] = [{}]
+        for params in sampled:
+            if params not in self.candidates:
+                self.candidates.append(params)
+        self.scores: Dict[int, Dict[int, Dict[str, float]]] = {
+            index: {} for index in range(len(self.candidates))
+        }
+        self.alive = list(range(len(self.candidates)))
+        self.failed: Dict[int, str] = {}
+        self.rung = 0
+        self.evaluated = 0
+        self.cached = 0
+
+    @property
+    def done(self) -> bool:
+        return self.rung >= self._n_rungs()
+
+    def rung_tasks(self) -> List[Tuple[int, int, str]]:
+        """Return (candidate, fold, cache key) of the current rung still unscored."""
+        tasks = []
+        for index in self.alive:
+            for fold in self._rung_folds():
+                if fold in self.scores[index]:
+                    continue
+                key = self.cache.task_key(self.candidates[index], fold, self.n_folds, self.options)
+                scores = self.cache.get(self.name, self.fingerprint, key)
+                if scores is not None:
+                    self.scores[index][fold] = scores
+                    self.cached += 1
+                else:
+                    tasks.append((index, fold, key))
+        return tasks
+
+    def record(self, index: int, fold: int, key: str, scores: Dict[str, float]):
+        """Keep a computed fold score and cache it."""
+        self.scores[index][fold] = scores
+        self.evaluated += 1
+        self.cache.put(self.name, self.fingerprint, key, scores)
+
+    def fail(self, index: int, fold: int, error: BaseException):
+        """Drop a candidate whose fold raised; it is never chosen."""
+        print(f"Tuning {self.name}: candidate {self.candidates[index]} failed on fold {fold}: {error!r}")
+        self.failed.setdefault(index, repr(error))
+        if index in self.alive:
+            self.alive.remove(index)
+
+    def advance(self):
+        """Close the current rung, keeping the best candidates for the next one."""
+        self.rung += 1
+        if not self.done:
+            keep = max(1, math.ceil(len(self.alive) / self.halving_factor))
+            self.alive = sorted(self.alive, key=self._mean_score, reverse=True)[:keep]
+
+    def result(self, elapsed: float) -> Optional[Dict[str, Any]]:
+        """Return the chosen parameters and their CV scores (None if nothing was scored)."""
+        scored = {index: folds for index, folds in self.scores.items() if index not in self.failed}
+        most_folds = max((len(folds) for folds in scored.values()), default=0)
+        if most_folds == 0:
+            return None
+        finalists = [index for index, folds in scored.items() if len(folds) == most_folds]
+        best = max(finalists, key=self._mean_score)
+        folds = [self.scores[best][fold] for fold in sorted(self.scores[best])]
+        return {
+            'params': self.candidates[best],
+            'cv': {
+                metric: {
+                    'mean': round(float(np.mean([f[metric] for f in folds])), 4),
+                    'std': round(float(np.std([f[metric] for f in folds])), 4),
+                    'folds': [round(f[metric], 4) for f in folds],
+                }
+                for metric in CV_METRICS[self.name]
+            },
+            'n_folds': self.n_folds,
+            'complete': self.done,
+            'candidates': len(self.candidates),
+            'evaluated': self.evaluated,
+            'cached': self.cached,
+            'failed': len(self.failed),
+            'seconds': round(elapsed, 1),
+        }
+
+    def _n_rungs(self) -> int:
+        return self.n_folds if self.halving_factor > 1 else 1
+
+    def _rung_folds(self) -> List[int]:
+        # Without halving every fold is scored in a single rung
+        return [self.rung] if self.halving_factor > 1 else list(range(self.n_folds))
+
+    def _mean_score(self, index: int) -> float:
+        metric = next(iter(CV_METRICS[self.name]))
+        scores = [fold[metric] for fold in self.scores[index].values()]
+        return float(np.mean(scores)) if scores else float('-inf')
+
+
+class HyperparameterSearch:
+    """Cross-validated search over the supervised models within a time budget."""
+
+    def __init__(self, cache_dir: Path, n_candidates: int = 20, n_folds: int = 5,
+                 halving_factor: float = 3, budget_seconds: float = 3600,
+                 max_workers: int = 1, mp_context=None):
+        """
+        Args:
+            cache_dir: Where fold scores are kept between runs.
+            n_candidates: Parameter sets tried per model, the defaults included.
+            n_folds: Cross-validation folds.
+            halving_factor: Candidates kept after each fold are 1/factor of
+                the previous ones; 1 scores every candidate on every fold.
+            budget_seconds: Wall-clock time after which nothing new starts.
+            max_workers: Worker processes scoring folds (one core each).
+            mp_context: Multiprocessing context of the pool (the default
+                context if None).
+        """
+        self.cache = FoldCache(cache_dir)
+        self.n_candidates = n_candidates
+        self.n_folds = n_folds
+        self.halving_factor = halving_factor
+        self.budget_seconds = budget_seconds
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+
+    def run(self, datasets: Dict[str, Tuple[pd.DataFrame, List[str]]],
+            options: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Optional[Dict]]:
+        """
+        Search every model in datasets (name -> (data, feature_names)) at once.
+
+        Returns:
+            For each model, its chosen parameters and CV scores as given by
+            result(), or None if the budget ran out before any fold finished
+            or every candidate failed. 'complete' is False when the budget
+            cut the search short.
+        """
+        options = options or {}
+        start = time.monotonic()
+        deadline = start + self.budget_seconds
+        searches = {
+            name: _ModelSearch(name, data, feature_names, options.get(name),
+                               self.n_candidates, self.n_folds, self.halving_factor, self.cache)
+            for name, (data, feature_names) in datasets.items()
+        }
+
+        context = self.mp_context or multiprocessing.get_context()
+        pool = context.Pool(
+            processes=self.max_workers, initializer=_init_worker, initargs=(datasets,)
+        )
+        # Fold outcomes, put by the pool's callbacks: (task id, scores, error)
+        finished: queue.Queue = queue.Queue()
+        running: Dict[Tuple[str, int, int], Tuple[_ModelSearch, int, int, str]] = {}
+        try:
+            # Interleaved, so a budget cut does not starve the last models
+            rungs = [(search, self._next_rung(search)) for search in searches.values()]
+            for round_ in zip_longest(*(tasks for _, tasks in rungs)):
+                for (search, _), task in zip(rungs, round_):
+                    if task is not None:
+                        self._submit(pool, search, task, running, finished)
+            while running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    task_id, scores, error = finished.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                search, index, fold, key = running.pop(task_id)
+                if error is None:
+                    search.record(index, fold, key, scores)
+                else:
+                    search.fail(index, fold, error)
+                if not any(task[0] is search for task in running.values()):
+                    search.advance()
+                    for task in self._next_rung(search):
+                        self._submit(pool, search, task, running, finished)
+        finally:
+            if running:
+                # Folds still running would overrun the budget: end their workers
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+        elapsed = time.monotonic() - start
+        results = {}
+        for name, search in searches.items():
+            results[name] = search.result(elapsed)
+            if search.done:
+                self.cache.prune(name, search.fingerprint)
+        return results
+
+    def _next_rung(self, search: _ModelSearch) -> List[Tuple[int, int, str]]:
+        """Return the unscored folds of a model's rung, moving on while all are cached."""
+        while not search.done:
+            tasks = search.rung_tasks()
+            if tasks:
+                return tasks
+            search.advance()
+        return []
+
+    def _submit(self, pool, search: _ModelSearch, task: Tuple[int, int, str],
+                running: Dict, finished: queue.Queue):
+        """Submit one fold of one candidate; its outcome is put on finished."""
+        index, fold, key = task
+        task_id = (search.name, index, fold)
+        running[task_id] = (search, index, fold, key)
+        pool.apply_async(
+            score_fold, (search.name, search.candidates[index], fold, self.n_folds, search.options),
+            callback=lambda scores: finished.put((task_id, scores, None)),
+            error_callback=lambda error: finished.put((task_id, None, error)),
+        )
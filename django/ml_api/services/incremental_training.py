@@ -0,0 +1,158 @@
+"""
+Incremental Training Service - Warm-start updates of the tree ensembles.
+
+When the project history only grew since the active models were trained,
+the cost forest and the duration boosting model are updated instead of
+rebuilt: the forest gets additional trees fitted on the new rows, and the
+boosting model additional stages fitted to its residuals, new rows
+included. The number of estimators added is proportional to the share of
+new rows, so the new data weighs in the forest about as much as it does in
+the history, and each update costs about that fraction of a full fit.
+
+Like the incremental ARIMA updates, this drifts from what a full fit would
+give, so a policy asks for a full rebuild after a number of incremental
+rounds, when too much data is new, or when the model's error on the new
+rows shows it no longer fits them.
+"""
+import math
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+
+from ml_api.services.training import TrainingResult, data_fingerprint, training_data
+
+# Models updated incrementally, with the key of their holdout MAE
+INCREMENTAL_MODELS = {
+    'rf_project_cost': 'mae',
+    'gb_project_duration': 'mae_days',
+}
+
+# Duration engines that can be warm-started (the histogram engine is
+# rebuilt; it trains fast and its early stopping needs a validation split)
+WARM_START_ENGINES = ('gradient_boosting',)
+
+
+def appended_rows(name: str, data: pd.DataFrame, feature_names: List[str],
+                  metrics: Dict) -> Optional[int]:
+    """
+    Return how many rows were appended to the data a model was trained on.
+
+    Returns None if the model's training rows are not an unchanged prefix
+    of data (rows edited, removed or reordered), or were not recorded.
+    """
+    trained_rows = metrics.get('training_rows')
+    if trained_rows is None or len(data) < trained_rows:
+        return None
+    if data_fingerprint(name, data.iloc[:trained_rows], feature_names) != metrics.get('data_fingerprint'):
+        return None
+    return len(data) - trained_rows
+
+
+class IncrementalRetrainPolicy:
+    """Decides when an incrementally updated ensemble needs a full rebuild."""
+
+    def __init__(self, max_rounds: int = 7, max_new_fraction: float = 0.5,
+                 drift_threshold: float = 1.5):
+        """
+        Args:
+            max_rounds: Incremental updates since the last full rebuild
+                before the next retrain rebuilds.
+            max_new_fraction: Rebuild when the new rows exceed this fraction
+                of the rows already trained on.
+            drift_threshold: Rebuild when the model's mean absolute error on
+                the new rows exceeds this multiple of its holdout MAE at the
+                last full rebuild.
+        """
+        self.max_rounds = max_rounds
+        self.max_new_fraction = max_new_fraction
+        self.drift_threshold = drift_threshold
+
+    def rebuild_reason(self, name: str, model: Any, metrics: Dict, data: pd.DataFrame,
+                       feature_names: List[str], engine: Optional[str] = None) -> Optional[str]:
+        """Return why the model must be rebuilt, or None if it can be updated."""
+        if model is None or not metrics:
+            return 'no trained model'
+        if name == 'gb_project_duration':
+            trained_engine = metrics.get('engine', 'gradient_boosting')
+            if engine is not None and engine != trained_engine:
+                return f'engine changed to {engine}'
+            if trained_engine not in WARM_START_ENGINES:
+                return f'{trained_engine} is not warm-started'
+
+        appended = appended_rows(name, data, feature_names, metrics)
+        if appended is None:
+            return 'training rows changed'
+        rounds = metrics.get('incremental', {}).get('rounds', 0)
+        if appended and rounds >= self.max_rounds:
+            return f'{rounds} incremental rounds'
+        if appended > self.max_new_fraction * metrics['training_rows']:
+            return f'{appended} new rows'
+        if appended and self.drift(name, model, metrics, data, feature_names) > self.drift_threshold:
+            return 'drift on new rows'
+        return None
+
+    @staticmethod
+    def drift(name: str, model: Any, metrics: Dict, data: pd.DataFrame,
+              feature_names: List[str]) -> float:
+        """Return the MAE on the new rows as a multiple of the last rebuild's holdout MAE."""
+        return _new_rows_mae(name, model, metrics, data, feature_names) / _base_mae(name, metrics)
+
+
+def update_model(name: str, model: Any, metrics: Dict, data: pd.DataFrame,
+                 feature_names: List[str]) -> TrainingResult:
+    """
+    Warm-start a fitted ensemble on the rows appended since it was trained.
+
+    The model is updated in place. Its holdout metrics and feature
+    importances remain those of the last full rebuild; metrics['incremental']
+    records the rounds since then and the error on the new rows before this
+    update.
+    """
+    appended = appended_rows(name, data, feature_names, metrics)
+    if appended is None:
+        raise ValueError(f'{name}: training rows changed, a full rebuild is required')
+
+    state = dict(metrics.get('incremental') or {'rounds': 0, 'base_mae': _base_mae(name, metrics)})
+    metrics = {**metrics, 'incremental': state}
+    if appended == 0:
+        return model, metrics, None
+
+    new_rows_mae = _new_rows_mae(name, model, metrics, data, feature_names)
+    if name == 'rf_project_cost':
+        # The added trees are fitted on the new rows only
+        X, y = training_data(name, data.iloc[-appended:], feature_names)
+    else:
+        # The added stages fit the residuals of the existing ones over the
+        # whole history; fitted on the new rows alone they overfit them
+        X, y = training_data(name, data, feature_names)
+    current = len(model.estimators_)
+    added = max(1, math.ceil(current * appended / metrics['training_rows']))
+    model.set_params(warm_start=True, n_estimators=current + added)
+    model.fit(X, y)
+    model.set_params(warm_start=False)
+
+    state.update({
+        'rounds': state['rounds'] + 1,
+        'new_rows': appended,
+        'added_estimators': added,
+        'new_rows_mae': round(new_rows_mae, 2),
+    })
+    metrics.update({
+        'training_rows': len(data),
+        'data_fingerprint': data_fingerprint(name, data, feature_names),
+    })
+    return model, metrics, None
+
+
+def _base_mae(name: str, metrics: Dict) -> float:
+    """Return the holdout MAE measured at the last full rebuild."""
+    base = (metrics.get('incremental') or {}).get('base_mae', metrics.get(INCREMENTAL_MODELS[name]))
+    return max(float(base or 0), 1e-9)
+
+
+def _new_rows_mae(name: str, model: Any, metrics: Dict, data: pd.DataFrame,
+                  feature_names: List[str]) -> float:
+    """Return the model's mean absolute error on the rows it was not trained on."""
+    X, y = training_data(name, data.iloc[metrics['training_rows']:], feature_names)
+    return float(mean_absolute_error(y, model.predict(X)))
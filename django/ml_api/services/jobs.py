@@ -0,0 +1,381 @@
+"""
+Jobs Service - Runs long operations (like retraining) in the background.
+
+A job runs on its own thread and records per-stage progress and timings
+that clients poll through the jobs endpoint. Submitting a job while one of
+the same kind is still queued or running returns the existing job instead
+of starting a second one.
+
+Job state is also written to a JSON file per job, so any server worker can
+answer a status query, and a lock file per kind keeps a single job of that
+kind running across all the worker processes.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from ml_api.services.model_store import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class Job:
+    """State and progress of one background job."""
+
+    # Seconds between reads of the state file while waiting for another worker's job
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, kind: str, stages: List[str], state_dir: Optional[Path] = None,
+                 params: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            kind: Jobs of the same kind never run concurrently.
+            stages: Stage names, reported in this order.
+            params: What the job was asked to do (e.g. a retrain's mode).
+            state_dir: Directory of the job's state file, rewritten on every
+                change. Without it the state is kept in memory only.
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = dict(params or {})
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.stages: Dict[str, Dict[str, Any]] = {
+            stage: {'status': 'pending'} for stage in stages
+        }
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self._started: Dict[str, float] = {}
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._path = None if state_dir is None else Path(state_dir) / f'{self.id}.json'
+        self._save_lock = threading.Lock()
+        # Reloads a job run by another worker (set on snapshots read from disk)
+        self._reload: Optional[Callable[[], Optional['Job']]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def stage_started(self, stage: str):
+        """Mark a stage as running."""
+        with self._lock:
+            self._started[stage] = time.perf_counter()
+            self.stages[stage] = {
+                'status': 'running',
+                'started_at': datetime.now().isoformat(),
+            }
+        self.save()
+
+    def stage_finished(self, stage: str, metrics: Optional[Dict] = None,
+                       error: Optional[str] = None):
+        """Mark a stage as done (or failed) and record how long it took."""
+        with self._lock:
+            info = self.stages.setdefault(stage, {})
+            info['status'] = 'failed' if error else 'done'
+            info['finished_at'] = datetime.now().isoformat()
+            if stage in self._started:
+                info['seconds'] = round(time.perf_counter() - self._started[stage], 3)
+            if metrics is not None:
+                info['metrics'] = metrics
+            if error is not None:
+                info['error'] = error
+        self.save()
+
+    def stage_skipped(self, stage: str, reason: Optional[str] = None):
+        """Mark a stage as skipped because it had nothing to do."""
+        with self._lock:
+            info = self.stages.setdefault(stage, {})
+            info['status'] = 'skipped'
+            info['finished_at'] = datetime.now().isoformat()
+            if reason is not None:
+                info['reason'] = reason
+        self.save()
+
+    def save(self):
+        """Write the job's state to its file, if it has one."""
+        if self._path is None:
+            return
+        with self._save_lock:
+            state = json.dumps(self.to_dict(), default=str)
+            atomic_write(self._path, lambda tmp_path: tmp_path.write_text(state))
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the job to finish; returns True if it did."""
+        if self._reload is None:
+            return self._done.wait(timeout)
+
+        # Run by another worker: follow its state file
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.active:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+            job = self._reload()
+            if job is not None:
+                self._update(job)
+        return True
+
+    def _update(self, job: 'Job'):
+        """Take over the state of a fresher snapshot of this job."""
+        with self._lock:
+            for name in ('status', 'started_at', 'finished_at', 'stages', 'result', 'error'):
+                setattr(self, name, getattr(job, name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'params': self.params,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'stages': {stage: dict(info) for stage, info in self.stages.items()},
+                'result': self.result,
+                'error': self.error,
+            }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'Job':
+        """Return a read-only snapshot of a job from its saved state."""
+        job = cls(state['kind'], [], params=state.get('params'))
+        for name in ('id', 'status', 'created_at', 'started_at', 'finished_at',
+                     'stages', 'result', 'error'):
+            setattr(job, name, state[name])
+        return job
+
+
+class JobConflict(Exception):
+    """A job of the same kind, asked to do something else, is already active."""
+
+    def __init__(self, job: Job):
+        super().__init__(f"A {job.kind} job with {job.params} is already active")
+        self.job = job
+
+
+class JobManager:
+    """Starts background jobs and keeps the most recent ones for polling."""
+
+    # Seconds to wait for another worker to record the job it is starting
+    LOCK_WAIT = 5.0
+
+    def __init__(self, max_finished: int = 50, state_dir: Optional[Path] = None):
+        """
+        Args:
+            max_finished: Finished jobs kept for status queries; older ones
+                are forgotten.
+            state_dir: Directory of the job state and lock files. Defaults
+                to settings.ML_MODELS_DIR / 'jobs', resolved on every access.
+        """
+        self.max_finished = max_finished
+        self._state_dir = state_dir
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Lock file held by this process for each kind of job it is running
+        self._kind_locks: Dict[str, Any] = {}
+
+    @property
+    def state_dir(self) -> Path:
+        return Path(self._state_dir or Path(settings.ML_MODELS_DIR) / 'jobs')
+
+    def submit(self, kind: str, target: Callable[[Job], Optional[Dict]],
+               stages: List[str], params: Optional[Dict[str, Any]] = None) -> Tuple[Job, bool]:
+        """
+        Start target(job) in a background thread.
+
+        Returns:
+            (job, created). When a job of the same kind and params is already
+            queued or running, in this worker or another one, that job is
+            returned with created=False.
+
+        Raises:
+            JobConflict: If the active job of that kind has other params.
+            RuntimeError: If another worker holds the kind's lock but its
+                job cannot be read.
+        """
+        params = dict(params or {})
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while True:
+            with self._lock:
+                for job in self._jobs.values():
+                    if job.kind == kind and job.active:
+                        return self._join(job, params)
+
+                if self._lock_kind(kind):
+                    state_dir = self.state_dir
+                    job = Job(kind, stages, state_dir, params)
+                    try:
+                        job.save()
+                        atomic_write(state_dir / f'{kind}.active',
+                                     lambda tmp_path: tmp_path.write_text(job.id))
+                    except BaseException:
+                        self._unlock_kind(kind)
+                        raise
+                    self._jobs[job.id] = job
+                    self._prune()
+                    break
+
+            # Another worker runs this kind of job
+            active = self._active_job(kind)
+            if active is not None:
+                return self._join(active, params)
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Another worker is running a {kind} job that cannot be read")
+            time.sleep(0.05)
+
+        thread = threading.Thread(
+            target=self._run, args=(job, target), name=f'ml-job-{kind}', daemon=True
+        )
+        thread.start()
+        return job, True
+
+    @staticmethod
+    def _join(job: Job, params: Dict[str, Any]) -> Tuple[Job, bool]:
+        """Return an active job for a request that matches it."""
+        if job.params != params:
+            raise JobConflict(job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id, if it is still known to this or another worker."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return self._load(job_id)
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        """
+        Read a job from its state file.
+
+        A job left active by a worker that no longer holds its kind's lock
+        was interrupted (the process exited) and is reported as failed.
+        """
+        job = self._read(job_id)
+        if job is None:
+            return None
+
+        if job.active and self._lock_free(job.kind):
+            # It may have finished between the read and the lock check
+            job = self._read(job_id) or job
+            if job.active:
+                job.status = 'failed'
+                job.error = 'Job interrupted: the worker running it exited'
+        job._reload = lambda: self._load(job_id)
+        return job
+
+    def _read(self, job_id: str) -> Optional[Job]:
+        # Ids are hex; anything else cannot name a state file
+        if not job_id.isalnum():
+            return None
+        try:
+            return Job.from_dict(json.loads((self.state_dir / f'{job_id}.json').read_text()))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _active_job(self, kind: str) -> Optional[Job]:
+        """Return the active job of a kind run by another worker, if it can be read."""
+        try:
+            job_id = (self.state_dir / f'{kind}.active').read_text().strip()
+        except OSError:
+            return None
+        job = self._load(job_id)
+        return job if job is not None and job.active else None
+
+    def _lock_kind(self, kind: str) -> bool:
+        """Take the cross-process lock of a kind of job without waiting."""
+        state_dir = self.state_dir
+        state_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(state_dir / f'{kind}.lock', 'a+')
+        if not _try_lock(lock_file):
+            lock_file.close()
+            return False
+        self._kind_locks[kind] = lock_file
+        return True
+
+    def _unlock_kind(self, kind: str):
+        lock_file = self._kind_locks.pop(kind, None)
+        if lock_file is not None:
+            _unlock(lock_file)
+            lock_file.close()
+
+    def _lock_free(self, kind: str) -> bool:
+        """Return True if no worker holds the lock of a kind of job."""
+        if kind in self._kind_locks:
+            return False
+        try:
+            lock_file = open(self.state_dir / f'{kind}.lock', 'a+')
+        except OSError:
+            return False
+        with lock_file:
+            if not _try_lock(lock_file):
+                return False
+            _unlock(lock_file)
+            return True
+
+    def _run(self, job: Job, target: Callable[[Job], Optional[Dict]]):
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        job.save()
+        try:
+            job.result = target(job)
+            job.status = 'succeeded'
+        except Exception as e:
+            print(f"Job {job.kind} {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            try:
+                job.save()
+            finally:
+                # The final state is on disk before other workers may start a job
+                with self._lock:
+                    self._unlock_kind(job.kind)
+                job._done.set()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished, here and on disk."""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+        # Active jobs keep rewriting their file, so they are never the oldest
+        files = sorted(self.state_dir.glob('*.json'), key=lambda path: path.stat().st_mtime)
+        for path in files[:max(0, len(files) - self.max_finished - 1)]:
+            path.unlink(missing_ok=True)
+
+
+def _try_lock(lock_file) -> bool:
+    """Take an exclusive lock on an open file without waiting; False if it is held."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,90 @@
+"""
+Micro Batching Service - Runs concurrent single-row predictions as one batch.
+
+Every model call has a fixed dispatch cost that dominates a one-row
+prediction. When micro-batching is enabled, the first request to arrive
+waits up to max_wait seconds (or until max_batch requests have joined),
+evaluates every collected row in one matrix prediction and hands each
+waiting request its own result. No extra thread is involved: the first
+request of a batch does the work for the others.
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _Batch:
+    """Rows collected for one evaluation and, once done, their results."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.results: Optional[List[Any]] = None
+        self.error: Optional[BaseException] = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Collects concurrent submissions into batches for a batch function."""
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]],
+                 max_batch: int = 32, max_wait: float = 0.002):
+        """
+        Args:
+            fn: Evaluates a list of items, returning one result per item.
+            max_batch: Items that close a batch immediately.
+            max_wait: Seconds the first item of a batch waits for others.
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._open: Optional[_Batch] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    def submit(self, item: Any) -> Any:
+        """Evaluate one item as part of a batch and return its result."""
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                # Later items start the next batch
+                if self._open is batch:
+                    self._open = None
+                self.batches += 1
+                self.items += len(batch.items)
+                self.largest_batch = max(self.largest_batch, len(batch.items))
+            try:
+                batch.results = self.fn(batch.items)
+            except BaseException as e:
+                batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batches run, items evaluated and batch sizes."""
+        with self._lock:
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch': round(self.items / self.batches, 2) if self.batches else 0,
+                'largest_batch': self.largest_batch,
+            }
@@ -2,38 +2,121 @@
 ML Trainer Service - Handles training and persistence of ML models.
 """
 import os
-import joblib
+import queue
+import threading
+import time
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.linear_model import LogisticRegression
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import (
-    mean_absolute_error, mean_squared_error, r2_score,
-    accuracy_score, precision_score, recall_score, f1_score, roc_auc_score,
-    silhouette_score
-)
-from statsmodels.tsa.arima.model import ARIMA
+from typing import Optional, Dict, Any, Callable, List, Tuple
 import warnings
 
 from django.conf import settings
 
+from ml_api.services.arima_cache import ARIMACache, ARIMARefitPolicy
+from ml_api.services.compiled_trees import sklearn_tree_predictions
+from ml_api.services.dataset_store import DatasetStore
+from ml_api.services.hyperparameter_search import SEARCH_SPACES, HyperparameterSearch
+from ml_api.services.incremental_training import (
+    INCREMENTAL_MODELS, IncrementalRetrainPolicy, update_model
+)
+from ml_api.services.jobs import Job, JobManager
+from ml_api.services.micro_batching import MicroBatcher
+from ml_api.services.model_registry import ModelRegistry
+from ml_api.services.model_store import ModelStore
+from ml_api.services.prediction_cache import PredictionCache
+from ml_api.services.single_flight import SingleFlight
+from ml_api.services.streaming_segmentation import (
+    SegmentAssignments, assign_customers, read_chunks, update_assignments
+)
+from ml_api.services.feature_schema import (
+    PROJECT_COST_SCHEMA, PROJECT_DURATION_SCHEMA, TURNOVER_SCHEMA
+)
+from ml_api.services.forecasting import ARIMA_ORDER, append_arima, fit_arima
+from ml_api.services.training import (
+    SEGMENTATION_CHUNK_ROWS, TRAINING_TASKS, TrainingResult, data_fingerprint, is_streaming,
+    params_fingerprint, run_training_task, thread_budgets
+)
+
 warnings.filterwarnings('ignore')
 
 
 class MLTrainer:
-    """Service for training and managing ML models."""
+    """
+    Service for training and managing ML models.
+
+    Concurrency: predictions never take a lock. Each one leases the active
+    ModelStore (one complete model version) and uses only that store, so a
+    publication can never mix versions within a request. Training runs
+    under _training_lock and publication under _swap_lock, which replaces
+    the store with a single assignment; the replaced store is released once
+    its in-flight requests finish.
+    """
 
     _instance = None
-    _models: Dict[str, Any] = {}
-    _scalers: Dict[str, StandardScaler] = {}
-    _metrics: Dict[str, Dict] = {}
+    _registry = ModelRegistry()
+    # Store of the active version; replaced as a whole, never mutated in place
+    _model_store = ModelStore()
+    _datasets = DatasetStore()
+    _arima_cache = ARIMACache(max_size=settings.ML_ARIMA_CACHE_SIZE)
+    _arima_refit_policy = ARIMARefitPolicy(
+        max_appended=settings.ML_ARIMA_MAX_APPENDED,
+        drift_threshold=settings.ML_ARIMA_DRIFT_THRESHOLD,
+    )
+    _prediction_cache = PredictionCache(
+        max_size=settings.ML_PREDICTION_CACHE_SIZE,
+        ttl=settings.ML_PREDICTION_CACHE_TTL,
+    )
+    # Optional: concurrent single-row predictions evaluated as one batch
+    _micro_batchers: Dict[str, MicroBatcher] = {
+        name: MicroBatcher(
+            lambda items, name=name: MLTrainer()._run_micro_batch(name, items),
+            max_batch=settings.ML_MICRO_BATCH_MAX_SIZE,
+            max_wait=settings.ML_MICRO_BATCH_MAX_WAIT_MS / 1000,
+        )
+        for name in ('rf_project_cost', 'gb_project_duration', 'lr_turnover')
+    } if settings.ML_MICRO_BATCHING else {}
+    # When an incremental retrain rebuilds a tree ensemble instead of updating it
+    _incremental_policy = IncrementalRetrainPolicy(
+        max_rounds=settings.ML_INCREMENTAL_MAX_ROUNDS,
+        max_new_fraction=settings.ML_INCREMENTAL_MAX_NEW_FRACTION,
+        drift_threshold=settings.ML_INCREMENTAL_DRIFT_THRESHOLD,
+    )
+    # Identical concurrent forecasts and segmentations share one computation
+    _single_flight = SingleFlight()
+    _forecast_pool: Optional[ProcessPoolExecutor] = None
+    _forecast_pool_lock = threading.Lock()
     _initialized = False
 
+    # Bootstrap state per model (plus the datasets): missing, loading,
+    # training, ready or failed
+    BOOTSTRAP_RESOURCES = ModelStore.MODELS + ('datasets',)
+    _model_states: Dict[str, str] = {}
+    _model_errors: Dict[str, str] = {}
+    _bootstrap_thread: Optional[threading.Thread] = None
+    _bootstrap_lock = threading.Lock()
+    # Held while models are loaded or trained; reentrant for retrain_all
+    _training_lock = threading.RLock()
+    # Serialises swapping in the active version (after a retrain or rollback)
+    _swap_lock = threading.Lock()
+    # Serialises assigning new customers to segments
+    _assignment_lock = threading.Lock()
+    # Polls the CURRENT pointer to pick up versions published by other workers
+    _watcher_thread: Optional[threading.Thread] = None
+
+    # Background jobs (retraining), the retrain modes and the stages a retrain reports
+    _jobs = JobManager()
+    RETRAIN_MODES = ('full', 'incremental')
+    RETRAIN_STAGES = [
+        'datasets', *(['tuning'] if settings.ML_TUNING_ENABLED else []), *ModelStore.MODELS, 'reload'
+    ]
+    # Called with progress events while training, if set
+    _progress: Optional[Callable[[Tuple], None]] = None
+
     def __new__(cls):
         """Singleton pattern to ensure models are loaded only once."""
         if cls._instance is None:
@@ -41,20 +124,212 @@ class MLTrainer:
         return cls._instance
 
     def initialize_models(self):
-        """Initialize or load all ML models."""
-        if self._initialized:
-            return
-
-        print("Initializing ML models...")
-        self._ensure_directories()
-
-        # Try to load existing models, or train new ones
-        if not self._load_all_models():
-            print("Training new models...")
-            self._train_all_models()
+        """
+        Initialize or load all ML models.
+
+        Blocks until every model is ready or failed; start_bootstrap() runs
+        the same work in a background thread.
+        """
+        with self._training_lock:
+            if self._initialized:
+                return
+
+            print("Initializing ML models...")
+            self._ensure_directories()
+
+            store = self._registry.open()
+            if store.all_available():
+                MLTrainer._model_store = store
+                self._set_state('datasets', 'ready' if self._datasets.available() else 'missing')
+                for name in ModelStore.MODELS:
+                    self._load_model(name)
+            else:
+                print("Training new models...")
+                try:
+                    self._train_tracked()
+                except Exception as e:
+                    print(f"Error training models: {e}")
+
+            self._initialized = True
+            self.start_version_watcher()
+            if all(state == 'ready' for state in self.model_states().values()):
+                print("ML models ready!")
+            else:
+                print(f"ML models not all ready: {self.model_states()}")
+
+    def start_bootstrap(self):
+        """Load (or train) the models in a background thread, once."""
+        with self._bootstrap_lock:
+            if self._initialized or self._bootstrap_thread is not None:
+                return
+            MLTrainer._bootstrap_thread = threading.Thread(
+                target=self.initialize_models, name='ml-bootstrap', daemon=True
+            )
+            MLTrainer._bootstrap_thread.start()
+
+    def wait_for_bootstrap(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the background bootstrap; returns True once it finished."""
+        thread = self._bootstrap_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self._initialized
+
+    def start_version_watcher(self):
+        """Start polling for model versions published by other processes, once."""
+        with self._bootstrap_lock:
+            if self._watcher_thread is not None or settings.ML_MODEL_RELOAD_INTERVAL <= 0:
+                return
+            MLTrainer._watcher_thread = threading.Thread(
+                target=self._watch_versions, name='ml-version-watcher', daemon=True
+            )
+            MLTrainer._watcher_thread.start()
+
+    def _watch_versions(self):
+        """
+        Swap in a newly published version within ML_MODEL_RELOAD_INTERVAL.
+
+        A retrain or rollback in one worker only moves the CURRENT pointer;
+        every other worker notices it here and loads and warms the new
+        version in this thread, so requests never wait for the load.
+        """
+        failed = None
+        while True:
+            time.sleep(settings.ML_MODEL_RELOAD_INTERVAL)
+            try:
+                version = self._registry.current()
+            except Exception as e:
+                # E.g. an I/O or permission error: read it again next time
+                print(f"Error reading the active model version: {e}")
+                continue
+            if version is None or version in (self._model_store.version, failed):
+                continue
+            try:
+                print(f"Loading model version {version}...")
+                self._reload_models()
+                failed = None
+            except Exception as e:
+                # Not retried until another version is published
+                print(f"Error loading model version {version}: {e}")
+                failed = version
+
+    def model_state(self, name: str) -> str:
+        """Return the bootstrap state of a model (or of 'datasets')."""
+        return self._model_states.get(name, 'missing')
+
+    def model_states(self) -> Dict[str, str]:
+        """Return the bootstrap state of every model and the datasets."""
+        return {name: self.model_state(name) for name in self.BOOTSTRAP_RESOURCES}
+
+    def model_error(self, name: str) -> Optional[str]:
+        """Return why a model failed, if it did."""
+        return self._model_errors.get(name)
+
+    def _set_state(self, name: str, state: str, error: Optional[str] = None):
+        self._model_states[name] = state
+        if error is None:
+            self._model_errors.pop(name, None)
+        else:
+            self._model_errors[name] = error
 
-        self._initialized = True
-        print("ML models ready!")
+    def _load_model(self, name: str):
+        """Load and warm one model from disk, recording its state."""
+        self._set_state(name, 'loading')
+        try:
+            self._warm_model(name)
+            self._set_state(name, 'ready')
+        except Exception as e:
+            print(f"Error loading model {name}: {e}")
+            self._set_state(name, 'failed', str(e))
+
+    def _warm_model(self, name: str, store: Optional[ModelStore] = None):
+        """Run one dummy prediction so the first real request is not slow."""
+        store = store or self._model_store
+        store.metrics(name)
+        if store.compilable(name):
+            compiled = store.compiled(name)
+            compiled.predict(np.zeros((1, compiled.n_features)))
+        else:
+            model = store.model(name)
+            scaler = store.scaler(name)
+            X = np.zeros((1, model.n_features_in_))
+            model.predict(scaler.transform(X) if scaler is not None else X)
+
+    def _train_tracked(self):
+        """Train everything, marking whatever did not finish as failed."""
+        for name in self.BOOTSTRAP_RESOURCES:
+            self._set_state(name, 'training')
+        try:
+            self._train_new_version()
+        except Exception as e:
+            for name in self.BOOTSTRAP_RESOURCES:
+                if self.model_state(name) == 'training':
+                    self._set_state(name, 'failed', str(e))
+            raise
+
+    def _train_new_version(self, mode: str = 'full') -> str:
+        """
+        Train into a new version directory and publish it once complete.
+
+        Models whose data and parameters did not change are carried over
+        from the published version instead of being trained again. If that
+        holds for every model, the new version is discarded and the
+        published one stays active.
+
+        Args:
+            mode: 'full' regenerates the datasets and trains every model from
+                scratch; 'incremental' updates the published version's tree
+                ensembles with the rows appended to the datasets on disk.
+
+        Returns:
+            The version serving the models afterwards.
+        """
+        if mode not in self.RETRAIN_MODES:
+            raise ValueError(f"Unknown retrain mode: {mode}")
+        previous = self._registry.open()
+        version = self._registry.create_version()
+        print(f"Training model version {version} ({mode})...")
+        MLTrainer._model_store = self._registry.open(version)
+        if mode == 'incremental':
+            reused = self._update_all_models(previous)
+        else:
+            reused = self._train_all_models(previous)
+        if len(reused) == len(TRAINING_TASKS):
+            print(f"No model changed, keeping version {previous.version}")
+            MLTrainer._model_store = previous
+            self._registry.discard(version)
+            return previous.version
+        self._registry.publish(version)
+        return version
+
+    def _model_trained(self, name: str, result: TrainingResult, extra: Optional[Dict] = None):
+        """Save a freshly trained model and mark it ready once it has been warmed."""
+        model, metrics, scaler = result
+        # Chosen parameters, CV scores and the parameter fingerprint are
+        # kept with the model version
+        metrics.update(extra or {})
+        assignments = None
+        if is_streaming(name, metrics):
+            assignments = self._assign_customers(model, metrics, scaler)
+        self._model_store.save(name, model, metrics, scaler)
+        if assignments is not None:
+            self._model_store.save_assignments(name, assignments.to_dict())
+        self._warm_model(name)
+        self._set_state(name, 'ready')
+
+    def _assign_customers(self, model: Any, metrics: Dict, scaler: Any) -> SegmentAssignments:
+        """
+        Assign every customer to a streamed segmentation's clusters.
+
+        The cluster statistics and silhouette score are taken from this pass
+        and added to the metrics.
+        """
+        print("Assigning customers to segments...")
+        assignments = assign_customers(
+            self._datasets.path('customers'), model, scaler, metrics['chunk_rows']
+        )
+        metrics['silhouette_score'] = round(assignments.silhouette(scaler), 4)
+        metrics['cluster_stats'] = assignments.cluster_stats()
+        return assignments
 
     def _ensure_directories(self):
         """Ensure required directories exist."""
@@ -63,327 +338,497 @@ class MLTrainer:
         models_dir.mkdir(parents=True, exist_ok=True)
         datasets_dir.mkdir(parents=True, exist_ok=True)
 
-    def _load_all_models(self) -> bool:
-        """Try to load all models from disk."""
-        models_dir = settings.ML_MODELS_DIR
-        required_models = [
-            'rf_project_cost', 'gb_project_duration',
-            'kmeans_customers', 'lr_turnover'
-        ]
+    def _train_all_models(self, previous: Optional[ModelStore] = None) -> List[str]:
+        """
+        Train all ML models from scratch.
 
-        try:
-            for model_name in required_models:
-                model_path = models_dir / f'{model_name}.joblib'
-                if not model_path.exists():
-                    return False
-                self._models[model_name] = joblib.load(model_path)
-
-                # Load associated scaler if exists
-                scaler_path = models_dir / f'{model_name}_scaler.joblib'
-                if scaler_path.exists():
-                    self._scalers[model_name] = joblib.load(scaler_path)
-
-                # Load metrics if exists
-                metrics_path = models_dir / f'{model_name}_metrics.joblib'
-                if metrics_path.exists():
-                    self._metrics[model_name] = joblib.load(metrics_path)
-
-            print("All models loaded from disk.")
-            return True
-        except Exception as e:
-            print(f"Error loading models: {e}")
-            return False
-
-    def _train_all_models(self):
-        """Train all ML models from scratch."""
+        Returns:
+            The models carried over unchanged from previous.
+        """
         from ml_api.datasets.generators import (
             ProjectDataGenerator, CustomerDataGenerator,
             EmployeeDataGenerator, InventoryDataGenerator
         )
 
         # Generate datasets
-        print("Generating datasets...")
-        project_gen = ProjectDataGenerator(seed=42)
-        customer_gen = CustomerDataGenerator(seed=42)
-        employee_gen = EmployeeDataGenerator(seed=42)
-        inventory_gen = InventoryDataGenerator(seed=42)
-
-        project_data = project_gen.generate(n_samples=500)
-        customer_data = customer_gen.generate(n_samples=300)
-        employee_data = employee_gen.generate(n_samples=400)
-        inventory_data = inventory_gen.generate(days=730)
-
-        # Save datasets
-        datasets_dir = settings.ML_DATASETS_DIR
-        project_data.to_csv(datasets_dir / 'projects.csv', index=False)
-        customer_data.to_csv(datasets_dir / 'customers.csv', index=False)
-        employee_data.to_csv(datasets_dir / 'employees.csv', index=False)
-        inventory_data.to_csv(datasets_dir / 'inventory_history.csv', index=False)
-
-        # Train models
-        print("Training Random Forest (Project Cost)...")
-        self._train_project_cost_model(project_data, project_gen.get_feature_names())
-
-        print("Training Gradient Boosting (Project Duration)...")
-        self._train_project_duration_model(project_data, project_gen.get_feature_names())
-
-        print("Training K-Means (Customer Segmentation)...")
-        self._train_customer_segmentation(customer_data, customer_gen.get_feature_names())
+        with self._stage('datasets'):
+            print("Generating datasets...")
+            project_gen = ProjectDataGenerator(seed=42)
+            customer_gen = CustomerDataGenerator(seed=42)
+            employee_gen = EmployeeDataGenerator(seed=42)
+            inventory_gen = InventoryDataGenerator(seed=42)
+
+            project_data = project_gen.generate(n_samples=500)
+            customer_data = customer_gen.generate(n_samples=300)
+            employee_data = employee_gen.generate(n_samples=400)
+            inventory_data = inventory_gen.generate(days=730)
+
+            self.save_datasets({
+                'projects': project_data,
+                'customers': customer_data,
+                'employees': employee_data,
+                'inventory_history': inventory_data,
+            })
 
-        print("Training Logistic Regression (Turnover)...")
-        self._train_turnover_model(employee_data, employee_gen.get_feature_names())
+        # Train the independent models in parallel, then persist each one.
+        # The files are read back: the CSV round trip can change the last
+        # digit of a float, and the recorded data fingerprints must match
+        # what an incremental retrain reads later
+        reused = self._train_models(self._training_datasets(), previous=previous)
 
         # ARIMA doesn't need pre-training, it's fitted per forecast request
         print("All models trained and saved.")
-
-    def _train_project_cost_model(self, data: pd.DataFrame, feature_names: list):
-        """Train Random Forest for project cost prediction."""
-        X = data[feature_names].copy()
-        X['has_basement'] = X['has_basement'].astype(int)
-        X['has_pool'] = X['has_pool'].astype(int)
-        y = data['actual_cost']
-
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
+        return reused
+
+    def _update_all_models(self, previous: ModelStore) -> List[str]:
+        """
+        Update the tree ensembles with the rows appended to the datasets on disk.
+
+        Each ensemble is warm-started unless the policy asks for a full
+        rebuild (history changed, too many rounds or new rows, drift). The
+        other models, and the ensembles to rebuild, are trained from scratch
+        on the same datasets. Models whose data did not change at all are
+        carried over as they are.
+
+        Returns:
+            The models carried over unchanged from previous.
+        """
+        with self._stage('datasets'):
+            print("Loading datasets...")
+            datasets = self._training_datasets()
+
+        options = self._training_options()
+        reused = self._reuse_unchanged(previous, datasets, list(TRAINING_TASKS), options, updated_ok=True)
+        rebuild = []
+        for name in INCREMENTAL_MODELS:
+            if name in reused:
+                continue
+            data, feature_names = datasets[TRAINING_TASKS[name]['dataset']]
+            model, metrics = previous.model(name), previous.metrics(name)
+            reason = self._incremental_policy.rebuild_reason(
+                name, model, metrics, data, feature_names, options.get(name, {}).get('engine')
+            )
+            if reason is not None:
+                print(f"Rebuilding {TRAINING_TASKS[name]['label']}: {reason}")
+                rebuild.append(name)
+                continue
+            with self._stage(name):
+                print(f"Updating {TRAINING_TASKS[name]['label']}...")
+                self._model_trained(name, update_model(name, model, metrics, data, feature_names))
+
+        self._train_models(datasets, [
+            name for name in TRAINING_TASKS
+            if name not in reused and (name not in INCREMENTAL_MODELS or name in rebuild)
+        ])
+        return reused
+
+    def _training_datasets(self) -> Dict[str, Tuple[Any, List[str]]]:
+        """
+        Return each training dataset, as saved on disk, with its feature names.
+
+        When the segmentation streams the customers, their dataset is the
+        file's path: the server process never loads it as a whole.
+        """
+        from ml_api.datasets.generators import (
+            ProjectDataGenerator, CustomerDataGenerator, EmployeeDataGenerator
         )
 
-        model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=15,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42,
-            n_jobs=-1
-        )
-        model.fit(X_train, y_train)
-
-        # Calculate metrics
-        y_pred = model.predict(X_test)
-        metrics = {
-            'r2_score': round(r2_score(y_test, y_pred), 4),
-            'mae': round(mean_absolute_error(y_test, y_pred), 2),
-            'rmse': round(np.sqrt(mean_squared_error(y_test, y_pred)), 2),
-            'feature_importance': dict(zip(
-                feature_names,
-                model.feature_importances_.round(4).tolist()
-            ))
+        if is_streaming('kmeans_customers', self._training_options().get('kmeans_customers')):
+            customers = self._datasets.path('customers')
+        else:
+            customers = self._datasets.get('customers')
+        return {
+            'projects': (self._datasets.get('projects'), ProjectDataGenerator().get_feature_names()),
+            'customers': (customers, CustomerDataGenerator().get_feature_names()),
+            'employees': (self._datasets.get('employees'), EmployeeDataGenerator().get_feature_names()),
         }
 
-        # Save
-        self._save_model('rf_project_cost', model, metrics)
-        self._models['rf_project_cost'] = model
-        self._metrics['rf_project_cost'] = metrics
-
-    def _train_project_duration_model(self, data: pd.DataFrame, feature_names: list):
-        """Train Gradient Boosting for project duration prediction."""
-        X = data[feature_names].copy()
-        X['has_basement'] = X['has_basement'].astype(int)
-        X['has_pool'] = X['has_pool'].astype(int)
-        y = data['actual_duration_days']
-
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-
-        model = GradientBoostingRegressor(
-            n_estimators=100,
-            max_depth=8,
-            learning_rate=0.1,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42
-        )
-        model.fit(X_train, y_train)
-
-        # Calculate metrics
-        y_pred = model.predict(X_test)
-        metrics = {
-            'r2_score': round(r2_score(y_test, y_pred), 4),
-            'mae_days': round(mean_absolute_error(y_test, y_pred), 1),
-            'rmse_days': round(np.sqrt(mean_squared_error(y_test, y_pred)), 1),
-            'feature_importance': dict(zip(
-                feature_names,
-                model.feature_importances_.round(4).tolist()
-            ))
+    def _train_models(self, datasets: Dict[str, Tuple[pd.DataFrame, List[str]]],
+                      names: Optional[List[str]] = None,
+                      previous: Optional[ModelStore] = None) -> List[str]:
+        """
+        Train every model, in parallel worker processes when cores allow.
+
+        The models share no state, so the run takes about as long as the
+        slowest one. Each model is saved and marked ready as soon as its task
+        finishes; the first failure is raised once all tasks are done. With
+        ML_TUNING_ENABLED the supervised models are trained with the
+        parameters chosen by a cross-validated search first.
+
+        Args:
+            names: Models to train (all of them by default).
+            previous: Version to carry unchanged models over from.
+
+        Returns:
+            The models carried over instead of trained.
+        """
+        names = list(TRAINING_TASKS) if names is None else names
+        options = self._training_options()
+        # Taken before tuning adds the chosen parameters: those depend on the
+        # data, which is fingerprinted separately
+        extras = {
+            name: {'params_fingerprint': self._params_fingerprint(
+                name, datasets[TRAINING_TASKS[name]['dataset']][1], options.get(name)
+            )}
+            for name in names
         }
-
-        # Save
-        self._save_model('gb_project_duration', model, metrics)
-        self._models['gb_project_duration'] = model
-        self._metrics['gb_project_duration'] = metrics
-
-    def _train_customer_segmentation(self, data: pd.DataFrame, feature_names: list):
-        """Train K-Means for customer segmentation."""
-        # Use clustering features
-        cluster_features = [
-            'total_revenue', 'num_projects', 'months_as_customer',
-            'payment_delay_avg_days', 'communication_score', 'project_frequency'
-        ]
-        X = data[cluster_features].copy()
-
-        # Scale features
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-
-        # Train K-Means with 4 clusters
-        model = KMeans(n_clusters=4, random_state=42, n_init=10)
-        labels = model.fit_predict(X_scaled)
-
-        # Calculate metrics
-        silhouette = silhouette_score(X_scaled, labels)
-
-        # Calculate cluster statistics
-        data_with_labels = data.copy()
-        data_with_labels['cluster'] = labels
-        cluster_stats = {}
-        for cluster_id in range(4):
-            cluster_data = data_with_labels[data_with_labels['cluster'] == cluster_id]
-            cluster_stats[cluster_id] = {
-                'count': len(cluster_data),
-                'percentage': round(len(cluster_data) / len(data) * 100, 1),
-                'avg_revenue': round(cluster_data['total_revenue'].mean(), 2),
-                'avg_projects': round(cluster_data['num_projects'].mean(), 1),
-                'avg_tenure_months': round(cluster_data['months_as_customer'].mean(), 1),
-                'avg_payment_delay': round(cluster_data['payment_delay_avg_days'].mean(), 1),
-                'avg_satisfaction': round(cluster_data['communication_score'].mean(), 1),
+        reused = self._reuse_unchanged(previous, datasets, names, options) if previous is not None else []
+        names = [name for name in names if name not in reused]
+        if not names:
+            if settings.ML_TUNING_ENABLED:
+                self._report(('skipped', 'tuning', 'unchanged'))
+            return reused
+
+        n_cpus = os.cpu_count() or 1
+        workers = min(len(names), settings.ML_TRAINING_MAX_WORKERS)
+        tuning = self._tune_models(datasets, options, names) if settings.ML_TUNING_ENABLED else {}
+        for name, result in tuning.items():
+            options.setdefault(name, {})['params'] = result['params']
+            extras[name]['tuning'] = result
+
+        if workers <= 1:
+            for name in names:
+                with self._stage(name):
+                    print(f"Training {TRAINING_TASKS[name]['label']}...")
+                    data, feature_names = self._training_input(name, datasets, options)
+                    # Alone on the machine, a task may use every core
+                    n_threads = thread_budgets(n_cpus, [name], options)[name]
+                    self._model_trained(name, run_training_task(
+                        name, data, feature_names, n_threads, options.get(name)
+                    ), extras[name])
+            return reused
+
+        budgets = thread_budgets(n_cpus, names, options)
+        error = None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_training_context()) as pool:
+            futures = {}
+            for name in names:
+                print(f"Training {TRAINING_TASKS[name]['label']} ({budgets[name]} threads)...")
+                data, feature_names = self._training_input(name, datasets, options)
+                self._report(('started', name))
+                futures[pool.submit(
+                    run_training_task, name, data, feature_names, budgets[name], options.get(name)
+                )] = name
+
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    self._model_trained(name, future.result(), extras[name])
+                    self._report(('finished', name, self._model_store.metrics(name), None))
+                except Exception as e:
+                    self._report(('finished', name, None, str(e)))
+                    error = error or e
+
+        if error is not None:
+            raise error
+        return reused
+
+    def _training_input(self, name: str, datasets: Dict[str, Tuple[pd.DataFrame, List[str]]],
+                        options: Dict[str, Dict[str, Any]]) -> Tuple[Any, List[str]]:
+        """Return a task's dataset, or the dataset's file if the task streams it."""
+        dataset = TRAINING_TASKS[name]['dataset']
+        data, feature_names = datasets[dataset]
+        if is_streaming(name, options.get(name)):
+            return self._datasets.path(dataset), feature_names
+        return data, feature_names
+
+    def _params_fingerprint(self, name: str, feature_names: List[str],
+                            options: Optional[Dict[str, Any]]) -> str:
+        """Return the fingerprint of a model's training parameters and settings."""
+        extra = None
+        if settings.ML_TUNING_ENABLED and name in SEARCH_SPACES:
+            # A tuned model depends on the search, not just on the defaults
+            extra = {
+                'search_space': SEARCH_SPACES[name],
+                'candidates': settings.ML_TUNING_CANDIDATES,
+                'folds': settings.ML_TUNING_FOLDS,
+                'halving_factor': settings.ML_TUNING_HALVING_FACTOR,
             }
-
-        metrics = {
-            'silhouette_score': round(silhouette, 4),
-            'n_clusters': 4,
-            'cluster_stats': cluster_stats,
-            'feature_names': cluster_features,
-        }
-
-        # Save
-        self._save_model('kmeans_customers', model, metrics, scaler)
-        self._models['kmeans_customers'] = model
-        self._scalers['kmeans_customers'] = scaler
-        self._metrics['kmeans_customers'] = metrics
-
-    def _train_turnover_model(self, data: pd.DataFrame, feature_names: list):
-        """Train Logistic Regression for turnover prediction."""
-        X = data[feature_names].copy()
-        y = data['has_left'].astype(int)
-
-        # Scale features
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-
-        X_train, X_test, y_train, y_test = train_test_split(
-            X_scaled, y, test_size=0.2, random_state=42, stratify=y
-        )
-
-        model = LogisticRegression(
-            max_iter=1000,
-            random_state=42,
-            class_weight='balanced'
+        return params_fingerprint(name, feature_names, options, extra)
+
+    def _unchanged(self, name: str, previous: ModelStore, data: Any,
+                   feature_names: List[str], options: Optional[Dict[str, Any]],
+                   updated_ok: bool = False) -> bool:
+        """
+        Return True if retraining the model would reproduce previous's artifact.
+
+        That is the case when the model was trained on the same data with the
+        same parameters, its hyperparameter search (if any) was not cut short
+        by the budget, and, unless updated_ok, it was not warm-started since
+        its last full rebuild. A streamed dataset (a path) is hashed chunk
+        by chunk.
+        """
+        if not previous.available(name):
+            return False
+        metrics = previous.metrics(name)
+        if metrics.get('params_fingerprint') != self._params_fingerprint(name, feature_names, options):
+            return False
+        if isinstance(data, Path):
+            data = read_chunks(data, (options or {}).get('chunk_rows', SEGMENTATION_CHUNK_ROWS))
+        if metrics.get('data_fingerprint') != data_fingerprint(name, data, feature_names):
+            return False
+        if name in SEARCH_SPACES and settings.ML_TUNING_ENABLED and not metrics.get('tuning', {}).get('complete'):
+            return False
+        if not updated_ok and metrics.get('incremental', {}).get('rounds', 0):
+            return False
+        return True
+
+    def _reuse_unchanged(self, previous: ModelStore,
+                         datasets: Dict[str, Tuple[pd.DataFrame, List[str]]],
+                         names: List[str], options: Dict[str, Dict[str, Any]],
+                         updated_ok: bool = False) -> List[str]:
+        """Carry the unchanged models over from previous; returns their names."""
+        reused = []
+        for name in names:
+            data, feature_names = datasets[TRAINING_TASKS[name]['dataset']]
+            if not self._unchanged(name, previous, data, feature_names, options.get(name), updated_ok):
+                continue
+            print(f"{TRAINING_TASKS[name]['label']} unchanged, reusing version {previous.version}")
+            self._model_store.reuse(name, previous)
+            self._warm_model(name)
+            self._set_state(name, 'ready')
+            self._report(('skipped', name, 'unchanged'))
+            reused.append(name)
+        return reused
+
+    def _tune_models(self, datasets: Dict[str, Tuple[pd.DataFrame, List[str]]],
+                     options: Dict[str, Dict[str, Any]], names: List[str]) -> Dict[str, Dict]:
+        """
+        Search the supervised models' hyperparameters within the time budget.
+
+        Fold scores are cached under trained_models/tuning, so a search cut
+        short (by the budget or a crash) resumes on the next retrain. A
+        model the search could not score keeps its default parameters, and
+        so do all of them if the search fails.
+        """
+        names = [name for name in names if name in SEARCH_SPACES]
+        search = HyperparameterSearch(
+            cache_dir=Path(settings.ML_MODELS_DIR) / 'tuning',
+            n_candidates=settings.ML_TUNING_CANDIDATES,
+            n_folds=settings.ML_TUNING_FOLDS,
+            halving_factor=settings.ML_TUNING_HALVING_FACTOR,
+            budget_seconds=settings.ML_TUNING_BUDGET_SECONDS,
+            max_workers=settings.ML_TUNING_MAX_WORKERS,
+            mp_context=_training_context(),
         )
-        model.fit(X_train, y_train)
-
-        # Calculate metrics
-        y_pred = model.predict(X_test)
-        y_prob = model.predict_proba(X_test)[:, 1]
-
-        metrics = {
-            'accuracy': round(accuracy_score(y_test, y_pred), 4),
-            'precision': round(precision_score(y_test, y_pred), 4),
-            'recall': round(recall_score(y_test, y_pred), 4),
-            'f1_score': round(f1_score(y_test, y_pred), 4),
-            'auc_roc': round(roc_auc_score(y_test, y_prob), 4),
-            'coefficients': dict(zip(
-                feature_names,
-                model.coef_[0].round(4).tolist()
-            )),
-            'feature_names': feature_names,
+        try:
+            with self._stage('tuning'):
+                print(f"Tuning hyperparameters ({settings.ML_TUNING_CANDIDATES} candidates, "
+                      f"{settings.ML_TUNING_FOLDS}-fold CV)...")
+                results = search.run(
+                    {name: datasets[TRAINING_TASKS[name]['dataset']] for name in names},
+                    {name: options[name] for name in names if name in options},
+                )
+        except Exception as e:
+            print(f"Hyperparameter search failed, using default parameters: {e}")
+            return {}
+
+        tuned = {}
+        for name, result in results.items():
+            if result is None:
+                print(f"  {name}: no fold finished within the budget, using default parameters")
+                continue
+            metric, scores = next(iter(result['cv'].items()))
+            print(f"  {name}: {metric} {scores['mean']} +/- {scores['std']} with {result['params'] or 'defaults'}"
+                  f"{'' if result['complete'] else ' (budget reached)'}")
+            tuned[name] = result
+        return tuned
+
+    def _training_options(self) -> Dict[str, Dict[str, Any]]:
+        """Return the per-model training options taken from settings."""
+        return {
+            'gb_project_duration': {'engine': settings.ML_DURATION_ENGINE},
+            'kmeans_customers': {
+                'engine': settings.ML_SEGMENTATION_ENGINE,
+                'chunk_rows': settings.ML_SEGMENTATION_CHUNK_ROWS,
+            },
         }
 
-        # Save
-        self._save_model('lr_turnover', model, metrics, scaler)
-        self._models['lr_turnover'] = model
-        self._scalers['lr_turnover'] = scaler
-        self._metrics['lr_turnover'] = metrics
-
-    def _save_model(
-        self, name: str, model: Any, metrics: Dict,
-        scaler: Optional[StandardScaler] = None
-    ):
-        """Save model, metrics, and optional scaler to disk."""
-        models_dir = settings.ML_MODELS_DIR
-        joblib.dump(model, models_dir / f'{name}.joblib')
-        joblib.dump(metrics, models_dir / f'{name}_metrics.joblib')
-        if scaler is not None:
-            joblib.dump(scaler, models_dir / f'{name}_scaler.joblib')
+    def _report(self, event: Tuple):
+        """Pass a progress event to the progress callback, if any."""
+        if self._progress is not None:
+            self._progress(event)
+
+    @contextmanager
+    def _stage(self, name: str):
+        """Report the start and end (with metrics, or the error) of a training stage."""
+        self._report(('started', name))
+        try:
+            yield
+        except Exception as e:
+            self._report(('finished', name, None, str(e)))
+            raise
+        metrics = self._model_store.metrics(name) if name in ModelStore.MODELS else None
+        self._report(('finished', name, metrics, None))
+
+    @contextmanager
+    def _lease(self, name: str):
+        """Use the active store for one request; it is not released meanwhile."""
+        while True:
+            store = self._model_store
+            store.acquire(name)
+            # A swap between the read and acquire: lease the new store instead
+            if store is self._model_store:
+                break
+            store.release(name)
+        try:
+            yield store
+        finally:
+            store.release(name)
+
+    def _model_outputs(self, name: str, store: ModelStore, X: np.ndarray) -> List[Any]:
+        """
+        Evaluate a model on the rows of X, one output per row.
+
+        With micro-batching enabled, a single row is queued and evaluated
+        together with other requests' rows for the same model.
+        """
+        batcher = self._micro_batchers.get(name)
+        if batcher is not None and len(X) == 1:
+            return [batcher.submit((store, X[0]))]
+        return self._evaluate(name, store, X)
+
+    def _run_micro_batch(self, name: str, items: List[Tuple[ModelStore, np.ndarray]]) -> List[Any]:
+        """Evaluate queued (store, row) items, one matrix per model version."""
+        groups: Dict[int, Tuple[ModelStore, List[int]]] = {}
+        for i, (store, _) in enumerate(items):
+            groups.setdefault(id(store), (store, []))[1].append(i)
+
+        results: List[Any] = [None] * len(items)
+        for store, indices in groups.values():
+            X = np.array([items[i][1] for i in indices], dtype=np.float64)
+            for i, output in zip(indices, self._evaluate(name, store, X)):
+                results[i] = output
+        return results
+
+    def _evaluate(self, name: str, store: ModelStore, X: np.ndarray) -> List[Any]:
+        """
+        Run one model of a store on a feature matrix.
+
+        Small batches of the tree ensembles go through the compiled engine;
+        beyond ML_COMPILED_MAX_ROWS rows sklearn's traversal, which stops
+        each row at its leaf, is faster.
+        """
+        compiled_batch = len(X) <= settings.ML_COMPILED_MAX_ROWS
+        if name == 'rf_project_cost':
+            if compiled_batch:
+                compiled = store.compiled(name)
+                if compiled is None:
+                    raise ValueError("Project cost model not loaded")
+                # Per-tree predictions (trees x rows) give mean and spread per row
+                tree_predictions = compiled.tree_predictions(X)
+            else:
+                model = store.model(name)
+                if model is None:
+                    raise ValueError("Project cost model not loaded")
+                tree_predictions = sklearn_tree_predictions(model, X)
+            return list(zip(tree_predictions.mean(axis=0), tree_predictions.std(axis=0)))
+
+        if name == 'gb_project_duration':
+            if not compiled_batch or not store.compilable(name):
+                model = store.model(name)
+                if model is None:
+                    raise ValueError("Project duration model not loaded")
+                return list(model.predict(X))
+            compiled = store.compiled(name)
+            if compiled is None:
+                raise ValueError("Project duration model not loaded")
+            return list(compiled.predict(X))
+
+        if name == 'lr_turnover':
+            model = store.model(name)
+            scaler = store.scaler(name)
+            if model is None:
+                raise ValueError("Turnover model not loaded")
+            return list(model.predict_proba(scaler.transform(X))[:, 1])
+
+        raise ValueError(f"Unknown model: {name}")
 
     # Prediction methods
 
     def predict_project_cost(self, features: Dict) -> Dict:
-        """Predict project cost using Random Forest."""
-        model = self._models.get('rf_project_cost')
-        metrics = self._metrics.get('rf_project_cost', {})
-
-        if model is None:
-            raise ValueError("Project cost model not loaded")
-
-        # Feature names in the exact order used during training
-        feature_names = [
-            'project_type_id', 'area_m2', 'num_floors', 'location_zone',
-            'complexity_score', 'material_quality', 'has_basement', 'has_pool',
-            'season_start', 'team_size', 'manager_experience_years'
-        ]
-
-        # Prepare features in correct order
-        features['has_basement'] = int(features.get('has_basement', False))
-        features['has_pool'] = int(features.get('has_pool', False))
-        X = pd.DataFrame([features])[feature_names]
-
-        # Get prediction and confidence interval
-        predictions = []
-        for estimator in model.estimators_:
-            predictions.append(estimator.predict(X)[0])
-
-        predicted_cost = np.mean(predictions)
-        std = np.std(predictions)
-        confidence_interval = (predicted_cost - 1.96 * std, predicted_cost + 1.96 * std)
-
-        return {
-            'predicted_cost': round(predicted_cost, 2),
-            'confidence_interval': {
-                'lower': round(max(0, confidence_interval[0]), 2),
-                'upper': round(confidence_interval[1], 2),
-            },
-            'confidence_level': round(1 - (std / predicted_cost), 2) if predicted_cost > 0 else 0,
-            'model_info': {
-                'name': 'RandomForestRegressor',
-                'r2_score': metrics.get('r2_score', 0),
-                'mae': metrics.get('mae', 0),
-                'rmse': metrics.get('rmse', 0),
-                'feature_importance': metrics.get('feature_importance', {}),
-            }
+        """
+        Predict project cost using Random Forest.
+
+        Raises:
+            SchemaError: If a required field is missing or a value is invalid.
+        """
+        return self._predict_project_costs(PROJECT_COST_SCHEMA.to_array(features))[0]
+
+    def predict_project_cost_batch(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Predict project cost for many projects in a single pass.
+
+        Raises:
+            SchemaError: If any row is invalid (listed in .errors).
+        """
+        # Build the feature matrix once, columns in training order
+        return self._predict_project_costs(PROJECT_COST_SCHEMA.to_matrix(rows))
+
+    def _predict_project_costs(self, X: np.ndarray) -> List[Dict]:
+        """Predict project cost for each row of a validated feature matrix."""
+        with self._lease('rf_project_cost') as store:
+            metrics = store.metrics('rf_project_cost')
+
+            # (mean, std) across trees per row, evaluated only for cache misses
+            keys = [
+                PredictionCache.make_key('rf_project_cost', store.version, row)
+                for row in X.tolist()
+            ]
+            outputs = [self._prediction_cache.get(key) for key in keys]
+            missing = [i for i, output in enumerate(outputs) if output is None]
+
+            if missing:
+                for i, output in zip(missing, self._model_outputs('rf_project_cost', store, X[missing])):
+                    outputs[i] = output
+                    self._prediction_cache.put(keys[i], output)
+
+        predicted_costs = np.array([mean for mean, _ in outputs])
+        stds = np.array([std for _, std in outputs])
+        lowers = predicted_costs - 1.96 * stds
+        uppers = predicted_costs + 1.96 * stds
+
+        model_info = {
+            'name': 'RandomForestRegressor',
+            'r2_score': metrics.get('r2_score', 0),
+            'mae': metrics.get('mae', 0),
+            'rmse': metrics.get('rmse', 0),
+            'feature_importance': metrics.get('feature_importance', {}),
         }
 
-    def predict_project_duration(self, features: Dict) -> Dict:
-        """Predict project duration using Gradient Boosting."""
-        model = self._models.get('gb_project_duration')
-        metrics = self._metrics.get('gb_project_duration', {})
-
-        if model is None:
-            raise ValueError("Project duration model not loaded")
-
-        # Feature names in the exact order used during training
-        feature_names = [
-            'project_type_id', 'area_m2', 'num_floors', 'location_zone',
-            'complexity_score', 'material_quality', 'has_basement', 'has_pool',
-            'season_start', 'team_size', 'manager_experience_years'
-        ]
-
-        # Prepare features in correct order
-        features['has_basement'] = int(features.get('has_basement', False))
-        features['has_pool'] = int(features.get('has_pool', False))
-        X = pd.DataFrame([features])[feature_names]
+        results = []
+        for predicted_cost, std, lower, upper in zip(predicted_costs, stds, lowers, uppers):
+            results.append({
+                'predicted_cost': round(predicted_cost, 2),
+                'confidence_interval': {
+                    'lower': round(max(0, lower), 2),
+                    'upper': round(upper, 2),
+                },
+                'confidence_level': round(1 - (std / predicted_cost), 2) if predicted_cost > 0 else 0,
+                'model_info': model_info,
+            })
+        return results
 
-        # Get prediction
-        predicted_days = model.predict(X)[0]
+    def predict_project_duration(self, features: Dict) -> Dict:
+        """
+        Predict project duration using Gradient Boosting.
+
+        Raises:
+            SchemaError: If a required field is missing or a value is invalid.
+        """
+        # Prepare features in correct order (defaults applied, caller's dict untouched)
+        row = PROJECT_DURATION_SCHEMA.row(features)
+
+        with self._lease('gb_project_duration') as store:
+            metrics = store.metrics('gb_project_duration')
+            key = PredictionCache.make_key('gb_project_duration', store.version, row)
+            predicted_days = self._prediction_cache.get(key)
+
+            if predicted_days is None:
+                # Get prediction
+                X = np.array([row], dtype=np.float64)
+                predicted_days = self._model_outputs('gb_project_duration', store, X)[0]
+                self._prediction_cache.put(key, predicted_days)
 
         # Estimate confidence interval (using training error)
         mae = metrics.get('mae_days', 15)
@@ -398,7 +843,7 @@ class MLTrainer:
             },
             'confidence_level': 0.80,
             'model_info': {
-                'name': 'GradientBoostingRegressor',
+                'name': ModelStore.ESTIMATOR_NAMES.get(metrics.get('engine'), 'GradientBoostingRegressor'),
                 'r2_score': metrics.get('r2_score', 0),
                 'mae_days': metrics.get('mae_days', 0),
                 'rmse_days': metrics.get('rmse_days', 0),
@@ -408,77 +853,132 @@ class MLTrainer:
 
     def get_customer_segments(self) -> Dict:
         """Get customer segmentation analysis."""
-        model = self._models.get('kmeans_customers')
-        scaler = self._scalers.get('kmeans_customers')
-        metrics = self._metrics.get('kmeans_customers', {})
-
-        if model is None:
-            raise ValueError("Customer segmentation model not loaded")
-
-        # Load customer data
-        datasets_dir = settings.ML_DATASETS_DIR
-        data = pd.read_csv(datasets_dir / 'customers.csv')
+        # The file's size and mtime: hashing it would mean reading it all
+        key = (
+            'customer_segments', self._model_store.version,
+            self._datasets.file_signature('customers'),
+        )
+        return self._single_flight.do(key, self._customer_segments)
+
+    def _customer_segments(self) -> Dict:
+        with self._lease('kmeans_customers') as store:
+            model = store.model('kmeans_customers')
+            scaler = store.scaler('kmeans_customers')
+            metrics = store.metrics('kmeans_customers')
+
+            if model is None:
+                raise ValueError("Customer segmentation model not loaded")
+
+            if is_streaming('kmeans_customers', metrics):
+                # Customers are assigned once; only rows appended to the file are read
+                assignments = self._customer_assignments(store, model, scaler, metrics['chunk_rows'])
+                return self._segment_analysis(
+                    assignments.cluster_stats(), assignments.n_rows, metrics,
+                    assignments.sample.to_dict('records')
+                )
+
+            # Load customer data
+            data = self._datasets.get('customers')
+            cluster_features = metrics.get('feature_names', [])
+            X = data[cluster_features]
+            X_scaled = scaler.transform(X)
+            labels = model.predict(X_scaled)
+
+        # Calculate cluster statistics (assign copies, the shared frame stays intact)
+        data = data.assign(cluster=labels)
+        cluster_stats = {}
+        for cluster_id in range(4):
+            cluster_data = data[data['cluster'] == cluster_id]
+            cluster_stats[cluster_id] = {
+                'count': len(cluster_data),
+                'percentage': round(len(cluster_data) / len(data) * 100, 1),
+                'avg_revenue': round(cluster_data['total_revenue'].mean(), 2),
+                'avg_projects': round(cluster_data['num_projects'].mean(), 1),
+                'avg_tenure_months': round(cluster_data['months_as_customer'].mean(), 1),
+                'avg_payment_delay': round(cluster_data['payment_delay_avg_days'].mean(), 1),
+                'avg_satisfaction': round(cluster_data['communication_score'].mean(), 1),
+            }
 
-        cluster_features = metrics.get('feature_names', [])
-        X = data[cluster_features].copy()
-        X_scaled = scaler.transform(X)
-        labels = model.predict(X_scaled)
+        return self._segment_analysis(
+            cluster_stats, len(data), metrics,
+            data.to_dict('records')  # For scatter plot
+        )
 
-        # Calculate cluster statistics
-        data['cluster'] = labels
+    def _segment_analysis(self, cluster_stats: Dict[int, Dict], total_customers: int,
+                          metrics: Dict, raw_data: List[Dict]) -> Dict:
+        """Name the clusters by average revenue and describe each segment."""
         segments = []
 
         segment_names = ['VIP', 'Frecuente', 'Esporadico', 'Nuevo']
         segment_colors = ['#FFD700', '#4CAF50', '#FF9800', '#2196F3']
 
         # Sort clusters by average revenue to assign correct names
-        cluster_revenues = {}
-        for cluster_id in range(4):
-            cluster_data = data[data['cluster'] == cluster_id]
-            cluster_revenues[cluster_id] = cluster_data['total_revenue'].mean()
-
-        sorted_clusters = sorted(cluster_revenues.keys(), key=lambda x: cluster_revenues[x], reverse=True)
+        sorted_clusters = sorted(cluster_stats.keys(), key=lambda x: cluster_stats[x]['avg_revenue'], reverse=True)
 
         for idx, cluster_id in enumerate(sorted_clusters):
-            cluster_data = data[data['cluster'] == cluster_id]
+            stats = cluster_stats[cluster_id]
             segments.append({
                 'segment_id': idx,
                 'original_cluster_id': cluster_id,
                 'name': segment_names[idx],
-                'count': len(cluster_data),
-                'percentage': round(len(cluster_data) / len(data) * 100, 1),
+                'count': stats['count'],
+                'percentage': stats['percentage'],
                 'color': segment_colors[idx],
                 'characteristics': {
-                    'avg_revenue': round(cluster_data['total_revenue'].mean(), 2),
-                    'avg_projects': round(cluster_data['num_projects'].mean(), 1),
-                    'avg_tenure_months': round(cluster_data['months_as_customer'].mean(), 1),
-                    'avg_payment_delay': round(cluster_data['payment_delay_avg_days'].mean(), 1),
-                    'avg_satisfaction': round(cluster_data['communication_score'].mean(), 1),
+                    'avg_revenue': stats['avg_revenue'],
+                    'avg_projects': stats['avg_projects'],
+                    'avg_tenure_months': stats['avg_tenure_months'],
+                    'avg_payment_delay': stats['avg_payment_delay'],
+                    'avg_satisfaction': stats['avg_satisfaction'],
                 }
             })
 
         return {
-            'total_customers': len(data),
+            'total_customers': total_customers,
             'num_clusters': 4,
             'silhouette_score': metrics.get('silhouette_score', 0),
             'segments': segments,
-            'raw_data': data.to_dict('records')  # For scatter plot
+            'raw_data': raw_data  # For scatter plot
         }
 
+    def _customer_assignments(self, store: ModelStore, model: Any, scaler: Any,
+                              chunk_rows: int) -> SegmentAssignments:
+        """
+        Return the saved segment of every customer, assigning the new ones.
+
+        Customers appended to the dataset since the last call are read from
+        the end of the file, predicted and kept in memory with the store;
+        the others keep their segment. Only a retrain writes assignments
+        into a model version.
+        """
+        with self._assignment_lock:
+            assignments = SegmentAssignments.from_dict(store.assignments('kmeans_customers'))
+            updated = update_assignments(
+                assignments, self._datasets.path('customers'), model, scaler, chunk_rows
+            )
+            if updated is not assignments:
+                print(f"Customer segments updated ({updated.n_rows} customers assigned)")
+                store.keep_assignments('kmeans_customers', updated.to_dict())
+            return updated
+
     def predict_employee_turnover(self, features: Dict) -> Dict:
-        """Predict employee turnover probability."""
-        model = self._models.get('lr_turnover')
-        scaler = self._scalers.get('lr_turnover')
-        metrics = self._metrics.get('lr_turnover', {})
+        """
+        Predict employee turnover probability.
 
-        if model is None:
-            raise ValueError("Turnover model not loaded")
+        Raises:
+            SchemaError: If a required field is missing or a value is invalid.
+        """
+        row = TURNOVER_SCHEMA.row(features)
 
-        feature_names = metrics.get('feature_names', [])
-        X = pd.DataFrame([features])[feature_names]
-        X_scaled = scaler.transform(X)
+        with self._lease('lr_turnover') as store:
+            metrics = store.metrics('lr_turnover')
+            key = PredictionCache.make_key('lr_turnover', store.version, row)
+            probability = self._prediction_cache.get(key)
 
-        probability = model.predict_proba(X_scaled)[0][1]
+            if probability is None:
+                X = np.array([row], dtype=np.float64)
+                probability = self._model_outputs('lr_turnover', store, X)[0]
+                self._prediction_cache.put(key, probability)
 
         # Determine risk level
         if probability < 0.3:
@@ -491,18 +991,19 @@ class MLTrainer:
             risk_level = 'high'
             risk_color = '#F44336'
 
-        # Calculate risk factors
+        # Calculate risk factors from the validated values, not the raw payload
         coefficients = metrics.get('coefficients', {})
+        values = dict(zip(TURNOVER_SCHEMA.names, row))
         risk_factors = []
         for feature, coef in coefficients.items():
-            if feature in features:
-                contribution = coef * (features[feature] - 0) / 10  # Normalized contribution
+            if feature in values:
+                contribution = coef * (values[feature] - 0) / 10  # Normalized contribution
                 impact = 'high' if abs(contribution) > 0.15 else ('medium' if abs(contribution) > 0.08 else 'low')
                 if coef > 0 and contribution > 0.05:  # Only show factors that increase risk
                     risk_factors.append({
                         'factor': feature,
                         'impact': impact,
-                        'value': features[feature],
+                        'value': values[feature],
                         'contribution': round(contribution, 3)
                     })
 
@@ -525,18 +1026,18 @@ class MLTrainer:
 
     def get_turnover_overview(self) -> Dict:
         """Get turnover overview statistics."""
-        datasets_dir = settings.ML_DATASETS_DIR
-        data = pd.read_csv(datasets_dir / 'employees.csv')
+        data = self._datasets.get('employees')
 
-        model = self._models.get('lr_turnover')
-        scaler = self._scalers.get('lr_turnover')
-        metrics = self._metrics.get('lr_turnover', {})
+        with self._lease('lr_turnover') as store:
+            model = store.model('lr_turnover')
+            scaler = store.scaler('lr_turnover')
+            metrics = store.metrics('lr_turnover')
 
-        feature_names = metrics.get('feature_names', [])
-        X = data[feature_names]
-        X_scaled = scaler.transform(X)
+            feature_names = metrics.get('feature_names', [])
+            X = data[feature_names]
+            X_scaled = scaler.transform(X)
 
-        probabilities = model.predict_proba(X_scaled)[:, 1]
+            probabilities = model.predict_proba(X_scaled)[:, 1]
 
         high_risk = sum(probabilities >= 0.6)
         medium_risk = sum((probabilities >= 0.3) & (probabilities < 0.6))
@@ -556,16 +1057,189 @@ class MLTrainer:
                           current_stock: float, reorder_point: float,
                           lead_time_days: int) -> Dict:
         """Forecast inventory demand using ARIMA."""
-        from ml_api.datasets.generators import InventoryDataGenerator
+        key = (
+            'forecast_inventory', self._datasets.fingerprint('inventory_history'),
+            material_id, forecast_days, current_stock, reorder_point, lead_time_days,
+        )
+        return self._single_flight.do(key, lambda: self._forecast_inventory(
+            material_id, forecast_days, current_stock, reorder_point, lead_time_days
+        ))
 
-        datasets_dir = settings.ML_DATASETS_DIR
-        data = pd.read_csv(datasets_dir / 'inventory_history.csv')
+    def _forecast_inventory(self, material_id: int, forecast_days: int,
+                            current_stock: float, reorder_point: float,
+                            lead_time_days: int) -> Dict:
+        material_data, demand_series = self._material_history(material_id)
 
-        # Filter for specific material
-        material_data = data[data['material_id'] == material_id].copy()
-        if len(material_data) == 0:
+        # Fit ARIMA model, reusing a cached fit of the same history
+        try:
+            arima = self._cached_arima(material_id, demand_series)
+            if arima is None:
+                arima = self._extend_arima(material_id, demand_series) or fit_arima(demand_series)
+                self._store_arima(material_id, demand_series, arima)
+        except Exception:
+            arima = None
+
+        return self._build_forecast(
+            material_id, material_data, demand_series, arima,
+            forecast_days, current_stock, reorder_point, lead_time_days
+        )
+
+    def forecast_inventory_batch(self, requests: List[Dict], forecast_days: int) -> Dict:
+        """
+        Forecast inventory demand for many materials at once.
+
+        Cached and incrementally extended fits are served in-process; the
+        remaining ARIMA fits are spread over a bounded process pool.
+
+        Args:
+            requests: One dict per material with 'material_id' and optional
+                'current_stock', 'reorder_point' and 'lead_time_days'
+                (defaults come from the material's latest history row).
+            forecast_days: Days to forecast for every material.
+
+        Returns:
+            Dict with per-material 'results' and per-material 'errors'.
+        """
+        prepared = {}
+        errors = []
+        for request in requests:
+            material_id = request['material_id']
+            try:
+                material_data, demand_series = self._material_history(material_id)
+                latest = material_data.iloc[-1]
+                prepared[material_id] = {
+                    'material_data': material_data,
+                    'demand_series': demand_series,
+                    'current_stock': float(request.get('current_stock', latest['stock_level'])),
+                    'reorder_point': float(request.get('reorder_point', latest['reorder_point'])),
+                    'lead_time_days': int(request.get('lead_time_days', latest['lead_time_days'])),
+                    'arima': None,
+                }
+            except Exception as e:
+                errors.append({'material_id': material_id, 'error': str(e)})
+
+        # Resolve what we can without fitting, queue the rest for the pool
+        to_fit = []
+        for material_id, item in prepared.items():
+            arima = self._cached_arima(material_id, item['demand_series'])
+            if arima is None:
+                try:
+                    arima = self._extend_arima(material_id, item['demand_series'])
+                except Exception:
+                    arima = None
+                if arima is None:
+                    to_fit.append(material_id)
+                    continue
+                self._store_arima(material_id, item['demand_series'], arima)
+            item['arima'] = arima
+
+        if to_fit:
+            pool = self._get_forecast_pool()
+            futures = {
+                pool.submit(fit_arima, prepared[material_id]['demand_series']): material_id
+                for material_id in to_fit
+            }
+            for future in as_completed(futures):
+                material_id = futures[future]
+                item = prepared[material_id]
+                try:
+                    item['arima'] = future.result()
+                    self._store_arima(material_id, item['demand_series'], item['arima'])
+                except BrokenProcessPool as e:
+                    self._reset_forecast_pool()
+                    errors.append({'material_id': material_id, 'error': f'Worker failed: {e}'})
+                    item['failed'] = True
+                except Exception:
+                    # Same as the single forecast: fall back to a moving average
+                    item['arima'] = None
+
+        results = []
+        for material_id, item in prepared.items():
+            if item.get('failed'):
+                continue
+            try:
+                forecast = self._build_forecast(
+                    material_id, item['material_data'], item['demand_series'], item['arima'],
+                    forecast_days, item['current_stock'], item['reorder_point'],
+                    item['lead_time_days']
+                )
+                del forecast['historical']
+                results.append(forecast)
+            except Exception as e:
+                errors.append({'material_id': material_id, 'error': str(e)})
+
+        return {'results': results, 'errors': errors}
+
+    def get_inventory_material_ids(self) -> List[int]:
+        """Return the ids of all materials present in the inventory history."""
+        return self._datasets.inventory_index().material_ids()
+
+    def _material_history(self, material_id: int) -> Tuple[pd.DataFrame, np.ndarray]:
+        """Return a material's history sorted by date and its demand series."""
+        index = self._datasets.inventory_index()
+        if material_id not in index:
             raise ValueError(f"No data found for material_id {material_id}")
 
+        return index.history(material_id), index.series(material_id, 'daily_demand')
+
+    def _cached_arima(self, material_id: int, demand_series: np.ndarray) -> Optional[Dict]:
+        """Return the cached fit for exactly this history, if any."""
+        return self._arima_cache.get(ARIMACache.make_key(material_id, demand_series, ARIMA_ORDER))
+
+    def _store_arima(self, material_id: int, demand_series: np.ndarray, arima: Dict):
+        """Cache a fit under its material and history fingerprint."""
+        self._arima_cache.put(ARIMACache.make_key(material_id, demand_series, ARIMA_ORDER), arima)
+
+    def _extend_arima(self, material_id: int, demand_series: np.ndarray) -> Optional[Dict]:
+        """
+        Append new observations to the material's last fit.
+
+        Returns None when there is no fit whose history is a prefix of
+        demand_series, or when the refit policy asks for a full refit.
+        """
+        previous = self._arima_cache.latest(material_id, ARIMA_ORDER)
+        if previous is None:
+            return None
+
+        (_, fingerprint, _), arima = previous
+        n_obs = arima['n_obs']
+        # Only a pure extension of the fitted history can be appended
+        if (len(demand_series) <= n_obs or
+                ARIMACache.fingerprint(demand_series[:n_obs]) != fingerprint):
+            return None
+
+        extended = append_arima(arima, demand_series)
+        if self._arima_refit_policy.needs_refit(extended):
+            return None
+        return extended
+
+    @classmethod
+    def _get_forecast_pool(cls) -> ProcessPoolExecutor:
+        """Return the shared process pool used for ARIMA fits."""
+        with cls._forecast_pool_lock:
+            if cls._forecast_pool is None:
+                # spawn keeps workers independent of the server's threads
+                cls._forecast_pool = ProcessPoolExecutor(
+                    max_workers=settings.ML_FORECAST_MAX_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return cls._forecast_pool
+
+    @classmethod
+    def _reset_forecast_pool(cls):
+        """Discard a broken process pool so the next batch starts a new one."""
+        with cls._forecast_pool_lock:
+            if cls._forecast_pool is not None:
+                cls._forecast_pool.shutdown(wait=False, cancel_futures=True)
+                cls._forecast_pool = None
+
+    def _build_forecast(self, material_id: int, material_data: pd.DataFrame,
+                        demand_series: np.ndarray, arima: Optional[Dict],
+                        forecast_days: int, current_stock: float,
+                        reorder_point: float, lead_time_days: int) -> Dict:
+        """Turn a fitted ARIMA (or the moving-average fallback) into a forecast."""
+        from ml_api.datasets.generators import InventoryDataGenerator
+
         material_info = InventoryDataGenerator().get_material_info(material_id)
         if material_info is None:
             material_info = {
@@ -574,24 +1248,18 @@ class MLTrainer:
                 'unit_cost': 100.0
             }
 
-        # Prepare time series
-        material_data = material_data.sort_values('date')
-        demand_series = material_data['daily_demand'].values
-
-        # Fit ARIMA model
         try:
-            model = ARIMA(demand_series, order=(2, 1, 2))
-            fitted = model.fit()
+            if arima is None:
+                raise ValueError("ARIMA fit not available")
 
             # Forecast
-            forecast_result = fitted.get_forecast(steps=forecast_days)
+            forecast_result = arima['fitted'].get_forecast(steps=forecast_days)
             forecast_mean = forecast_result.predicted_mean
             forecast_conf = forecast_result.conf_int(alpha=0.05)
 
             # Calculate metrics
-            residuals = fitted.resid
-            mae = np.mean(np.abs(residuals))
-            mape = np.mean(np.abs(residuals / (demand_series[1:] + 1))) * 100
+            mae = arima['mae']
+            mape = arima['mape']
 
         except Exception as e:
             # Fallback to simple moving average
@@ -657,96 +1325,103 @@ class MLTrainer:
                 'mae': round(mae, 2),
             },
             'daily_forecast': daily_forecast,
-            'historical': material_data.tail(90).to_dict('records'),
+            'historical': material_data.tail(90).assign(
+                date=lambda history: history['date'].dt.strftime('%Y-%m-%d')
+            ).to_dict('records'),
         }
 
     def get_inventory_overview(self) -> Dict:
         """Get inventory overview with alerts."""
-        from ml_api.datasets.generators import InventoryDataGenerator
+        index = self._datasets.inventory_index()
+
+        # Per-material aggregates for all materials at once, in ids order
+        current_stock = index.last('stock_level').astype(np.float64)
+        avg_demand = index.mean('daily_demand')
+        has_demand = avg_demand > 0
+        stock_days = np.divide(
+            current_stock, avg_demand, out=np.full(len(avg_demand), 999.0), where=has_demand
+        )
+        names = index.last('material_name')
+        unit_costs = index.last('unit_cost').astype(np.float64)
 
-        datasets_dir = settings.ML_DATASETS_DIR
-        data = pd.read_csv(datasets_dir / 'inventory_history.csv')
-        inv_gen = InventoryDataGenerator()
+        stockout_imminent = stock_days < 5
+        low_stock = ~stockout_imminent & (stock_days < 15)
+        current_stock = np.round(current_stock, 2)
+        total_value = sum((current_stock * unit_costs).tolist())
 
         alerts = []
         material_summaries = []
 
-        for material_id in data['material_id'].unique():
-            material_data = data[data['material_id'] == material_id]
-            material_info = inv_gen.get_material_info(material_id)
+        for i, material_id in enumerate(index.ids):
+            # Materials without demand keep the integer sentinel
+            days = round(stock_days[i], 1) if has_demand[i] else 999
 
-            latest = material_data.iloc[-1]
-            avg_demand = material_data['daily_demand'].mean()
-            stock_days = latest['stock_level'] / avg_demand if avg_demand > 0 else 999
-
-            if stock_days < 5:
+            if stockout_imminent[i]:
                 alerts.append({
                     'material_id': material_id,
-                    'material_name': material_info['name'],
+                    'material_name': names[i],
                     'alert_type': 'stockout_imminent',
-                    'days_until_stockout': round(stock_days, 1),
-                    'recommended_action': f"Ordenar urgentemente"
+                    'days_until_stockout': days,
+                    'recommended_action': "Ordenar urgentemente"
                 })
-            elif stock_days < 15:
+            elif low_stock[i]:
                 alerts.append({
                     'material_id': material_id,
-                    'material_name': material_info['name'],
+                    'material_name': names[i],
                     'alert_type': 'low_stock',
-                    'current_stock_days': round(stock_days, 1),
+                    'current_stock_days': days,
                     'recommended_action': "Planificar reorden"
                 })
 
             material_summaries.append({
                 'material_id': material_id,
-                'name': material_info['name'],
-                'current_stock': round(latest['stock_level'], 2),
-                'avg_daily_demand': round(avg_demand, 2),
-                'stock_days': round(stock_days, 1),
-                'unit_cost': material_info['unit_cost'],
+                'name': names[i],
+                'current_stock': current_stock[i],
+                'avg_daily_demand': round(avg_demand[i], 2),
+                'stock_days': days,
+                'unit_cost': unit_costs[i],
             })
 
-        total_value = sum(
-            m['current_stock'] * m['unit_cost'] for m in material_summaries
-        )
-
         return {
             'materials_analyzed': len(material_summaries),
             'alerts': alerts,
             'summary': {
                 'total_inventory_value': round(total_value, 2),
-                'items_below_reorder': len([a for a in alerts if a['alert_type'] == 'low_stock']),
-                'items_at_risk': len([a for a in alerts if a['alert_type'] == 'stockout_imminent']),
+                'items_below_reorder': int(low_stock.sum()),
+                'items_at_risk': int(stockout_imminent.sum()),
             },
             'materials': material_summaries,
         }
 
     def get_dashboard(self) -> Dict:
         """Get dashboard summary of all models."""
+        # One store for the whole summary, even if a new version is published meanwhile
+        store = self._model_store
         return {
             'models_status': [
                 {
                     'name': 'Prediccion de Costos',
                     'model': 'Random Forest',
-                    'status': 'active' if 'rf_project_cost' in self._models else 'inactive',
-                    'accuracy': f"R²: {self._metrics.get('rf_project_cost', {}).get('r2_score', 0)}",
+                    'status': 'active' if self.model_state('rf_project_cost') == 'ready' else 'inactive',
+                    'accuracy': f"R²: {store.metrics('rf_project_cost').get('r2_score', 0)}",
                 },
                 {
                     'name': 'Prediccion de Duracion',
                     'model': 'Gradient Boosting',
-                    'status': 'active' if 'gb_project_duration' in self._models else 'inactive',
-                    'accuracy': f"R²: {self._metrics.get('gb_project_duration', {}).get('r2_score', 0)}",
+                    'status': 'active' if self.model_state('gb_project_duration') == 'ready' else 'inactive',
+                    'accuracy': f"R²: {store.metrics('gb_project_duration').get('r2_score', 0)}",
                 },
                 {
                     'name': 'Segmentacion Clientes',
                     'model': 'K-Means',
-                    'status': 'active' if 'kmeans_customers' in self._models else 'inactive',
-                    'accuracy': f"Silhouette: {self._metrics.get('kmeans_customers', {}).get('silhouette_score', 0)}",
+                    'status': 'active' if self.model_state('kmeans_customers') == 'ready' else 'inactive',
+                    'accuracy': f"Silhouette: {store.metrics('kmeans_customers').get('silhouette_score', 0)}",
                 },
                 {
                     'name': 'Rotacion Personal',
                     'model': 'Logistic Regression',
-                    'status': 'active' if 'lr_turnover' in self._models else 'inactive',
-                    'accuracy': f"AUC: {self._metrics.get('lr_turnover', {}).get('auc_roc', 0)}",
+                    'status': 'active' if self.model_state('lr_turnover') == 'ready' else 'inactive',
+                    'accuracy': f"AUC: {store.metrics('lr_turnover').get('auc_roc', 0)}",
                 },
                 {
                     'name': 'Forecast Inventario',
@@ -755,15 +1430,207 @@ class MLTrainer:
                     'accuracy': 'Dinamico',
                 },
             ],
-            'all_metrics': self._metrics,
+            'model_version': store.version,
+            'micro_batching': {
+                name: batcher.stats() for name, batcher in self._micro_batchers.items()
+            },
+            'all_metrics': store.all_metrics(),
+            'cache_stats': {
+                'arima': self._arima_cache.stats(),
+                'predictions': self._prediction_cache.stats(),
+                'single_flight': self._single_flight.stats(),
+            },
         }
 
-    def retrain_all(self) -> Dict:
-        """Retrain all models with fresh data."""
-        self._models = {}
-        self._scalers = {}
-        self._metrics = {}
-        self._initialized = False
-        self._train_all_models()
-        self._initialized = True
+    def clear_forecast_cache(self):
+        """Forget fitted ARIMA models, e.g. after the inventory history changes."""
+        self._arima_cache.clear()
+
+    def save_datasets(self, datasets: Dict[str, pd.DataFrame]) -> List[str]:
+        """
+        Write generated datasets, skipping the files whose content is unchanged.
+
+        Returns:
+            The datasets that changed.
+        """
+        changed = [name for name, data in datasets.items() if self._datasets.write(name, data)]
+        print(f"Datasets changed: {', '.join(changed) or 'none'}")
+        self.datasets_regenerated(changed)
+        return changed
+
+    def datasets_regenerated(self, changed: Optional[List[str]] = None):
+        """
+        Record freshly written datasets; cached forecasts used the old history.
+
+        Args:
+            changed: Datasets whose content changed (all of them by default).
+        """
+        if changed is None or 'inventory_history' in changed:
+            self.clear_forecast_cache()
+        self._set_state('datasets', 'ready')
+
+    def retrain_all(self, mode: str = 'full') -> Dict:
+        """Retrain all models with fresh data, waiting for the job to finish."""
+        job, _ = self.start_retrain_job(mode)
+        job.wait()
+        if job.status != 'succeeded':
+            raise RuntimeError(job.error or 'Retrain failed')
         return {'success': True, 'message': 'All models retrained successfully'}
+
+    def start_retrain_job(self, mode: str = 'full') -> Tuple[Job, bool]:
+        """
+        Start retraining in the background; the current models keep serving.
+
+        Args:
+            mode: 'full' or 'incremental' (see _train_new_version).
+
+        Returns:
+            (job, created). While a retrain is queued or running, in this
+            worker or another one, requests for the same mode join that job
+            instead of starting another (created=False).
+
+        Raises:
+            ValueError: For an unknown mode.
+            JobConflict: If the active retrain runs in the other mode.
+        """
+        if mode not in self.RETRAIN_MODES:
+            raise ValueError(f"Unknown retrain mode: {mode}")
+        return self._jobs.submit(
+            'retrain', lambda job: self._run_retrain(job, mode), self.RETRAIN_STAGES,
+            params={'mode': mode}
+        )
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """Return a background job by id."""
+        return self._jobs.get(job_id)
+
+    def _run_retrain(self, job: Job, mode: str = 'full') -> Dict:
+        """
+        Retrain in a separate low-priority process, then swap the new models in.
+
+        Training runs outside the server process so it never holds the GIL
+        the request threads need; its stage events are relayed to the job.
+        """
+        with self._training_lock:
+            context = multiprocessing.get_context('spawn')
+            events = context.Queue()
+            process = context.Process(
+                target=_retrain_process, name='ml-retrain',
+                args=(str(settings.ML_MODELS_DIR), str(settings.ML_DATASETS_DIR), events, mode),
+            )
+            process.start()
+
+            error = None
+            while True:
+                try:
+                    event = events.get(timeout=0.5)
+                except queue.Empty:
+                    if process.is_alive():
+                        continue
+                    error = f'Retrain process exited with code {process.exitcode}'
+                    break
+                if event[0] == 'started':
+                    job.stage_started(event[1])
+                elif event[0] == 'finished':
+                    job.stage_finished(event[1], metrics=event[2], error=event[3])
+                elif event[0] == 'skipped':
+                    job.stage_skipped(event[1], reason=event[2])
+                elif event[0] == 'done':
+                    error = event[1]
+                    break
+            process.join()
+            if error:
+                raise RuntimeError(error)
+
+            job.stage_started('reload')
+            self._reload_models()
+            job.stage_finished('reload')
+
+        return {
+            'version': self._model_store.version,
+            'metrics': self._model_store.all_metrics(),
+            'skipped': [
+                stage for stage, info in job.to_dict()['stages'].items() if info.get('status') == 'skipped'
+            ],
+        }
+
+    def model_version(self) -> Optional[str]:
+        """Return the model version currently being served."""
+        return self._model_store.version
+
+    def model_versions(self) -> List[Dict[str, Any]]:
+        """List the stored model versions, flagging the active one."""
+        return self._registry.versions()
+
+    def rollback_models(self, version: Optional[str] = None) -> str:
+        """
+        Serve an older model version again (the previous one by default).
+
+        Raises:
+            ValueError: If the version does not exist or there is no previous one.
+        """
+        # Not behind the training lock: a rollback must not wait for a retrain
+        version = self._registry.rollback(version)
+        self._reload_models()
+        print(f"Rolled back to model version {version}")
+        return version
+
+    def _reload_models(self):
+        """Load and warm the active version, then swap it in at once."""
+        with self._swap_lock:
+            store = self._registry.open()
+            if store.version == self._model_store.version:
+                # Already swapped in, e.g. by the version watcher
+                return
+            for name in ModelStore.MODELS:
+                self._warm_model(name, store)
+            # Requests keep using the old store until this single assignment
+            old_store = self._model_store
+            MLTrainer._model_store = store
+            self._retire(old_store)
+            # Keys carry the version, so this only frees the old entries early
+            self._prediction_cache.clear()
+            self.clear_forecast_cache()
+            for name in self.BOOTSTRAP_RESOURCES:
+                self._set_state(name, 'ready')
+
+    def _retire(self, store: ModelStore):
+        """Release a replaced store once its in-flight requests have finished."""
+        def release():
+            if not store.wait_idle(settings.ML_MODEL_RETIRE_TIMEOUT):
+                print(f"Model version {store.version} still in use: {store.in_flight()}")
+            store.clear()
+
+        threading.Thread(target=release, name='ml-retire', daemon=True).start()
+
+
+def _training_context() -> multiprocessing.context.BaseContext:
+    """
+    Return the multiprocessing context for training workers.
+
+    A forkserver that has already imported the training module forks warm
+    workers, so each retrain does not pay for importing scikit-learn again
+    in every worker. Both it and spawn keep workers independent of the
+    server's threads.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['ml_api.services.training'])
+    return context
+
+
+def _retrain_process(models_dir: str, datasets_dir: str, events, mode: str = 'full'):
+    """Entry point of the retrain process: train everything, report progress."""
+    settings.ML_MODELS_DIR = Path(models_dir)
+    settings.ML_DATASETS_DIR = Path(datasets_dir)
+    # Leave the CPU to the server's request workers first
+    os.nice(settings.ML_RETRAIN_NICENESS)
+
+    trainer = MLTrainer()
+    trainer._progress = events.put
+    try:
+        trainer._train_new_version(mode)
+        events.put(('done', None))
+    except Exception as e:
+        events.put(('done', str(e)))
@@ -0,0 +1,197 @@
+"""
+Model Registry Service - Versioned storage of trained model artifacts.
+
+Every training run writes a complete set of artifacts into its own version
+directory. A version only becomes active when the CURRENT pointer file is
+atomically replaced, so a crashed or half-finished run is never served,
+and rolling back is just pointing CURRENT at an older version again.
+Models saved directly in the models directory (the original flat layout)
+are exposed as the 'legacy' version.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from ml_api.services.model_store import ModelStore, atomic_write
+
+
+class ModelRegistry:
+    """Version directories plus an atomically swapped CURRENT pointer."""
+
+    LEGACY_VERSION = 'legacy'
+    POINTER_FILE = 'CURRENT'
+    VERSIONS_DIR = 'versions'
+
+    def __init__(self, models_dir: Optional[Path] = None, keep: Optional[int] = None,
+                 grace: Optional[float] = None):
+        """
+        Args:
+            models_dir: Root directory of the artifacts. Defaults to
+                settings.ML_MODELS_DIR, resolved on every access.
+            keep: Version directories kept when pruning (the active and
+                previous versions are always kept). Defaults to
+                settings.ML_MODEL_VERSIONS_KEEP.
+            grace: Seconds a version stays on disk after it was last
+                active. Defaults to settings.ML_MODEL_PRUNE_GRACE_SECONDS.
+        """
+        self._models_dir = models_dir
+        self._keep = keep
+        self._grace = grace
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        return Path(self._models_dir or settings.ML_MODELS_DIR)
+
+    def current(self) -> Optional[str]:
+        """Return the active version, or None if nothing was trained yet."""
+        pointer = self._read_pointer()
+        if pointer is not None:
+            return pointer['version']
+        if self._has_legacy():
+            return self.LEGACY_VERSION
+        return None
+
+    def previous(self) -> Optional[str]:
+        """Return the version that was active before the current one."""
+        pointer = self._read_pointer()
+        return pointer.get('previous') if pointer else None
+
+    def path(self, version: str) -> Path:
+        """Return the directory holding a version's artifacts."""
+        if version == self.LEGACY_VERSION:
+            return self.root
+        return self.root / self.VERSIONS_DIR / version
+
+    def open(self, version: Optional[str] = None) -> ModelStore:
+        """Return a model store over a version (the active one by default)."""
+        version = version or self.current() or self.LEGACY_VERSION
+        return ModelStore(self.path(version), version=version)
+
+    def create_version(self) -> str:
+        """Create an empty, unpublished version directory and return its id."""
+        version = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.path(version).mkdir(parents=True)
+        return version
+
+    def publish(self, version: str):
+        """Make a version active with a single atomic pointer replace."""
+        if not self.exists(version):
+            raise ValueError(f"Unknown model version: {version}")
+
+        with self._lock:
+            current = self.current()
+            if current == version:
+                return
+            # A version directory's mtime records when it was last active,
+            # which is what pruning measures the grace period from
+            for name in (current, version):
+                self._touch(name)
+            self._write_pointer({
+                'version': version,
+                'previous': current,
+                'published_at': datetime.now().isoformat(),
+            })
+        self._prune()
+
+    def discard(self, version: str):
+        """Delete an unpublished version, e.g. a retrain that changed nothing."""
+        if version in (self.LEGACY_VERSION, self.current(), self.previous()):
+            raise ValueError(f"Cannot discard model version: {version}")
+        shutil.rmtree(self.path(version), ignore_errors=True)
+
+    def rollback(self, version: Optional[str] = None) -> str:
+        """Re-activate an older version (the previous one by default)."""
+        target = version or self.previous()
+        if target is None:
+            raise ValueError("No previous model version to roll back to")
+        self.publish(target)
+        return target
+
+    def exists(self, version: str) -> bool:
+        """Return True if a version has a complete set of artifacts."""
+        if version == self.LEGACY_VERSION:
+            return self._has_legacy()
+        if Path(version).name != version or version in ('.', '..'):
+            return False
+        return self.open(version).all_available()
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """List complete versions, oldest first, flagging the active one."""
+        current = self.current()
+        previous = self.previous()
+        names = []
+        if self._has_legacy():
+            names.append(self.LEGACY_VERSION)
+        versions_dir = self.root / self.VERSIONS_DIR
+        if versions_dir.exists():
+            names.extend(sorted(
+                path.name for path in versions_dir.iterdir()
+                if path.is_dir() and self.exists(path.name)
+            ))
+        return [
+            {'version': name, 'active': name == current, 'previous': name == previous}
+            for name in names
+        ]
+
+    def _has_legacy(self) -> bool:
+        return ModelStore(self.root).all_available()
+
+    def _read_pointer(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self.root / self.POINTER_FILE).read_text())
+        except FileNotFoundError:
+            return None
+
+    def _write_pointer(self, pointer: Dict[str, Any]):
+        def write(tmp_path: Path):
+            with open(tmp_path, 'w') as f:
+                json.dump(pointer, f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Readers see either the old pointer or the new one, never a mix
+        atomic_write(self.root / self.POINTER_FILE, write)
+
+    def _touch(self, version: Optional[str]):
+        if version is None or version == self.LEGACY_VERSION:
+            return
+        try:
+            os.utime(self.path(version))
+        except FileNotFoundError:
+            pass
+
+    def _prune(self):
+        """Delete the oldest version directories beyond the retention limit.
+
+        Other workers only notice a new CURRENT on their next poll and load
+        models lazily, so a version that was active less than the grace
+        period ago may still be read from and is kept.
+        """
+        keep = self._keep if self._keep is not None else settings.ML_MODEL_VERSIONS_KEEP
+        grace = self._grace if self._grace is not None else settings.ML_MODEL_PRUNE_GRACE_SECONDS
+        versions_dir = self.root / self.VERSIONS_DIR
+        if not versions_dir.exists():
+            return
+
+        protected = {self.current(), self.previous()}
+        cutoff = time.time() - grace
+        names = sorted(path.name for path in versions_dir.iterdir() if path.is_dir())
+        for name in names[:max(0, len(names) - keep)]:
+            if name in protected:
+                continue
+            try:
+                if (versions_dir / name).stat().st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            # Files a process already opened (or memory-mapped) stay readable
+            shutil.rmtree(versions_dir / name, ignore_errors=True)
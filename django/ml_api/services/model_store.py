@@ -0,0 +1,293 @@
+"""
+Model Store Service - Loads trained model artifacts lazily.
+
+Nothing is read at startup; each model, scaler and metrics file is loaded
+the first time a request needs it. Tree ensembles are served from their
+compiled flat arrays, saved uncompressed next to the model and opened
+memory-mapped, so the large node arrays are shared read-only pages across
+worker processes instead of a private copy per worker.
+
+A store holds one model version and is never swapped piecemeal. Requests
+lease it per model while they use it; the in-flight counts tell when a
+replaced version is no longer used and can be released.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import joblib
+from django.conf import settings
+
+from ml_api.services.compiled_trees import CompiledTreeEnsemble
+
+
+def atomic_write(path: Path, write: Callable[[Path], None]):
+    """
+    Replace a file atomically: readers see the old file or the new one.
+
+    write(tmp_path) fills a temporary file next to path, which then
+    replaces it; the temporary file is removed if writing fails.
+    """
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class ModelStore:
+    """Lazy, thread-safe access to the trained models on disk."""
+
+    MODELS = ('rf_project_cost', 'gb_project_duration', 'kmeans_customers', 'lr_turnover')
+
+    # Tree ensembles served through the compiled flat-array engine
+    COMPILED_MODELS = ('rf_project_cost', 'gb_project_duration')
+
+    # Training engines (recorded in the metrics) whose estimator predicts
+    # directly: histogram trees use categorical bitset splits the compiled
+    # engine does not handle, and predict fast on their own
+    NATIVE_ENGINES = ('hist_gradient_boosting',)
+
+    # Estimator class of each training engine, for display
+    ESTIMATOR_NAMES = {
+        'gradient_boosting': 'GradientBoostingRegressor',
+        'hist_gradient_boosting': 'HistGradientBoostingRegressor',
+    }
+
+    def __init__(self, models_dir: Optional[Path] = None, version: Optional[str] = None):
+        """
+        Args:
+            models_dir: Directory holding the .joblib artifacts. Defaults to
+                settings.ML_MODELS_DIR, resolved on every access.
+            version: Registry version these artifacts belong to, if any.
+        """
+        self._models_dir = models_dir
+        self.version = version
+        self._models: Dict[str, Any] = {}
+        self._scalers: Dict[str, Any] = {}
+        self._metrics: Dict[str, Dict] = {}
+        self._compiled: Dict[str, CompiledTreeEnsemble] = {}
+        self._assignments: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+        self._in_flight: Dict[str, int] = {}
+        self._idle = threading.Condition(threading.Lock())
+
+    def acquire(self, name: str):
+        """Count one more request using a model of this store."""
+        with self._idle:
+            self._in_flight[name] = self._in_flight.get(name, 0) + 1
+
+    def release(self, name: str):
+        """Count a request using a model of this store as finished."""
+        with self._idle:
+            self._in_flight[name] -= 1
+            if not any(self._in_flight.values()):
+                self._idle.notify_all()
+
+    def in_flight(self) -> Dict[str, int]:
+        """Return the requests currently using each model."""
+        with self._idle:
+            return {name: count for name, count in self._in_flight.items() if count}
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no request uses this store; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not any(self._in_flight.values()), timeout)
+
+    def available(self, name: str) -> bool:
+        """Return True if the model is loaded or its artifact is on disk."""
+        return name in self._models or self._path(name).exists()
+
+    def all_available(self) -> bool:
+        """Return True if every model can be served without training."""
+        return all(self.available(name) for name in self.MODELS)
+
+    def loaded(self) -> Dict[str, bool]:
+        """Return which models are currently held in memory."""
+        return {
+            name: name in self._models or name in self._compiled
+            for name in self.MODELS
+        }
+
+    def model(self, name: str) -> Optional[Any]:
+        """Return the fitted estimator, loading it on first use."""
+        return self._load(self._models, name, self._path(name))
+
+    def scaler(self, name: str) -> Optional[Any]:
+        """Return the model's scaler, or None if it has none."""
+        return self._load(self._scalers, name, self._path(name, '_scaler'))
+
+    def metrics(self, name: str) -> Dict:
+        """Return the model's training metrics ({} if there are none)."""
+        return self._load(self._metrics, name, self._path(name, '_metrics')) or {}
+
+    def all_metrics(self) -> Dict[str, Dict]:
+        """Return the metrics of every available model."""
+        return {
+            name: self.metrics(name)
+            for name in self.MODELS
+            if self._path(name, '_metrics').exists() or name in self._metrics
+        }
+
+    def compilable(self, name: str) -> bool:
+        """Return True if the model is served through the compiled engine."""
+        return (name in self.COMPILED_MODELS
+                and self.metrics(name).get('engine') not in self.NATIVE_ENGINES)
+
+    def compiled(self, name: str) -> Optional[CompiledTreeEnsemble]:
+        """
+        Return the compiled ensemble, memory-mapped from disk.
+
+        The compiled artifact records a hash of the model file it was built
+        from; if it is missing or stale it is rebuilt from the estimator and
+        saved, so later workers can map it directly.
+        """
+        compiled = self._compiled.get(name)
+        if compiled is not None:
+            return compiled
+
+        with self._lock:
+            compiled = self._compiled.get(name)
+            if compiled is not None:
+                return compiled
+
+            model_path = self._path(name)
+            if not model_path.exists():
+                return None
+
+            compiled_path = self._path(name, '_compiled')
+            source = self._file_fingerprint(model_path)
+            state = None
+            if compiled_path.exists():
+                state = joblib.load(compiled_path, mmap_mode='r')
+                if state.pop('source', None) != source:
+                    state = None
+
+            if state is None:
+                # Unpickled only to compile; the estimator itself is not kept
+                estimator = joblib.load(model_path)
+                self._save_compiled(name, CompiledTreeEnsemble.from_sklearn(estimator), source)
+                state = joblib.load(compiled_path, mmap_mode='r')
+                state.pop('source')
+
+            compiled = CompiledTreeEnsemble.from_dict(state)
+            self._compiled[name] = compiled
+            return compiled
+
+    def assignments(self, name: str) -> Optional[Dict]:
+        """
+        Return the model's saved per-row assignments, or None if it has none.
+
+        They are saved uncompressed and their arrays memory-mapped, like the
+        compiled trees.
+        """
+        assignments = self._assignments.get(name)
+        if assignments is not None:
+            return assignments
+        with self._lock:
+            if name not in self._assignments:
+                path = self._path(name, '_assignments')
+                if not path.exists():
+                    return None
+                self._assignments[name] = joblib.load(path, mmap_mode='r')
+            return self._assignments[name]
+
+    def save_assignments(self, name: str, assignments: Dict):
+        """Save the model's per-row assignments, replacing the previous ones."""
+        with self._lock:
+            self._dump(assignments, self._path(name, '_assignments'))
+            self._assignments[name] = assignments
+
+    def keep_assignments(self, name: str, assignments: Dict):
+        """
+        Serve updated per-row assignments from memory only.
+
+        A published version is never rewritten: the saved artifact stays as
+        trained, and clear() falls back to it.
+        """
+        with self._lock:
+            self._assignments[name] = assignments
+
+    def save(self, name: str, model: Any, metrics: Dict, scaler: Optional[Any] = None):
+        """Save model, metrics, and optional scaler to disk and serve them."""
+        with self._lock:
+            model_path = self._path(name)
+            self._dump(model, model_path)
+            self._dump(metrics, self._path(name, '_metrics'))
+            if scaler is not None:
+                self._dump(scaler, self._path(name, '_scaler'))
+
+            self._models[name] = model
+            self._metrics[name] = metrics
+            if scaler is not None:
+                self._scalers[name] = scaler
+
+            self._compiled.pop(name, None)
+            if self.compilable(name):
+                self._save_compiled(
+                    name, CompiledTreeEnsemble.from_sklearn(model),
+                    self._file_fingerprint(model_path)
+                )
+
+    def reuse(self, name: str, source: 'ModelStore'):
+        """
+        Take over another store's artifacts of a model as they are.
+
+        Files are hard-linked when possible: artifacts are only ever
+        replaced, never modified in place, so sharing them is safe.
+        """
+        def share(source_path: Path, tmp_path: Path):
+            try:
+                os.link(source_path, tmp_path)
+            except OSError:
+                shutil.copy2(source_path, tmp_path)
+
+        with self._lock:
+            for suffix in ('', '_metrics', '_scaler', '_compiled', '_assignments'):
+                source_path = source._path(name, suffix)
+                if source_path.exists():
+                    atomic_write(self._path(name, suffix),
+                                 lambda tmp_path: share(source_path, tmp_path))
+
+    def clear(self):
+        """Forget every loaded artifact; the next access reads from disk."""
+        with self._lock:
+            self._models.clear()
+            self._scalers.clear()
+            self._metrics.clear()
+            self._compiled.clear()
+            self._assignments.clear()
+
+    def _load(self, cache: Dict[str, Any], name: str, path: Path) -> Optional[Any]:
+        """Return cache[name], loading it from path on first access."""
+        if name in cache:
+            return cache[name]
+        with self._lock:
+            if name not in cache:
+                if not path.exists():
+                    return None
+                cache[name] = joblib.load(path)
+            return cache[name]
+
+    def _save_compiled(self, name: str, compiled: CompiledTreeEnsemble, source: str):
+        """Write the compiled arrays uncompressed so they can be memory-mapped."""
+        self._dump({**compiled.to_dict(), 'source': source}, self._path(name, '_compiled'))
+
+    @staticmethod
+    def _dump(obj: Any, path: Path):
+        """Write an artifact atomically: readers see the old file or the new one."""
+        atomic_write(path, lambda tmp_path: joblib.dump(obj, tmp_path))
+
+    def _path(self, name: str, suffix: str = '') -> Path:
+        models_dir = self._models_dir or settings.ML_MODELS_DIR
+        return Path(models_dir) / f'{name}{suffix}.joblib'
+
+    @staticmethod
+    def _file_fingerprint(path: Path) -> str:
+        """Return a content hash of an artifact file."""
+        return hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
@@ -0,0 +1,84 @@
+"""
+Prediction Cache Service - Reuses model outputs for repeated feature vectors.
+
+What-if forms send the same payloads over and over. A prediction depends
+only on the model version and the feature values, so outputs are keyed by
+(model, version, canonical features) and served without building a
+DataFrame or evaluating the model again. A new version never hits entries
+of an older one, and the cache is cleared whenever a version is published.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+
+class PredictionCache:
+    """Bounded, thread-safe LRU cache of model outputs with a time to live."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        """
+        Args:
+            max_size: Entries kept; the least recently used are evicted.
+            ttl: Seconds an entry stays valid (0 disables expiry).
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, version: Optional[str], row: Sequence[float]) -> Tuple:
+        """
+        Build the cache key for one feature row.
+
+        The row comes from the model's FeatureSchema (floats in training
+        order), so payloads that differ only in key order or in types
+        (True vs 1 vs 1.0) share an entry.
+        """
+        return (model, version, tuple(row))
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached output for key, marking it most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        """Store an output, evicting the least recently used beyond max_size."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached output."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,90 @@
+"""
+Single Flight Service - Coalesces identical concurrent computations.
+
+When several requests ask for the same expensive result at the same time
+(a forecast for one material, the customer segmentation), only the first
+one computes it; the others wait for that computation and share its
+result. Nothing is kept once the computation finishes, so this is not a
+cache: it only removes duplicate work that is in flight simultaneously.
+"""
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """One in-flight computation and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.seconds = 0.0
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.saved_seconds = 0.0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Return fn(), sharing one call among concurrent callers with the same key.
+
+        Callers may mutate what they get: when a result is shared, every
+        caller receives its own deep copy. If the computation raises, every
+        waiting caller raises the same exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                self.coalesced += 1
+                self.saved_seconds += call.seconds
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        start = time.perf_counter()
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.seconds = time.perf_counter() - start
+            with self._lock:
+                # No caller can join once the call is removed
+                del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+
+        # Waiters copy call.result, so the leader must not get the same object
+        return copy.deepcopy(call.result) if shared else call.result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return computations run, callers served by a shared one and time saved."""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'saved_seconds': round(self.saved_seconds, 3),
+            }
@@ -0,0 +1,307 @@
+"""
+Streaming Segmentation Service - Mini-batch K-Means over customers on disk.
+
+Full-batch K-Means holds the whole customer matrix in memory and fits it
+n_init times, and the segmentation analysis scaled and predicted every
+customer again on each request. In streaming mode the scaler and the
+centroids are fitted with partial_fit over chunks read from the CSV, and a
+last pass assigns every customer to a cluster. The assignments are saved
+with the model, together with running per-cluster sums, so the analysis
+reads them instead of predicting; customers appended to the CSV later are
+assigned on their own, without touching the existing ones.
+
+Assignments remember where their rows end in the file, so only the bytes
+appended since are read: the file is never loaded as a whole.
+"""
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+from ml_api.services.training import (
+    CUSTOMER_CLUSTER_FEATURES, SEGMENTATION_CHUNK_ROWS, TrainingResult,
+    build_customer_segmentation_model, data_fingerprint
+)
+
+# Column identifying a customer
+ID_COLUMN = 'customer_id'
+
+# Customers kept as a uniform sample for the silhouette score and the scatter plot
+SAMPLE_ROWS = 2000
+
+# Bytes before the end of the assigned rows hashed to tell an appended file from a rewritten one
+TAIL_BYTES = 4096
+
+# Per-cluster averages in the statistics: key -> (column, decimals)
+CLUSTER_AVERAGES = {
+    'avg_revenue': ('total_revenue', 2),
+    'avg_projects': ('num_projects', 1),
+    'avg_tenure_months': ('months_as_customer', 1),
+    'avg_payment_delay': ('payment_delay_avg_days', 1),
+    'avg_satisfaction': ('communication_score', 1),
+}
+
+
+def read_chunks(path: Path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Yield the ids and clustering columns of the customers CSV, chunk_rows at a time."""
+    with pd.read_csv(path, usecols=[ID_COLUMN, *CUSTOMER_CLUSTER_FEATURES],
+                     chunksize=chunk_rows) as reader:
+        yield from reader
+
+
+def train_streaming_segmentation(path: Path, feature_names: List[str], n_jobs: int = 1,
+                                 chunk_rows: int = SEGMENTATION_CHUNK_ROWS) -> TrainingResult:
+    """
+    Fit the scaler and the mini-batch K-Means chunk by chunk.
+
+    Only one chunk is in memory at a time. The cluster statistics are not
+    part of the returned metrics: they come from the assignment pass (see
+    assign_customers).
+    """
+    features = list(CUSTOMER_CLUSTER_FEATURES)
+    model = build_customer_segmentation_model(
+        feature_names, n_jobs, engine='minibatch_kmeans', chunk_rows=chunk_rows
+    )
+    scaler = StandardScaler()
+    n_rows = 0
+
+    def fit_scaler():
+        nonlocal n_rows
+        for chunk in read_chunks(path, chunk_rows):
+            scaler.partial_fit(chunk[features])
+            n_rows += len(chunk)
+            yield chunk
+
+    # The first pass fits the scaler while the rows are hashed
+    fingerprint = data_fingerprint('kmeans_customers', fit_scaler(), feature_names)
+    for _ in range(model.max_iter):
+        for chunk in read_chunks(path, chunk_rows):
+            model.partial_fit(scaler.transform(chunk[features]))
+
+    metrics = {
+        'n_clusters': model.n_clusters,
+        'feature_names': features,
+        'engine': 'minibatch_kmeans',
+        'chunk_rows': chunk_rows,
+        'epochs': model.max_iter,
+        'training_rows': n_rows,
+        'data_fingerprint': fingerprint,
+    }
+    return model, metrics, scaler
+
+
+class SegmentAssignments:
+    """The cluster of every customer, in file order, with per-cluster sums."""
+
+    def __init__(self, n_clusters: int, customer_ids: Optional[np.ndarray] = None,
+                 clusters: Optional[np.ndarray] = None, counts: Optional[np.ndarray] = None,
+                 sums: Optional[np.ndarray] = None, sample: Optional[pd.DataFrame] = None,
+                 source: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            n_clusters: Number of clusters of the model.
+            customer_ids: Id of each assigned customer.
+            clusters: Cluster of each assigned customer.
+            counts: Customers per cluster.
+            sums: Per-cluster sums of the clustering columns.
+            sample: Uniform sample of the customers with their cluster.
+            source: Where the assigned rows end in the CSV: {'end': byte
+                offset, 'tail': hash of the TAIL_BYTES before it}.
+        """
+        n_features = len(CUSTOMER_CLUSTER_FEATURES)
+        self.n_clusters = n_clusters
+        self.customer_ids = np.empty(0, np.int64) if customer_ids is None else customer_ids
+        self.clusters = np.empty(0, np.int16) if clusters is None else clusters
+        self.counts = np.zeros(n_clusters, np.int64) if counts is None else counts
+        self.sums = np.zeros((n_clusters, n_features)) if sums is None else sums
+        self.sample = sample
+        self.source = source
+
+    @property
+    def n_rows(self) -> int:
+        """Return the number of customers assigned."""
+        return len(self.clusters)
+
+    def extended(self, chunks: Iterable[pd.DataFrame], model: Any, scaler: StandardScaler,
+                 sample_fraction: float = 0.0,
+                 source: Optional[Dict[str, Any]] = None) -> 'SegmentAssignments':
+        """
+        Return these assignments plus the customers in chunks.
+
+        The customers already assigned keep their cluster; only the new ones
+        are scaled and predicted, and added to the per-cluster sums.
+
+        Args:
+            sample_fraction: Share of the new customers added to the sample.
+            source: Where the rows end in the CSV once chunks are added.
+        """
+        features = list(CUSTOMER_CLUSTER_FEATURES)
+        ids, clusters = [self.customer_ids], [self.clusters]
+        samples = [] if self.sample is None else [self.sample]
+        counts, sums = self.counts.copy(), self.sums.copy()
+        # Seeded by position, so a worker extending the same rows samples the same ones
+        rng = np.random.default_rng(self.n_rows)
+        for chunk in chunks:
+            X = chunk[features]
+            labels = model.predict(scaler.transform(X))
+            ids.append(chunk[ID_COLUMN].to_numpy(np.int64))
+            clusters.append(labels.astype(np.int16))
+            counts += np.bincount(labels, minlength=self.n_clusters)
+            values = X.to_numpy(float)
+            for j in range(len(features)):
+                sums[:, j] += np.bincount(labels, weights=values[:, j], minlength=self.n_clusters)
+            if sample_fraction:
+                taken = rng.random(len(chunk)) < sample_fraction
+                samples.append(X[taken].assign(cluster=labels[taken]))
+
+        return SegmentAssignments(
+            self.n_clusters, np.concatenate(ids), np.concatenate(clusters), counts, sums,
+            pd.concat(samples, ignore_index=True) if samples else None, source,
+        )
+
+    def cluster_stats(self) -> Dict[int, Dict[str, Any]]:
+        """Return the size and average characteristics of each cluster (0 for an empty one)."""
+        features = list(CUSTOMER_CLUSTER_FEATURES)
+        total = max(self.n_rows, 1)
+        stats = {}
+        for cluster_id in range(self.n_clusters):
+            count = int(self.counts[cluster_id])
+            means = self.sums[cluster_id] / count if count else np.zeros(len(features))
+            stats[cluster_id] = {
+                'count': count,
+                'percentage': round(count / total * 100, 1),
+                **{
+                    key: round(float(means[features.index(column)]), decimals)
+                    for key, (column, decimals) in CLUSTER_AVERAGES.items()
+                },
+            }
+        return stats
+
+    def silhouette(self, scaler: StandardScaler) -> float:
+        """Return the silhouette score estimated on the sample."""
+        if self.sample is None or self.sample['cluster'].nunique() < 2:
+            return 0.0
+        X = scaler.transform(self.sample[list(CUSTOMER_CLUSTER_FEATURES)])
+        return float(silhouette_score(X, self.sample['cluster']))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the state to persist; the arrays can be memory-mapped back."""
+        return {
+            'n_clusters': self.n_clusters,
+            'customer_ids': self.customer_ids,
+            'clusters': self.clusters,
+            'counts': self.counts,
+            'sums': self.sums,
+            'sample': self.sample,
+            'source': self.source,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'SegmentAssignments':
+        return cls(**state)
+
+
+def assign_customers(path: Path, model: Any, scaler: StandardScaler,
+                     chunk_rows: int = SEGMENTATION_CHUNK_ROWS) -> SegmentAssignments:
+    """Assign every customer of the CSV to clusters, streaming it in chunks."""
+    return update_assignments(SegmentAssignments(model.n_clusters), path, model, scaler, chunk_rows)
+
+
+def update_assignments(assignments: SegmentAssignments, path: Path, model: Any,
+                       scaler: StandardScaler,
+                       chunk_rows: int = SEGMENTATION_CHUNK_ROWS) -> SegmentAssignments:
+    """
+    Return the assignments covering every customer in the CSV.
+
+    Customers are appended to the file, so the ones already assigned are
+    its first rows and only the bytes after them are read and predicted.
+    If the bytes just before that point changed (the dataset was
+    regenerated or edited), or the file shrank, everyone is assigned
+    again. A last row still being written is left for the next call.
+    """
+    with open(path, 'rb') as f:
+        header_end = len(f.readline())
+        end = _complete_lines_end(f, os.fstat(f.fileno()).st_size, header_end)
+        source = assignments.source
+        if source is not None and source['end'] <= end and _tail_hash(f, source['end']) == source['tail']:
+            if source['end'] == end:
+                return assignments
+            start = source['end']
+        else:
+            if assignments.n_rows:
+                print("Customer rows changed, assigning every customer again")
+            assignments, start = SegmentAssignments(model.n_clusters), header_end
+
+        n_rows = assignments.n_rows + _count_lines(f, start, end)
+        new_source = {'end': end, 'tail': _tail_hash(f, end)}
+        return assignments.extended(
+            _read_rows(f, start, end, chunk_rows), model, scaler, _sample_fraction(n_rows), new_source
+        )
+
+
+def _read_rows(f: BinaryIO, start: int, end: int, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Yield the ids and clustering columns of the CSV rows in bytes [start, end)."""
+    f.seek(0)
+    columns = pd.read_csv(io.BytesIO(f.readline()), nrows=0).columns
+    f.seek(start)
+    reader = pd.read_csv(
+        io.BufferedReader(_FileRange(f, end)), header=None, names=columns,
+        usecols=[ID_COLUMN, *CUSTOMER_CLUSTER_FEATURES], chunksize=chunk_rows,
+    )
+    with reader:
+        yield from reader
+
+
+class _FileRange(io.RawIOBase):
+    """Reads an open file from its position up to a byte offset."""
+
+    def __init__(self, f: BinaryIO, end: int):
+        self._f = f
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._f.read(max(0, min(len(buffer), self._end - self._f.tell())))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _complete_lines_end(f: BinaryIO, size: int, start: int) -> int:
+    """Return the offset just past the last newline in bytes [start, size)."""
+    position = size
+    while position > start:
+        step = min(position - start, 1 << 16)
+        f.seek(position - step)
+        newline = f.read(step).rfind(b'\n')
+        if newline >= 0:
+            return position - step + newline + 1
+        position -= step
+    return start
+
+
+def _count_lines(f: BinaryIO, start: int, end: int) -> int:
+    """Count the rows (newlines) in bytes [start, end)."""
+    f.seek(start)
+    count = 0
+    while f.tell() < end:
+        count += f.read(min(1 << 20, end - f.tell())).count(b'\n')
+    return count
+
+
+def _tail_hash(f: BinaryIO, end: int) -> str:
+    """Return the hash of the TAIL_BYTES before an offset."""
+    f.seek(max(0, end - TAIL_BYTES))
+    return hashlib.blake2b(f.read(min(end, TAIL_BYTES)), digest_size=16).hexdigest()
+
+
+def _sample_fraction(n_rows: int) -> float:
+    """Return the share of customers to sample to keep about SAMPLE_ROWS of n_rows."""
+    return min(1.0, SAMPLE_ROWS / max(n_rows, 1))
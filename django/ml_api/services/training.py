@@ -0,0 +1,431 @@
+"""
+Training Service - Pure training functions for the ML models.
+
+Each function takes a dataset and returns (model, metrics, scaler) without
+touching Django, the disk or shared state, so the independent models can be
+trained in parallel worker processes and persisted by the caller. Options
+read from settings (like the duration model's engine) are passed in by the
+caller for the same reason.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+import hashlib
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import (
+    RandomForestRegressor, GradientBoostingRegressor, HistGradientBoostingRegressor
+)
+from sklearn.inspection import permutation_importance
+from sklearn.linear_model import LogisticRegression
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import (
+    mean_absolute_error, mean_squared_error, r2_score,
+    accuracy_score, precision_score, recall_score, f1_score, roc_auc_score,
+    silhouette_score
+)
+from threadpoolctl import threadpool_limits
+
+warnings.filterwarnings('ignore')
+
+TrainingResult = Tuple[Any, Dict, Optional[StandardScaler]]
+
+# Engines available for the duration model
+DURATION_ENGINES = ('gradient_boosting', 'hist_gradient_boosting')
+
+# Engines available for the customer segmentation ('minibatch_kmeans' streams
+# the customers from disk in chunks instead of fitting them all at once)
+SEGMENTATION_ENGINES = ('kmeans', 'minibatch_kmeans')
+
+# Customers per chunk of the streaming segmentation (also its mini-batch size)
+SEGMENTATION_CHUNK_ROWS = 10000
+
+# Passes over the customers when fitting the streaming segmentation
+SEGMENTATION_EPOCHS = 5
+
+# Integer-coded project features treated as categories by the histogram engine
+CATEGORICAL_PROJECT_FEATURES = ('project_type_id', 'location_zone')
+
+# Test rows used to estimate permutation importance (the histogram engine
+# has no impurity-based importances)
+IMPORTANCE_SAMPLE_ROWS = 2000
+
+# Customer columns the segmentation is fitted on
+CUSTOMER_CLUSTER_FEATURES = (
+    'total_revenue', 'num_projects', 'months_as_customer',
+    'payment_delay_avg_days', 'communication_score', 'project_frequency'
+)
+
+
+def training_data(name: str, data: pd.DataFrame,
+                  feature_names: List[str]) -> Tuple[pd.DataFrame, pd.Series]:
+    """Return a supervised model's feature frame and target, ready to fit."""
+    X = data[feature_names].copy()
+    for column in ('has_basement', 'has_pool'):
+        if column in X:
+            X[column] = X[column].astype(int)
+    y = data[TRAINING_TASKS[name]['target']]
+    return X, y.astype(int) if y.dtype == bool else y
+
+
+def data_fingerprint(name: str, data: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+                     feature_names: List[str]) -> str:
+    """
+    Return a content hash of the rows and columns a model is trained on.
+
+    data may also be consecutive chunks of the rows; the hash is the same as
+    for the whole frame.
+    """
+    task = TRAINING_TASKS[name]
+    columns = list(task.get('features', feature_names))
+    if 'target' in task:
+        columns.append(task['target'])
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in ([data] if isinstance(data, pd.DataFrame) else data):
+        digest.update(pd.util.hash_pandas_object(chunk[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_project_cost_model(feature_names: List[str], n_jobs: int = 1,
+                             params: Optional[Dict[str, Any]] = None) -> RandomForestRegressor:
+    """Return the unfitted cost model, with tuned parameters if given."""
+    model = RandomForestRegressor(
+        n_estimators=100,
+        max_depth=15,
+        min_samples_split=5,
+        min_samples_leaf=2,
+        random_state=42,
+        n_jobs=n_jobs
+    )
+    return model.set_params(**(params or {}))
+
+
+def build_project_duration_model(feature_names: List[str], n_jobs: int = 1,
+                                 params: Optional[Dict[str, Any]] = None,
+                                 engine: str = 'gradient_boosting') -> Any:
+    """Return the unfitted duration model for an engine, with tuned parameters if given."""
+    if engine not in DURATION_ENGINES:
+        raise ValueError(f"Unknown duration engine: {engine}")
+
+    if engine == 'hist_gradient_boosting':
+        model = HistGradientBoostingRegressor(
+            max_iter=500,
+            learning_rate=0.1,
+            max_leaf_nodes=31,
+            min_samples_leaf=20,
+            categorical_features=[name in CATEGORICAL_PROJECT_FEATURES for name in feature_names],
+            # Stop once 10 iterations in a row do not improve a 10% validation split
+            early_stopping=True,
+            validation_fraction=0.1,
+            n_iter_no_change=10,
+            random_state=42
+        )
+    else:
+        model = GradientBoostingRegressor(
+            n_estimators=100,
+            max_depth=8,
+            learning_rate=0.1,
+            min_samples_split=5,
+            min_samples_leaf=2,
+            random_state=42
+        )
+    return model.set_params(**(params or {}))
+
+
+def params_fingerprint(name: str, feature_names: List[str],
+                       options: Optional[Dict[str, Any]] = None,
+                       extra: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Return a hash of everything besides the data that determines a trained model.
+
+    Covers the estimator's full parameters for these options, the feature
+    order and the scikit-learn version, plus any extra settings the caller
+    adds (like the hyperparameter search configuration).
+    """
+    model = TRAINING_TASKS[name]['build'](feature_names, 1, **(options or {}))
+    payload = json.dumps({
+        'estimator': type(model).__name__,
+        'params': model.get_params(),
+        'features': list(feature_names),
+        'sklearn': sklearn.__version__,
+        'extra': extra,
+    }, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def build_customer_segmentation_model(feature_names: List[str], n_jobs: int = 1,
+                                      params: Optional[Dict[str, Any]] = None,
+                                      engine: str = 'kmeans',
+                                      chunk_rows: int = SEGMENTATION_CHUNK_ROWS) -> Any:
+    """Return the unfitted segmentation model (4 clusters) for an engine."""
+    if engine not in SEGMENTATION_ENGINES:
+        raise ValueError(f"Unknown segmentation engine: {engine}")
+
+    if engine == 'minibatch_kmeans':
+        # Fitted with partial_fit, one chunk per mini-batch, SEGMENTATION_EPOCHS times over
+        model = MiniBatchKMeans(
+            n_clusters=4,
+            batch_size=chunk_rows,
+            max_iter=SEGMENTATION_EPOCHS,
+            random_state=42
+        )
+    else:
+        model = KMeans(n_clusters=4, random_state=42, n_init=10)
+    return model.set_params(**(params or {}))
+
+
+def build_turnover_model(feature_names: List[str], n_jobs: int = 1,
+                         params: Optional[Dict[str, Any]] = None) -> LogisticRegression:
+    """Return the unfitted turnover model, with tuned parameters if given."""
+    model = LogisticRegression(
+        max_iter=1000,
+        random_state=42,
+        class_weight='balanced'
+    )
+    return model.set_params(**(params or {}))
+
+
+def train_project_cost(data: pd.DataFrame, feature_names: List[str],
+                       n_jobs: int = 1,
+                       params: Optional[Dict[str, Any]] = None) -> TrainingResult:
+    """Train Random Forest for project cost prediction."""
+    X, y = training_data('rf_project_cost', data, feature_names)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+
+    model = build_project_cost_model(feature_names, n_jobs, params)
+    model.fit(X_train, y_train)
+
+    # Calculate metrics
+    y_pred = model.predict(X_test)
+    metrics = {
+        'r2_score': round(r2_score(y_test, y_pred), 4),
+        'mae': round(mean_absolute_error(y_test, y_pred), 2),
+        'rmse': round(np.sqrt(mean_squared_error(y_test, y_pred)), 2),
+        'feature_importance': dict(zip(
+            feature_names,
+            model.feature_importances_.round(4).tolist()
+        )),
+        'training_rows': len(data),
+        'data_fingerprint': data_fingerprint('rf_project_cost', data, feature_names),
+    }
+    return model, metrics, None
+
+
+def train_project_duration(data: pd.DataFrame, feature_names: List[str],
+                           n_jobs: int = 1,
+                           engine: str = 'gradient_boosting',
+                           params: Optional[Dict[str, Any]] = None) -> TrainingResult:
+    """
+    Train the project duration model.
+
+    Args:
+        engine: 'gradient_boosting' (exact splits, single-threaded) or
+            'hist_gradient_boosting' (binned features, multithreaded, early
+            stopping and native categorical splits; for large histories).
+    """
+    X, y = training_data('gb_project_duration', data, feature_names)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+
+    model = build_project_duration_model(feature_names, n_jobs, params, engine)
+    model.fit(X_train, y_train)
+
+    # Calculate metrics
+    y_pred = model.predict(X_test)
+    if engine == 'hist_gradient_boosting':
+        sample = X_test.index[:IMPORTANCE_SAMPLE_ROWS]
+        importances = permutation_importance(
+            model, X_test.loc[sample], y_test.loc[sample],
+            n_repeats=3, random_state=42, n_jobs=1
+        ).importances_mean.clip(min=0)
+        importances = importances / importances.sum() if importances.sum() > 0 else importances
+    else:
+        importances = model.feature_importances_
+    metrics = {
+        'r2_score': round(r2_score(y_test, y_pred), 4),
+        'mae_days': round(mean_absolute_error(y_test, y_pred), 1),
+        'rmse_days': round(np.sqrt(mean_squared_error(y_test, y_pred)), 1),
+        'feature_importance': dict(zip(
+            feature_names,
+            importances.round(4).tolist()
+        )),
+        'engine': engine,
+        'training_rows': len(data),
+        'data_fingerprint': data_fingerprint('gb_project_duration', data, feature_names),
+    }
+    if engine == 'hist_gradient_boosting':
+        metrics['n_iter'] = int(model.n_iter_)
+    return model, metrics, None
+
+
+def train_customer_segmentation(data: Union[pd.DataFrame, Path], feature_names: List[str],
+                                n_jobs: int = 1, engine: str = 'kmeans',
+                                chunk_rows: int = SEGMENTATION_CHUNK_ROWS) -> TrainingResult:
+    """
+    Train K-Means for customer segmentation.
+
+    The 'minibatch_kmeans' engine takes the path of the customers CSV
+    instead of the data and streams it (see streaming_segmentation).
+    """
+    if engine == 'minibatch_kmeans':
+        from ml_api.services.streaming_segmentation import train_streaming_segmentation
+        return train_streaming_segmentation(data, feature_names, n_jobs, chunk_rows)
+
+    # Use clustering features
+    cluster_features = list(CUSTOMER_CLUSTER_FEATURES)
+    X = data[cluster_features].copy()
+
+    # Scale features
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    # Train K-Means with 4 clusters
+    model = build_customer_segmentation_model(feature_names, n_jobs)
+    labels = model.fit_predict(X_scaled)
+
+    # Calculate metrics
+    silhouette = silhouette_score(X_scaled, labels)
+
+    # Calculate cluster statistics
+    data_with_labels = data.copy()
+    data_with_labels['cluster'] = labels
+    cluster_stats = {}
+    for cluster_id in range(model.n_clusters):
+        cluster_data = data_with_labels[data_with_labels['cluster'] == cluster_id]
+        cluster_stats[cluster_id] = {
+            'count': len(cluster_data),
+            'percentage': round(len(cluster_data) / len(data) * 100, 1),
+            'avg_revenue': round(cluster_data['total_revenue'].mean(), 2),
+            'avg_projects': round(cluster_data['num_projects'].mean(), 1),
+            'avg_tenure_months': round(cluster_data['months_as_customer'].mean(), 1),
+            'avg_payment_delay': round(cluster_data['payment_delay_avg_days'].mean(), 1),
+            'avg_satisfaction': round(cluster_data['communication_score'].mean(), 1),
+        }
+
+    metrics = {
+        'silhouette_score': round(silhouette, 4),
+        'n_clusters': model.n_clusters,
+        'cluster_stats': cluster_stats,
+        'feature_names': cluster_features,
+        'data_fingerprint': data_fingerprint('kmeans_customers', data, feature_names),
+    }
+    return model, metrics, scaler
+
+
+def train_turnover(data: pd.DataFrame, feature_names: List[str],
+                   n_jobs: int = 1,
+                   params: Optional[Dict[str, Any]] = None) -> TrainingResult:
+    """Train Logistic Regression for turnover prediction."""
+    X, y = training_data('lr_turnover', data, feature_names)
+
+    # Scale features
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X_scaled, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    model = build_turnover_model(feature_names, n_jobs, params)
+    model.fit(X_train, y_train)
+
+    # Calculate metrics
+    y_pred = model.predict(X_test)
+    y_prob = model.predict_proba(X_test)[:, 1]
+
+    metrics = {
+        'accuracy': round(accuracy_score(y_test, y_pred), 4),
+        'precision': round(precision_score(y_test, y_pred), 4),
+        'recall': round(recall_score(y_test, y_pred), 4),
+        'f1_score': round(f1_score(y_test, y_pred), 4),
+        'auc_roc': round(roc_auc_score(y_test, y_prob), 4),
+        'coefficients': dict(zip(
+            feature_names,
+            model.coef_[0].round(4).tolist()
+        )),
+        'feature_names': feature_names,
+        'training_rows': len(data),
+        'data_fingerprint': data_fingerprint('lr_turnover', data, feature_names),
+    }
+    return model, metrics, scaler
+
+
+# Training tasks by model name: the dataset each one needs, its estimator
+# builder, the target of the supervised ones (the columns of the others),
+# and whether it can use more than one core (the forest parallelises over
+# its trees; the duration model only with the histogram engine)
+TRAINING_TASKS: Dict[str, Dict[str, Any]] = {
+    'rf_project_cost': {
+        'label': 'Random Forest (Project Cost)', 'dataset': 'projects', 'target': 'actual_cost',
+        'train': train_project_cost, 'build': build_project_cost_model, 'parallel': True,
+    },
+    'gb_project_duration': {
+        'label': 'Gradient Boosting (Project Duration)', 'dataset': 'projects',
+        'target': 'actual_duration_days',
+        'train': train_project_duration, 'build': build_project_duration_model, 'parallel': False,
+        'parallel_engines': ('hist_gradient_boosting',),
+    },
+    'kmeans_customers': {
+        'label': 'K-Means (Customer Segmentation)', 'dataset': 'customers',
+        'features': CUSTOMER_CLUSTER_FEATURES,
+        'train': train_customer_segmentation, 'build': build_customer_segmentation_model,
+        'parallel': False,
+        # Trained from the dataset's file rather than the loaded frame
+        'streaming_engines': ('minibatch_kmeans',),
+    },
+    'lr_turnover': {
+        'label': 'Logistic Regression (Turnover)', 'dataset': 'employees', 'target': 'has_left',
+        'train': train_turnover, 'build': build_turnover_model, 'parallel': False,
+        # Fitted on standardised features
+        'scaled': True,
+    },
+}
+
+
+def is_parallel(name: str, options: Optional[Dict[str, Any]] = None) -> bool:
+    """Return True if a task can use more than one core with these options."""
+    task = TRAINING_TASKS[name]
+    engine = (options or {}).get('engine')
+    return task['parallel'] or engine in task.get('parallel_engines', ())
+
+
+def is_streaming(name: str, options: Optional[Dict[str, Any]] = None) -> bool:
+    """Return True if a task reads its dataset from disk with these options."""
+    engine = (options or {}).get('engine')
+    return engine in TRAINING_TASKS[name].get('streaming_engines', ())
+
+
+def thread_budgets(n_cpus: int, names: List[str],
+                   options: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, int]:
+    """
+    Split n_cpus between tasks that run at the same time.
+
+    Serial tasks get one core each; the parallel ones share the rest, so the
+    total never exceeds the machine and nothing is oversubscribed.
+    """
+    options = options or {}
+    parallel = [name for name in names if is_parallel(name, options.get(name))]
+    spare = max(0, n_cpus - (len(names) - len(parallel)))
+    budgets = {name: 1 for name in names}
+    for name in parallel:
+        budgets[name] = max(1, spare // len(parallel))
+    return budgets
+
+
+def run_training_task(name: str, data: pd.DataFrame, feature_names: List[str],
+                      n_threads: int = 1,
+                      options: Optional[Dict[str, Any]] = None) -> TrainingResult:
+    """Train one model, capping its BLAS/OpenMP threads to its budget."""
+    train: Callable[..., TrainingResult] = TRAINING_TASKS[name]['train']
+    with threadpool_limits(limits=n_threads):
+        return train(data, feature_names, n_jobs=n_threads, **(options or {}))
@@ -0,0 +1,787 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+from ml_api.datasets.generators.employee_data import EmployeeDataGenerator
+from ml_api.datasets.generators.project_data import ProjectDataGenerator
+from ml_api.services.arima_cache import ARIMACache, ARIMARefitPolicy
+from ml_api.services.compiled_trees import CompiledTreeEnsemble, sklearn_tree_predictions
+from ml_api.services.dataset_store import DatasetStore
+from ml_api.services.feature_schema import PROJECT_COST_SCHEMA, PROJECT_DURATION_SCHEMA, SchemaError
+from ml_api.services.forecasting import ARIMA_ORDER, append_arima, fit_arima
+from ml_api.services.hyperparameter_search import SEARCH_SPACES, HyperparameterSearch
+from ml_api.services.incremental_training import IncrementalRetrainPolicy
+from ml_api.services.jobs import JobConflict, JobManager
+from ml_api.services.micro_batching import MicroBatcher
+from ml_api.services.ml_trainer import MLTrainer
+from ml_api.services.model_registry import ModelRegistry
+from ml_api.services.model_store import ModelStore
+from ml_api.services.prediction_cache import PredictionCache
+from ml_api.services.single_flight import SingleFlight
+from ml_api.services.streaming_segmentation import SegmentAssignments, assign_customers, update_assignments
+from ml_api.services.training import CUSTOMER_CLUSTER_FEATURES, data_fingerprint, training_data
+
+
+class CompiledTreeEnsembleParityTests(SimpleTestCase):
+    """The compiled engine must predict exactly what sklearn predicts."""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.X = rng.normal(size=(400, 11))
+        self.y = self.X @ rng.normal(size=11) + rng.normal(scale=0.5, size=400)
+        # Rows never seen in training, some far outside the training range
+        self.rows = np.vstack([rng.normal(size=(300, 11)), rng.normal(scale=10, size=(20, 11))])
+
+    def test_random_forest_matches_sklearn(self):
+        model = RandomForestRegressor(n_estimators=25, max_depth=12, random_state=0).fit(self.X, self.y)
+        compiled = CompiledTreeEnsemble.from_sklearn(model)
+
+        np.testing.assert_array_equal(
+            compiled.tree_predictions(self.rows),
+            np.vstack([estimator.predict(self.rows) for estimator in model.estimators_]),
+        )
+        np.testing.assert_allclose(compiled.predict(self.rows), model.predict(self.rows), rtol=1e-12)
+
+    def test_gradient_boosting_matches_sklearn(self):
+        model = GradientBoostingRegressor(n_estimators=60, max_depth=5, random_state=0).fit(self.X, self.y)
+        compiled = CompiledTreeEnsemble.from_sklearn(model)
+
+        np.testing.assert_array_equal(compiled.predict(self.rows), model.predict(self.rows))
+
+    def test_single_leaf_trees(self):
+        # A constant target leaves every tree as a lone root leaf (depth 0)
+        y = np.full(len(self.X), 3.5)
+        forest = RandomForestRegressor(n_estimators=5, random_state=0).fit(self.X, y)
+        boosting = GradientBoostingRegressor(n_estimators=5, random_state=0).fit(self.X, y)
+
+        compiled_forest = CompiledTreeEnsemble.from_sklearn(forest)
+        self.assertEqual(compiled_forest.max_depth, 0)
+        np.testing.assert_array_equal(compiled_forest.predict(self.rows), forest.predict(self.rows))
+        np.testing.assert_array_equal(
+            CompiledTreeEnsemble.from_sklearn(boosting).predict(self.rows), boosting.predict(self.rows)
+        )
+
+    def test_sklearn_traversal_matches_compiled(self):
+        model = RandomForestRegressor(n_estimators=10, random_state=0).fit(self.X, self.y)
+
+        np.testing.assert_array_equal(
+            sklearn_tree_predictions(model, self.rows),
+            CompiledTreeEnsemble.from_sklearn(model).tree_predictions(self.rows),
+        )
+
+    def test_round_trip_keeps_predictions(self):
+        model = GradientBoostingRegressor(n_estimators=20, random_state=0).fit(self.X, self.y)
+        compiled = CompiledTreeEnsemble.from_sklearn(model)
+
+        np.testing.assert_array_equal(
+            CompiledTreeEnsemble.from_dict(compiled.to_dict()).predict(self.rows),
+            compiled.predict(self.rows),
+        )
+
+    def test_rejects_wrong_feature_count(self):
+        model = RandomForestRegressor(n_estimators=2, random_state=0).fit(self.X, self.y)
+
+        with self.assertRaises(ValueError):
+            CompiledTreeEnsemble.from_sklearn(model).predict(self.rows[:, :5])
+
+
+class BatchPredictionParityTests(SimpleTestCase):
+    """A batch predicts exactly what the same rows predict one at a time."""
+
+    def setUp(self):
+        MLTrainer().wait_for_bootstrap()
+        saved = MLTrainer._prediction_cache
+        self.addCleanup(setattr, MLTrainer, '_prediction_cache', saved)
+        # Every row must reach the models, not the cache
+        MLTrainer._prediction_cache = PredictionCache(max_size=0)
+
+        rng = np.random.default_rng(7)
+        self.rows = [
+            {
+                **ConcurrentVersionSwapTests.PROJECT,
+                'project_type_id': int(rng.integers(1, 6)),
+                'area_m2': float(rng.uniform(100, 20000)),
+                'num_floors': int(rng.integers(1, 20)),
+                'complexity_score': int(rng.integers(1, 11)),
+                'team_size': int(rng.integers(3, 60)),
+            }
+            for _ in range(settings.ML_COMPILED_MAX_ROWS + 36)
+        ]
+
+    def test_cost_batch_matches_single_predictions(self):
+        trainer = MLTrainer()
+        single = [trainer.predict_project_cost(row) for row in self.rows]
+
+        # Above ML_COMPILED_MAX_ROWS the batch goes through sklearn's traversal
+        self.assertEqual(trainer.predict_project_cost_batch(self.rows), single)
+        # Up to it, through the compiled engine
+        small = self.rows[:settings.ML_COMPILED_MAX_ROWS]
+        self.assertEqual(trainer.predict_project_cost_batch(small), single[:len(small)])
+
+
+class SegmentAssignmentsTests(SimpleTestCase):
+    """Statistics and updates of the streaming customer assignments."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.features = list(CUSTOMER_CLUSTER_FEATURES)
+        self.data = pd.DataFrame(rng.normal(size=(60, 6)), columns=self.features)
+        self.data.insert(0, 'customer_id', np.arange(60))
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.path = self.dir / 'customers.csv'
+        self.data[:50].to_csv(self.path, index=False)
+        self.scaler = StandardScaler().fit(self.data[self.features])
+        self.model = MiniBatchKMeans(n_clusters=4, random_state=0, n_init=1).fit(
+            self.scaler.transform(self.data[self.features])
+        )
+
+    def append(self, rows: pd.DataFrame, partial: str = ''):
+        with open(self.path, 'a') as f:
+            f.write(rows.to_csv(index=False, header=False) + partial)
+
+    def assert_assigned_like_all_rows(self, assignments, n_rows):
+        expected = assign_customers(self.path, self.model, self.scaler)
+        self.assertEqual(assignments.n_rows, n_rows)
+        np.testing.assert_array_equal(assignments.customer_ids, np.arange(n_rows))
+        np.testing.assert_array_equal(assignments.clusters, expected.clusters)
+        np.testing.assert_array_equal(assignments.counts, expected.counts)
+        np.testing.assert_allclose(assignments.sums, expected.sums)
+
+    def test_empty_cluster_stats_are_zero(self):
+        assignments = SegmentAssignments(
+            2, np.arange(3), np.zeros(3, np.int16), np.array([3, 0]),
+            np.vstack([np.arange(6) * 3.0, np.zeros(6)]),
+        )
+        stats = assignments.cluster_stats()
+
+        self.assertEqual(stats[0]['avg_revenue'], 0.0)
+        self.assertEqual(stats[0]['avg_projects'], 1.0)
+        self.assertEqual(stats[1], {
+            'count': 0, 'percentage': 0.0, 'avg_revenue': 0.0, 'avg_projects': 0.0,
+            'avg_tenure_months': 0.0, 'avg_payment_delay': 0.0, 'avg_satisfaction': 0.0,
+        })
+
+    def test_appended_rows_are_read_from_the_end_of_the_file(self):
+        assignments = assign_customers(self.path, self.model, self.scaler, chunk_rows=7)
+        self.assertIs(update_assignments(assignments, self.path, self.model, self.scaler), assignments)
+
+        # A row still being written is left for the next call
+        self.append(self.data[50:58], partial='58,0.1,0.2')
+        updated = update_assignments(assignments, self.path, self.model, self.scaler, chunk_rows=3)
+        self.assertEqual(updated.n_rows, 58)
+        np.testing.assert_array_equal(updated.clusters[:50], assignments.clusters)
+
+        with open(self.path, 'a') as f:
+            f.write(',0.3,0.4,0.5,0.6\n')
+        self.append(self.data[59:])
+        self.assert_assigned_like_all_rows(
+            update_assignments(updated, self.path, self.model, self.scaler), 60
+        )
+
+    def test_rewritten_file_is_assigned_again(self):
+        assignments = assign_customers(self.path, self.model, self.scaler)
+        self.data[:40].to_csv(self.path, index=False)
+
+        self.assert_assigned_like_all_rows(
+            update_assignments(assignments, self.path, self.model, self.scaler), 40
+        )
+
+    def test_new_customers_leave_the_version_untouched(self):
+        trainer = MLTrainer()
+        trainer.wait_for_bootstrap()
+        self.addCleanup(setattr, MLTrainer, '_datasets', MLTrainer._datasets)
+        MLTrainer._datasets = DatasetStore(self.dir)
+        store = ModelStore(self.dir, 'v1')
+        store.save_assignments(
+            'kmeans_customers', assign_customers(self.path, self.model, self.scaler).to_dict()
+        )
+        artifact = self.dir / 'kmeans_customers_assignments.joblib'
+        saved = artifact.read_bytes()
+        self.append(self.data[50:])
+
+        assignments = trainer._customer_assignments(store, self.model, self.scaler, 100)
+
+        self.assertEqual(assignments.n_rows, 60)
+        self.assertEqual(SegmentAssignments.from_dict(store.assignments('kmeans_customers')).n_rows, 60)
+        self.assertEqual(artifact.read_bytes(), saved)
+        store.clear()
+        self.assertEqual(SegmentAssignments.from_dict(store.assignments('kmeans_customers')).n_rows, 50)
+
+
+class PredictionEndpointTests(SimpleTestCase):
+    """Payload validation of the prediction endpoints."""
+
+    EMPLOYEE = {
+        'tenure_months': 6, 'age': 24, 'salary_level': 1, 'department': 2,
+        'performance_score': 2.5, 'overtime_hours_monthly': 40, 'distance_from_home_km': 35,
+        'num_promotions': 0, 'training_hours_yearly': 5, 'satisfaction_score': 3,
+        'num_projects_assigned': 6,
+    }
+
+    def setUp(self):
+        MLTrainer().wait_for_bootstrap()
+
+    def post(self, url, body):
+        return self.client.post(f'/api/ml/{url}', body, content_type='application/json')
+
+    def test_turnover_accepts_string_numbers(self):
+        expected = self.post('predict/employee-turnover/', self.EMPLOYEE)
+        response = self.post('predict/employee-turnover/',
+                             {name: str(value) for name, value in self.EMPLOYEE.items()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        self.assertTrue(response.json()['risk_factors'])
+
+    def test_batch_rejects_non_object_body(self):
+        response = self.post('predict/project-cost/batch/', [ConcurrentVersionSwapTests.PROJECT])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'El cuerpo debe ser un objeto JSON')
+
+    def test_forecast_batch_validates_input(self):
+        url = 'forecast/inventory/batch/'
+        for body in ([1], {'materials': [1], 'forecast_days': 0}, {'materials': [1], 'forecast_days': -5},
+                     {'materials': [1], 'forecast_days': 1000}, {'materials': [1] * 501}):
+            self.assertEqual(self.post(url, body).status_code, 400, body)
+
+        response = self.post(url, {'materials': [1, {'material_id': '1'}, 2], 'forecast_days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['requested'], 2)
+
+    def test_rejects_non_finite_values(self):
+        project = {**ConcurrentVersionSwapTests.PROJECT, 'area_m2': 'inf'}
+        for url, body in (('predict/project-cost/', project), ('predict/project-duration/', project),
+                          ('predict/project-cost/batch/', {'projects': [project]})):
+            self.assertEqual(self.post(url, body).status_code, 400, url)
+
+
+class FeatureSchemaTests(SimpleTestCase):
+    """Payload conversion of the feature schemas."""
+
+    PROJECT = {name: 1 for name in PROJECT_COST_SCHEMA.names}
+
+    def test_rejects_non_finite_values(self):
+        for value in ('nan', 'inf', '-inf', float('nan'), 10 ** 400, '1e400'):
+            for schema in (PROJECT_COST_SCHEMA, PROJECT_DURATION_SCHEMA):
+                with self.assertRaisesMessage(SchemaError, 'Valor invalido: area_m2'):
+                    schema.row({**self.PROJECT, 'area_m2': value})
+            with self.assertRaises(SchemaError) as raised:
+                PROJECT_COST_SCHEMA.to_matrix([self.PROJECT, {**self.PROJECT, 'area_m2': value}])
+            self.assertEqual(raised.exception.errors, [{'index': 1, 'error': 'Valor invalido: area_m2'}])
+
+    def test_matrix_converts_string_numbers(self):
+        X = PROJECT_COST_SCHEMA.to_matrix([self.PROJECT, {**self.PROJECT, 'area_m2': '2.5'}])
+
+        np.testing.assert_array_equal(X[:, 1], [1.0, 2.5])
+
+
+class JobManagerTests(SimpleTestCase):
+    """Jobs shared by several workers through their state directory."""
+
+    def setUp(self):
+        self.state_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state_dir, True)
+        # Two managers over the same directory stand for two worker processes
+        self.worker, self.other = JobManager(state_dir=self.state_dir), JobManager(state_dir=self.state_dir)
+
+    def test_other_worker_joins_and_follows_the_job(self):
+        release = threading.Event()
+        job, created = self.worker.submit('retrain', lambda job: release.wait() and {'ok': True}, ['a'])
+        self.assertTrue(created)
+
+        joined, created = self.other.submit('retrain', lambda job: self.fail('ran twice'), ['a'])
+        self.assertFalse(created)
+        self.assertEqual(joined.id, job.id)
+        self.assertTrue(self.other.get(job.id).active)
+        self.assertFalse(joined.wait(timeout=0.1))
+
+        release.set()
+        self.assertTrue(joined.wait(timeout=5))
+        self.assertEqual(joined.status, 'succeeded')
+        self.assertEqual(self.other.get(job.id).to_dict()['result'], {'ok': True})
+
+        # The lock was released: the next job may start on any worker
+        _, created = self.other.submit('retrain', lambda job: None, ['a'])
+        self.assertTrue(created)
+
+    def test_job_with_other_params_conflicts(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        job, _ = self.worker.submit('retrain', lambda job: release.wait(), ['a'], {'mode': 'incremental'})
+
+        for manager in (self.worker, self.other):
+            with self.assertRaises(JobConflict) as raised:
+                manager.submit('retrain', lambda job: None, ['a'], {'mode': 'full'})
+            self.assertEqual(raised.exception.job.id, job.id)
+            joined, created = manager.submit('retrain', lambda job: None, ['a'], {'mode': 'incremental'})
+            self.assertEqual((joined.id, created), (job.id, False))
+
+    def test_retrain_endpoint_rejects_other_mode(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.addCleanup(setattr, MLTrainer, '_jobs', MLTrainer._jobs)
+        MLTrainer._jobs = self.worker
+        job, _ = self.worker.submit('retrain', lambda job: release.wait(), ['a'], {'mode': 'incremental'})
+
+        response = self.client.post('/api/ml/datasets/retrain/', {'mode': 'full'}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['job_id'], job.id)
+
+        response = self.client.post('/api/ml/datasets/retrain/', {'mode': 'incremental'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['job']['params'], {'mode': 'incremental'})
+
+    def test_failed_job_is_visible_to_other_workers(self):
+        job, _ = self.worker.submit('retrain', lambda job: 1 / 0, ['a'])
+        job.wait(timeout=5)
+
+        self.assertEqual(self.other.get(job.id).status, 'failed')
+        self.assertIsNone(self.other.get('unknown'))
+
+    def test_job_of_an_exited_worker_is_reported_failed(self):
+        job, _ = self.worker.submit('retrain', lambda job: None, ['a'])
+        job.wait(timeout=5)
+        # A state file left running by a process that died (its lock is free)
+        state = {**job.to_dict(), 'status': 'running'}
+        (self.state_dir / f'{job.id}.json').write_text(json.dumps(state))
+
+        self.assertEqual(self.other.get(job.id).status, 'failed')
+
+
+class ARIMACacheTests(SimpleTestCase):
+    """Cached ARIMA fits are reused, extended or refitted as the history changes."""
+
+    def setUp(self):
+        saved = MLTrainer._arima_cache, MLTrainer._arima_refit_policy
+        self.addCleanup(self.restore, saved)
+        MLTrainer._arima_cache = ARIMACache(max_size=8)
+        MLTrainer._arima_refit_policy = ARIMARefitPolicy(max_appended=60, drift_threshold=1.5)
+        self.trainer = MLTrainer()
+
+        rng = np.random.default_rng(5)
+        self.series = rng.poisson(20, size=150).astype(np.float64)
+        self.history = self.series[:120]
+        self.arima = fit_arima(self.history)
+        self.trainer._store_arima(1, self.history, self.arima)
+
+    def restore(self, saved):
+        MLTrainer._arima_cache, MLTrainer._arima_refit_policy = saved
+
+    def test_changed_history_misses_the_cache(self):
+        self.assertIs(self.trainer._cached_arima(1, self.history), self.arima)
+
+        edited = self.history.copy()
+        edited[10] += 1
+        self.assertIsNone(self.trainer._cached_arima(1, edited))
+        self.assertIsNone(self.trainer._cached_arima(2, self.history))
+
+    def test_appended_history_extends_the_last_fit(self):
+        extended = self.trainer._extend_arima(1, self.series)
+
+        self.assertEqual(extended['n_obs'], 150)
+        self.assertEqual(extended['appended'], 30)
+        self.assertEqual(extended['base_mae'], self.arima['base_mae'])
+
+    def test_rewritten_history_is_refitted(self):
+        rewritten = self.series.copy()
+        rewritten[0] += 1
+        self.assertIsNone(self.trainer._extend_arima(1, rewritten))
+        # Not longer than the fitted history: nothing to append
+        self.assertIsNone(self.trainer._extend_arima(1, self.history[:100]))
+
+    def test_refit_policy(self):
+        policy = ARIMARefitPolicy(max_appended=10, drift_threshold=1.5)
+        self.assertFalse(policy.needs_refit(self.arima))
+
+        self.assertFalse(policy.needs_refit(append_arima(self.arima, self.series[:125])))
+        # Too many observations since the last full fit
+        self.assertTrue(policy.needs_refit(append_arima(self.arima, self.series)))
+
+        # New observations the fit does not explain
+        drifted = np.concatenate([self.history, np.full(5, 500.0)])
+        self.assertTrue(policy.needs_refit(append_arima(self.arima, drifted)))
+        # The trainer then refits instead of extending
+        self.assertIsNone(self.trainer._extend_arima(1, drifted))
+
+    def test_eviction_forgets_the_latest_fit(self):
+        cache = ARIMACache(max_size=1)
+        cache.put(ARIMACache.make_key(1, self.history, ARIMA_ORDER), self.arima)
+        cache.put(ARIMACache.make_key(2, self.history, ARIMA_ORDER), self.arima)
+
+        self.assertIsNone(cache.latest(1, ARIMA_ORDER))
+        self.assertIsNotNone(cache.latest(2, ARIMA_ORDER))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class DatasetStoreTests(SimpleTestCase):
+    """The store parses a dataset again only when its file content changed."""
+
+    def setUp(self):
+        self.datasets_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.datasets_dir, True)
+        self.store = DatasetStore(self.datasets_dir)
+        self.data = pd.DataFrame({'customer_id': [1, 2, 3], 'total_revenue': [10.0, 20.0, 30.0]})
+
+    def test_write_skips_identical_content(self):
+        self.assertTrue(self.store.write('customers', self.data))
+        signature = self.store.file_signature('customers')
+
+        self.assertFalse(self.store.write('customers', self.data.copy()))
+        self.assertEqual(self.store.file_signature('customers'), signature)
+        self.assertTrue(self.store.write('customers', self.data.assign(total_revenue=0.0)))
+
+    def test_changed_file_is_reloaded(self):
+        self.store.write('customers', self.data)
+        first = self.store.get('customers')
+        fingerprint = self.store.fingerprint('customers')
+        self.assertIs(self.store.get('customers'), first)
+
+        self.store.write('customers', pd.concat([self.data, self.data.tail(1)], ignore_index=True))
+        self.assertEqual(len(self.store.get('customers')), 4)
+        self.assertNotEqual(self.store.fingerprint('customers'), fingerprint)
+
+    def test_touched_file_keeps_the_parsed_data(self):
+        self.store.write('customers', self.data)
+        first = self.store.get('customers')
+
+        path = self.store.path('customers')
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+        self.assertIs(self.store.get('customers'), first)
+
+    def test_invalidate_forces_a_reload(self):
+        self.store.write('customers', self.data)
+        first = self.store.get('customers')
+
+        self.store.invalidate('customers')
+        self.assertIsNot(self.store.get('customers'), first)
+        pd.testing.assert_frame_equal(self.store.get('customers'), first)
+
+
+class PredictionCacheTests(SimpleTestCase):
+    """Entries expire after the time to live and are bounded in number."""
+
+    def test_entries_expire(self):
+        cache = PredictionCache(max_size=10, ttl=60)
+        with mock.patch('ml_api.services.prediction_cache.time.monotonic', return_value=1000.0):
+            cache.put('key', 1.5)
+        with mock.patch('ml_api.services.prediction_cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('key'), 1.5)
+        with mock.patch('ml_api.services.prediction_cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get('key'))
+
+        stats = cache.stats()
+        self.assertEqual((stats['size'], stats['hits'], stats['misses']), (0, 1, 1))
+
+    def test_zero_ttl_never_expires(self):
+        cache = PredictionCache(max_size=10, ttl=0)
+        with mock.patch('ml_api.services.prediction_cache.time.monotonic', return_value=0.0):
+            cache.put('key', 1.5)
+        with mock.patch('ml_api.services.prediction_cache.time.monotonic', return_value=10.0 ** 9):
+            self.assertEqual(cache.get('key'), 1.5)
+
+    def test_size_limits(self):
+        cache = PredictionCache(max_size=2, ttl=0)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        disabled = PredictionCache(max_size=0)
+        disabled.put('a', 1)
+        self.assertIsNone(disabled.get('a'))
+
+
+class CoalescingErrorTests(SimpleTestCase):
+    """SingleFlight and MicroBatcher hand a failure to every caller that shared it."""
+
+    def run_callers(self, n, call):
+        errors = []
+
+        def caller():
+            try:
+                call()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=caller) for _ in range(n)]
+        for thread in threads:
+            thread.start()
+        return threads, errors
+
+    def test_single_flight_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        error = ValueError('boom')
+
+        def compute():
+            release.wait(5)
+            raise error
+
+        threads, errors = self.run_callers(4, lambda: flight.do('key', compute))
+        # Release once the three followers joined the leader's call
+        deadline = time.monotonic() + 5
+        while flight._calls.get('key') is None or flight._calls['key'].waiters < 3:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [error] * 4)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+        # The failure is not kept: the next call computes again
+        self.assertEqual(flight.do('key', lambda: 42), 42)
+
+    def test_micro_batch_error_reaches_every_item(self):
+        calls = []
+
+        def evaluate(items):
+            calls.append(list(items))
+            if len(calls) == 1:
+                raise RuntimeError('model failed')
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(evaluate, max_batch=3, max_wait=5)
+        threads, errors = self.run_callers(3, lambda: batcher.submit(1))
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([str(e) for e in errors], ['model failed'] * 3)
+        # The next batch is unaffected
+        results = []
+        threads, errors = self.run_callers(3, lambda: results.append(batcher.submit(2)))
+        for thread in threads:
+            thread.join()
+        self.assertEqual((errors, results), ([], [4, 4, 4]))
+
+
+class IncrementalRetrainPolicyTests(SimpleTestCase):
+    """rebuild_reason picks an incremental update only when it is safe."""
+
+    def setUp(self):
+        self.names = ProjectDataGenerator().get_feature_names()
+        self.data = ProjectDataGenerator(seed=3).generate(300)
+        self.trained = self.data.iloc[:200]
+        X, y = training_data('rf_project_cost', self.trained, self.names)
+        self.model = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y)
+        # A holdout MAE far above any error on the new rows: no drift
+        self.metrics = {
+            'training_rows': 200,
+            'data_fingerprint': data_fingerprint('rf_project_cost', self.trained, self.names),
+            'mae': 10.0 ** 12,
+        }
+        self.policy = IncrementalRetrainPolicy(max_rounds=3, max_new_fraction=0.4, drift_threshold=1.5)
+
+    def reason(self, data, metrics=None, name='rf_project_cost', model=None, engine=None):
+        return self.policy.rebuild_reason(
+            name, model or self.model, self.metrics if metrics is None else metrics,
+            data, self.names, engine
+        )
+
+    def test_appended_rows_are_updated(self):
+        self.assertIsNone(self.reason(self.data.iloc[:250]))
+        self.assertIsNone(self.reason(self.trained))
+
+    def test_rebuild_reasons(self):
+        edited = self.data.iloc[:250].copy()
+        edited.loc[0, 'area_m2'] += 1
+        self.assertEqual(self.policy.rebuild_reason('rf_project_cost', None, self.metrics, self.data, self.names),
+                         'no trained model')
+        self.assertEqual(self.reason(edited), 'training rows changed')
+        self.assertEqual(self.reason(self.data.iloc[:150]), 'training rows changed')
+        self.assertEqual(self.reason(self.data.iloc[:250], {**self.metrics, 'incremental': {'rounds': 3}}),
+                         '3 incremental rounds')
+        self.assertEqual(self.reason(self.data), '100 new rows')
+        self.assertEqual(self.reason(self.data.iloc[:250], {**self.metrics, 'mae': 1.0}), 'drift on new rows')
+
+    def test_duration_engines(self):
+        metrics = {**self.metrics, 'mae_days': 10.0 ** 12}
+        self.assertEqual(
+            self.reason(self.data.iloc[:250], metrics, 'gb_project_duration', engine='hist_gradient_boosting'),
+            'engine changed to hist_gradient_boosting',
+        )
+        self.assertEqual(
+            self.reason(self.data.iloc[:250], {**metrics, 'engine': 'hist_gradient_boosting'}, 'gb_project_duration'),
+            'hist_gradient_boosting is not warm-started',
+        )
+
+
+class HyperparameterSearchTests(SimpleTestCase):
+    """A failing candidate or an exhausted budget never aborts the search."""
+
+    def setUp(self):
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, True)
+
+    def search(self, **kwargs) -> HyperparameterSearch:
+        return HyperparameterSearch(
+            self.cache_dir, n_candidates=2, n_folds=2, halving_factor=1, max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'), **kwargs
+        )
+
+    def test_failing_candidate_is_dropped(self):
+        employees = (EmployeeDataGenerator(seed=1).generate(200), EmployeeDataGenerator().get_feature_names())
+        # The only sampled candidate cannot be fitted
+        with mock.patch.dict(SEARCH_SPACES, {'lr_turnover': {'logistic_regression': {'C': [-1.0]}}}):
+            result = self.search(budget_seconds=120).run({'lr_turnover': employees})['lr_turnover']
+
+        self.assertEqual(result['params'], {})
+        self.assertEqual(result['failed'], 1)
+        self.assertTrue(result['complete'])
+        self.assertEqual(len(result['cv']['auc_roc']['folds']), 2)
+
+    def test_budget_stops_running_folds(self):
+        projects = (ProjectDataGenerator(seed=1).generate(300), ProjectDataGenerator().get_feature_names())
+        # A candidate far slower than the budget
+        with mock.patch.dict(SEARCH_SPACES, {'rf_project_cost': {'random_forest': {'n_estimators': [20000]}}}):
+            start = time.monotonic()
+            result = self.search(budget_seconds=3).run({'rf_project_cost': projects})['rf_project_cost']
+
+        self.assertLess(time.monotonic() - start, 20)
+        if result is not None:
+            self.assertFalse(result['complete'])
+
+
+class ModelRegistryPruneTests(SimpleTestCase):
+    """Pruning never deletes a version another worker may still be loading from."""
+
+    def setUp(self):
+        self.models_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.models_dir, True)
+        self.registry = ModelRegistry(self.models_dir, keep=0, grace=60)
+
+    def publish_copy(self) -> str:
+        version = self.registry.create_version()
+        for artifact in Path(settings.BASE_DIR, 'trained_models').glob('*.joblib'):
+            shutil.copy2(artifact, self.registry.path(version))
+        self.registry.publish(version)
+        return version
+
+    def age(self, version: str, seconds: float):
+        past = time.time() - seconds
+        os.utime(self.registry.path(version), (past, past))
+
+    def test_recently_active_version_is_kept(self):
+        first = self.publish_copy()
+        self.publish_copy()
+        self.publish_copy()
+
+        self.assertTrue(self.registry.path(first).exists())
+
+    def test_version_is_deleted_after_the_grace_period(self):
+        first = self.publish_copy()
+        second = self.publish_copy()
+        self.age(first, 120)
+        self.publish_copy()
+
+        self.assertFalse(self.registry.path(first).exists())
+        self.assertTrue(self.registry.path(second).exists())
+
+    def test_grace_period_counts_from_the_last_activation(self):
+        first = self.publish_copy()
+        self.age(first, 120)
+        self.publish_copy()
+        self.assertTrue(self.registry.path(first).exists())
+
+        # Publishing the next version refreshes the one it replaces
+        self.publish_copy()
+        self.assertTrue(self.registry.path(first).exists())
+
+
+class ConcurrentVersionSwapTests(SimpleTestCase):
+    """Predictions keep succeeding while model versions are swapped under them."""
+
+    PROJECT = {
+        'project_type_id': 2, 'area_m2': 2500, 'num_floors': 3, 'location_zone': 2,
+        'complexity_score': 5, 'material_quality': 2, 'has_basement': True, 'has_pool': False,
+        'season_start': 1, 'team_size': 12, 'manager_experience_years': 5,
+    }
+
+    def setUp(self):
+        trainer = MLTrainer()
+        trainer.wait_for_bootstrap()
+        self.saved = {
+            name: getattr(MLTrainer, name)
+            for name in ('_registry', '_model_store', '_prediction_cache')
+        }
+        self.addCleanup(self.restore)
+
+        # Two versions holding copies of the shipped models
+        self.models_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.models_dir, True)
+        registry = ModelRegistry(self.models_dir, keep=10)
+        for _ in range(2):
+            version = registry.create_version()
+            for artifact in Path(settings.BASE_DIR, 'trained_models').glob('*.joblib'):
+                shutil.copy2(artifact, registry.path(version))
+            registry.publish(version)
+
+        MLTrainer._registry = registry
+        MLTrainer._model_store = registry.open()
+        # Every request must reach the models, not the cache
+        MLTrainer._prediction_cache = PredictionCache(max_size=0)
+
+    def restore(self):
+        with MLTrainer._swap_lock:
+            for name, value in self.saved.items():
+                setattr(MLTrainer, name, value)
+
+    def test_predictions_during_rollbacks(self):
+        trainer = MLTrainer()
+        stores = [MLTrainer._model_store]
+        errors = []
+        versions = set()
+        done = threading.Event()
+        # Rollbacks start once every worker is predicting
+        started = threading.Barrier(5)
+
+        def predict(worker: int):
+            started.wait()
+            i = 0
+            while not done.is_set() or i < 50:
+                project = {**self.PROJECT, 'area_m2': 1000 + worker * 1000 + i}
+                try:
+                    trainer.predict_project_cost(project)
+                    trainer.predict_project_cost_batch([project] * 100)
+                    trainer.predict_project_duration(project)
+                    versions.add(trainer.model_version())
+                except Exception as e:
+                    errors.append(repr(e))
+                i += 1
+
+        threads = [threading.Thread(target=predict, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        try:
+            for _ in range(20):
+                trainer.rollback_models()
+                stores.append(MLTrainer._model_store)
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(versions), 2)
+        for store in stores:
+            self.assertTrue(store.wait_idle(timeout=5))
+            self.assertEqual(store.in_flight(), {})
@@ -13,6 +13,7 @@ urlpatterns = [
 
     # Predictions
     path('predict/project-cost/', views.predict_project_cost, name='predict_project_cost'),
+    path('predict/project-cost/batch/', views.predict_project_cost_batch, name='predict_project_cost_batch'),
     path('predict/project-duration/', views.predict_project_duration, name='predict_project_duration'),
     path('predict/employee-turnover/', views.predict_employee_turnover, name='predict_employee_turnover'),
 
@@ -23,8 +24,16 @@ urlpatterns = [
 
     # Forecast
     path('forecast/inventory/', views.forecast_inventory, name='forecast_inventory'),
+    path('forecast/inventory/batch/', views.forecast_inventory_batch, name='forecast_inventory_batch'),
 
     # Dataset management
     path('datasets/regenerate/', views.regenerate_datasets, name='regenerate_datasets'),
     path('datasets/retrain/', views.retrain_models, name='retrain_models'),
+
+    # Model versions
+    path('models/versions/', views.model_versions, name='model_versions'),
+    path('models/rollback/', views.rollback_models, name='rollback_models'),
+
+    # Background jobs
+    path('jobs/<str:job_id>/', views.job_status, name='job_status'),
 ]
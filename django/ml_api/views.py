@@ -2,10 +2,13 @@
 ML API Views - REST endpoints for ML predictions and analytics.
 """
 from datetime import datetime
+from django.conf import settings
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 
+from ml_api.services.feature_schema import SchemaError
+from ml_api.services.jobs import JobConflict
 from ml_api.services.ml_trainer import MLTrainer
 from ml_api.services.chart_formatter import ChartFormatter
 from ml_api.datasets.generators import (
@@ -15,29 +18,87 @@ from ml_api.datasets.generators import (
 
 
 def get_trainer():
-    """Get or create ML trainer instance."""
+    """Get the ML trainer instance; models load in the background."""
     trainer = MLTrainer()
-    if not trainer._initialized:
-        trainer.initialize_models()
+    trainer.start_bootstrap()
     return trainer
 
 
+def not_ready_response(trainer, *names):
+    """Return a 503 response if any required model is not ready yet, else None."""
+    states = {name: trainer.model_state(name) for name in names}
+    if all(state == 'ready' for state in states.values()):
+        return None
+
+    body = {
+        'success': False,
+        'error': 'Modelo no disponible todavia, intente de nuevo en unos segundos',
+        'model_states': states,
+    }
+    errors = {name: trainer.model_error(name) for name in names if trainer.model_error(name)}
+    if errors:
+        body['model_errors'] = errors
+
+    return Response(
+        body, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(settings.ML_BOOTSTRAP_RETRY_AFTER)}
+    )
+
+
+def schema_error_response(error: SchemaError):
+    """Return a 400 response for a payload rejected by a feature schema."""
+    body = {'success': False, 'error': str(error)}
+    if error.errors:
+        body['errors'] = error.errors
+    return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+
+def parse_forecast_days(value) -> int:
+    """
+    Return a requested forecast horizon as an int.
+
+    Raises:
+        SchemaError: If it is not a whole number of days between
+            ML_FORECAST_MIN_DAYS and ML_FORECAST_MAX_DAYS.
+    """
+    min_days, max_days = settings.ML_FORECAST_MIN_DAYS, settings.ML_FORECAST_MAX_DAYS
+    try:
+        forecast_days = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise SchemaError('Valor invalido: forecast_days', field='forecast_days')
+    if not min_days <= forecast_days <= max_days:
+        raise SchemaError(
+            f'forecast_days debe estar entre {min_days} y {max_days}', field='forecast_days'
+        )
+    return forecast_days
+
+
 @api_view(['GET'])
 def health_check(request):
-    """Health check endpoint."""
+    """Health check endpoint. Never waits for models to load."""
     trainer = get_trainer()
+    states = trainer.model_states()
+    if all(state == 'ready' for state in states.values()):
+        service_status = 'operational'
+    elif 'failed' in states.values():
+        service_status = 'degraded'
+    else:
+        service_status = 'starting'
+
     return Response({
         'success': True,
         'service': 'Django ML Server',
         'version': '1.0.0',
-        'status': 'operational',
+        'status': service_status,
         'models_loaded': {
-            'project_cost': 'rf_project_cost' in trainer._models,
-            'project_duration': 'gb_project_duration' in trainer._models,
-            'customer_segmentation': 'kmeans_customers' in trainer._models,
-            'employee_turnover': 'lr_turnover' in trainer._models,
-            'inventory_forecast': True,  # ARIMA is dynamic
+            'project_cost': states['rf_project_cost'] == 'ready',
+            'project_duration': states['gb_project_duration'] == 'ready',
+            'customer_segmentation': states['kmeans_customers'] == 'ready',
+            'employee_turnover': states['lr_turnover'] == 'ready',
+            'inventory_forecast': states['datasets'] == 'ready',  # ARIMA is dynamic
         },
+        'model_states': states,
+        'model_version': trainer.model_version(),
         'timestamp': datetime.now().isoformat(),
     })
 
@@ -71,22 +132,12 @@ def predict_project_cost(request):
     """Predict project cost using Random Forest."""
     try:
         trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'rf_project_cost')
+        if unavailable:
+            return unavailable
         data = request.data
 
-        # Validate required fields
-        required_fields = [
-            'project_type_id', 'area_m2', 'num_floors', 'location_zone',
-            'complexity_score', 'material_quality', 'has_basement', 'has_pool',
-            'season_start', 'team_size', 'manager_experience_years'
-        ]
-        for field in required_fields:
-            if field not in data:
-                return Response({
-                    'success': False,
-                    'error': f'Campo requerido: {field}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Get prediction
+        # Get prediction (the model's feature schema validates the fields)
         prediction = trainer.predict_project_cost(data)
 
         # Get feature labels
@@ -111,6 +162,8 @@ def predict_project_cost(request):
             'model_info': prediction['model_info'],
             'chart_data': chart_data,
         })
+    except SchemaError as e:
+        return schema_error_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -119,42 +172,72 @@ def predict_project_cost(request):
 
 
 @api_view(['POST'])
-def predict_project_duration(request):
-    """Predict project duration using Gradient Boosting."""
+def predict_project_cost_batch(request):
+    """Predict project cost for a batch of projects using Random Forest."""
     try:
         trainer = get_trainer()
-        data = dict(request.data)
+        unavailable = not_ready_response(trainer, 'rf_project_cost')
+        if unavailable:
+            return unavailable
+        if not isinstance(request.data, dict):
+            return Response({
+                'success': False,
+                'error': 'El cuerpo debe ser un objeto JSON'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        projects = request.data.get('projects')
+
+        # Validate the batch as a whole before scoring anything
+        if not isinstance(projects, list) or len(projects) == 0:
+            return Response({
+                'success': False,
+                'error': 'Campo requerido: projects (lista no vacia)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = settings.ML_BATCH_MAX_ROWS
+        if len(projects) > max_rows:
+            return Response({
+                'success': False,
+                'error': f'Maximo {max_rows} proyectos por solicitud'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Validate and score the whole batch in one pass; any invalid row rejects it
+        predictions = trainer.predict_project_cost_batch(projects)
 
-        # Validate required fields
-        required_fields = [
-            'project_type_id', 'area_m2', 'num_floors', 'complexity_score',
-            'team_size', 'manager_experience_years', 'season_start'
-        ]
+        return Response({
+            'success': True,
+            'count': len(predictions),
+            'predictions': [
+                {
+                    'index': index,
+                    'predicted_cost': prediction['predicted_cost'],
+                    'confidence_interval': prediction['confidence_interval'],
+                    'confidence_level': prediction['confidence_level'],
+                }
+                for index, prediction in enumerate(predictions)
+            ],
+            'model_info': predictions[0]['model_info'],
+        })
+    except SchemaError as e:
+        return schema_error_response(e)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        for field in required_fields:
-            if field not in data:
-                return Response({
-                    'success': False,
-                    'error': f'Campo requerido: {field}'
-                }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Add defaults for optional fields and convert types
-        features = {
-            'project_type_id': int(data.get('project_type_id', 2)),
-            'area_m2': float(data.get('area_m2', 2500)),
-            'num_floors': int(data.get('num_floors', 3)),
-            'location_zone': int(data.get('location_zone', 2)),
-            'complexity_score': float(data.get('complexity_score', 5)),
-            'material_quality': int(data.get('material_quality', 2)),
-            'has_basement': bool(data.get('has_basement', False)),
-            'has_pool': bool(data.get('has_pool', False)),
-            'season_start': int(data.get('season_start', 1)),
-            'team_size': int(data.get('team_size', 12)),
-            'manager_experience_years': float(data.get('manager_experience_years', 5)),
-        }
+@api_view(['POST'])
+def predict_project_duration(request):
+    """Predict project duration using Gradient Boosting."""
+    try:
+        trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'gb_project_duration')
+        if unavailable:
+            return unavailable
+        data = request.data
 
-        # Get prediction
-        prediction = trainer.predict_project_duration(features)
+        # Get prediction (the schema applies defaults for optional fields and converts types)
+        prediction = trainer.predict_project_duration(data)
 
         # Calculate estimated end date
         from datetime import datetime, timedelta
@@ -191,6 +274,8 @@ def predict_project_duration(request):
             'model_info': prediction['model_info'],
             'chart_data': chart_data,
         })
+    except SchemaError as e:
+        return schema_error_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -203,6 +288,9 @@ def analyze_customer_segments(request):
     """Analyze customer segments using K-Means clustering."""
     try:
         trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'kmeans_customers', 'datasets')
+        if unavailable:
+            return unavailable
         analysis = trainer.get_customer_segments()
 
         # Get segment info
@@ -288,23 +376,12 @@ def predict_employee_turnover(request):
     """Predict employee turnover probability using Logistic Regression."""
     try:
         trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'lr_turnover')
+        if unavailable:
+            return unavailable
         data = request.data
 
-        # Validate required fields
-        required_fields = [
-            'tenure_months', 'age', 'salary_level', 'department',
-            'performance_score', 'overtime_hours_monthly', 'distance_from_home_km',
-            'num_promotions', 'training_hours_yearly', 'satisfaction_score',
-            'num_projects_assigned'
-        ]
-        for field in required_fields:
-            if field not in data:
-                return Response({
-                    'success': False,
-                    'error': f'Campo requerido: {field}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Get prediction
+        # Get prediction (the model's feature schema validates the fields)
         prediction = trainer.predict_employee_turnover(data)
 
         # Get feature labels
@@ -343,6 +420,8 @@ def predict_employee_turnover(request):
             'model_info': prediction['model_info'],
             'chart_data': chart_data,
         })
+    except SchemaError as e:
+        return schema_error_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -355,6 +434,9 @@ def analyze_turnover_overview(request):
     """Get overview of turnover predictions for all employees."""
     try:
         trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'lr_turnover', 'datasets')
+        if unavailable:
+            return unavailable
         overview = trainer.get_turnover_overview()
 
         # Format chart data
@@ -397,6 +479,9 @@ def forecast_inventory(request):
     """Forecast inventory demand using ARIMA."""
     try:
         trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'datasets')
+        if unavailable:
+            return unavailable
         data = request.data
 
         # Validate required fields
@@ -414,7 +499,7 @@ def forecast_inventory(request):
         # Get forecast
         forecast = trainer.forecast_inventory(
             material_id=int(data['material_id']),
-            forecast_days=int(data['forecast_days']),
+            forecast_days=parse_forecast_days(data['forecast_days']),
             current_stock=float(data['current_stock']),
             reorder_point=float(data['reorder_point']),
             lead_time_days=int(data['lead_time_days']),
@@ -481,6 +566,90 @@ def forecast_inventory(request):
             'daily_forecast': forecast['daily_forecast'][:14],  # First 2 weeks
             'chart_data': chart_data,
         })
+    except SchemaError as e:
+        return schema_error_response(e)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def forecast_inventory_batch(request):
+    """Forecast inventory demand for several materials (or all) at once."""
+    try:
+        trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'datasets')
+        if unavailable:
+            return unavailable
+        data = request.data
+        if not isinstance(data, dict):
+            return Response({
+                'success': False,
+                'error': 'El cuerpo debe ser un objeto JSON'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        materials = data.get('materials')
+        if materials is None:
+            return Response({
+                'success': False,
+                'error': 'Campo requerido: materials'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        forecast_days = parse_forecast_days(data.get('forecast_days', 30))
+
+        max_materials = settings.ML_FORECAST_BATCH_MAX_MATERIALS
+        if isinstance(materials, list) and len(materials) > max_materials:
+            return Response({
+                'success': False,
+                'error': f'Maximo {max_materials} materiales por solicitud'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # "all" forecasts every material present in the inventory history
+        if materials == 'all':
+            requests = [
+                {'material_id': material_id}
+                for material_id in trainer.get_inventory_material_ids()
+            ]
+        elif isinstance(materials, list) and len(materials) > 0:
+            # A material listed twice is forecast once, with its first entry
+            requests = {}
+            for item in materials:
+                item = item if isinstance(item, dict) else {'material_id': item}
+                try:
+                    material_id = int(item['material_id'])
+                except (KeyError, TypeError, ValueError, OverflowError):
+                    return Response({
+                        'success': False,
+                        'error': f'Material invalido: {item}'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                requests.setdefault(material_id, {**item, 'material_id': material_id})
+            requests = list(requests.values())
+        else:
+            return Response({
+                'success': False,
+                'error': 'materials debe ser "all" o una lista no vacia'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        batch = trainer.forecast_inventory_batch(requests, forecast_days)
+
+        return Response({
+            'success': True,
+            'requested': len(requests),
+            'succeeded': len(batch['results']),
+            'failed': len(batch['errors']),
+            'results': [
+                {
+                    **forecast,
+                    'daily_forecast': forecast['daily_forecast'][:14],  # First 2 weeks
+                }
+                for forecast in batch['results']
+            ],
+            'errors': batch['errors'],
+        })
+    except SchemaError as e:
+        return schema_error_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -493,6 +662,9 @@ def analyze_inventory_overview(request):
     """Get inventory overview with alerts."""
     try:
         trainer = get_trainer()
+        unavailable = not_ready_response(trainer, 'datasets')
+        if unavailable:
+            return unavailable
         overview = trainer.get_inventory_overview()
 
         return Response({
@@ -510,23 +682,25 @@ def analyze_inventory_overview(request):
 def regenerate_datasets(request):
     """Regenerate all datasets."""
     try:
-        from django.conf import settings
-
         gen_project = ProjectDataGenerator(seed=42)
         gen_customer = CustomerDataGenerator(seed=42)
         gen_employee = EmployeeDataGenerator(seed=42)
         gen_inventory = InventoryDataGenerator(seed=42)
 
-        datasets_dir = settings.ML_DATASETS_DIR
-
-        gen_project.generate(500).to_csv(datasets_dir / 'projects.csv', index=False)
-        gen_customer.generate(300).to_csv(datasets_dir / 'customers.csv', index=False)
-        gen_employee.generate(400).to_csv(datasets_dir / 'employees.csv', index=False)
-        gen_inventory.generate(730).to_csv(datasets_dir / 'inventory_history.csv', index=False)
+        datasets = {
+            'projects': gen_project.generate(500),
+            'customers': gen_customer.generate(300),
+            'employees': gen_employee.generate(400),
+            'inventory_history': gen_inventory.generate(730),
+        }
+        # Files whose content did not change are left untouched
+        changed = MLTrainer().save_datasets(datasets)
 
         return Response({
             'success': True,
-            'message': 'Datasets regenerated successfully'
+            'message': 'Datasets regenerated successfully',
+            'changed': changed,
+            'unchanged': [name for name in datasets if name not in changed],
         })
     except Exception as e:
         return Response({
@@ -537,17 +711,103 @@ def regenerate_datasets(request):
 
 @api_view(['POST'])
 def retrain_models(request):
-    """Retrain all ML models."""
+    """Start retraining all ML models in the background (full or incremental)."""
+    if not isinstance(request.data, dict):
+        return Response({
+            'success': False,
+            'error': 'El cuerpo debe ser un objeto JSON'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    mode = request.data.get('mode', 'full')
+    if mode not in MLTrainer.RETRAIN_MODES:
+        return Response({
+            'success': False,
+            'error': f'Modo de reentrenamiento invalido: {mode}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         trainer = get_trainer()
-        result = trainer.retrain_all()
+        job, created = trainer.start_retrain_job(mode)
+
+        return Response({
+            'success': True,
+            'message': 'Retrain started' if created else 'Retrain already in progress',
+            'job_id': job.id,
+            'job': job.to_dict(),
+        }, status=status.HTTP_202_ACCEPTED)
+    except JobConflict as e:
+        return Response({
+            'success': False,
+            'error': f"Ya hay un reentrenamiento en curso en modo {e.job.params.get('mode')}",
+            'job_id': e.job.id,
+        }, status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def job_status(request, job_id):
+    """Get status, per-stage progress and result of a background job."""
+    job = get_trainer().get_job(job_id)
+    if job is None:
+        return Response({
+            'success': False,
+            'error': f'Trabajo no encontrado: {job_id}'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'job': job.to_dict(),
+    })
 
+
+@api_view(['GET'])
+def model_versions(request):
+    """List the stored model versions and which one is active."""
+    try:
+        trainer = get_trainer()
         return Response({
             'success': True,
-            'message': result['message']
+            'active_version': trainer.model_version(),
+            'versions': trainer.model_versions(),
         })
     except Exception as e:
         return Response({
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def rollback_models(request):
+    """Serve an older model version again (the previous one by default)."""
+    if not isinstance(request.data, dict):
+        return Response({
+            'success': False,
+            'error': 'El cuerpo debe ser un objeto JSON'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    version = request.data.get('version')
+    try:
+        trainer = get_trainer()
+        version = trainer.rollback_models(version)
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': f'Version de modelos no disponible: {version}' if version
+                     else 'No hay una version anterior de modelos'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'success': True,
+        'message': f'Rolled back to model version {version}',
+        'active_version': version,
+    })